@@ -3,17 +3,26 @@
  * 
  * - Optimistic UI updates
  * - Throttled telemetry
- * - Batched state updates
+ * - Batched state updates: messages are buffered per device and applied
+ *   once per animation frame, in a single setDevices call
+ * - Routing table from config.js (topic -> device, field, parser), so a message
+ *   only touches its own device; wildcard subscriptions (pi/+/state/json, ...)
+ * - Dev overlay (npm run dev, or ?perf in the URL): messages, updates and renders per second
  */
 
 import React, { useState, useEffect, useRef, useCallback } from 'react';
 import { createRoot } from 'react-dom/client';
-import { INITIAL_DEVICES, DEVICE_TYPES, ROOMS } from './config.js';
+import { INITIAL_DEVICES, DEVICE_TYPES, ROOMS, getRoutingTable } from './config.js';
 import { connectToMQTT, subscribeToTopics, publishCommand, onMessage, disconnect } from './mqtt-handler.js';
-import { getSubscribeTopicsForDevices, applyMqttMessageToDevice, getToggleCommand, getUpdateCommand } from './device-mqtt.js';
+import { getSubscribeTopicsForDevices, applyRoute, getToggleCommand, getUpdateCommand, isDeviceAvailable } from './device-mqtt.js';
+import { countMessage, countFlush } from './perf-stats.js';
 import Header from './components/Header.jsx';
 import DeviceCard from './components/DeviceCard.jsx';
 import DeviceModal from './components/DeviceModal.jsx';
+import DevOverlay from './components/DevOverlay.jsx';
+
+const SHOW_PERF_OVERLAY = import.meta.env.DEV || new URLSearchParams(window.location.search).has('perf');
+
 
 function App() {
   const [devices, setDevices] = useState(INITIAL_DEVICES);
@@ -22,13 +31,37 @@ function App() {
 
 
   const devicesRef = useRef(devices);
-  const updateBufferRef = useRef(new Map());
+  // device id -> Map(topic -> [route, latest message]) received since the last frame
+  const pendingRef = useRef(new Map());
   const rafRef = useRef(null);
 
   useEffect(() => {
     devicesRef.current = devices;
   }, [devices]);
 
+  const flushMessages = useCallback(() => {
+    rafRef.current = null;
+    const pending = pendingRef.current;
+    if (pending.size === 0) return;
+    pendingRef.current = new Map();
+    countFlush();
+
+    setDevices(prev => {
+      let has_changes = false;
+      const next = prev.map(device => {
+        const messages = pending.get(device.id);
+        if (!messages) return device;
+        let updated = device;
+        messages.forEach(([route, message]) => {
+          updated = applyRoute(updated, route, message);
+        });
+        if (updated !== device) has_changes = true;
+        return updated;
+      });
+      return has_changes ? next : prev;
+    });
+  }, []);
+
   useEffect(() => {
     connectToMQTT(
       () => {
@@ -40,50 +73,40 @@ function App() {
     );
 
     onMessage((topic, message) => {
-      const currentDevices = devicesRef.current;
-
-      currentDevices.forEach(originalDevice => {
-        const baseDevice = updateBufferRef.current.get(originalDevice.id) || originalDevice;
-
-        const updated = applyMqttMessageToDevice(baseDevice, topic, message);
-        if (updated !== baseDevice) {
-          updateBufferRef.current.set(originalDevice.id, updated);
+      countMessage();
+      // Wildcard subscriptions also bring in devices this dashboard doesn't show
+      const routes = getRoutingTable(INITIAL_DEVICES).routes.get(topic);
+      if (!routes) return;
+
+      routes.forEach(route => {
+        let messages = pendingRef.current.get(route.device_id);
+        if (!messages) {
+          messages = new Map();
+          pendingRef.current.set(route.device_id, messages);
         }
+        // Only the latest value of a topic within a frame matters
+        messages.delete(topic);
+        messages.set(topic, [route, message]);
       });
-    });
-
-    return () => disconnect();
-  }, []);
 
-  useEffect(() => {
-    const loop = () => {
-      if (updateBufferRef.current.size > 0) {
-        setDevices(prev => {
-          const next = [...prev];
-          let hasChanges = false;
-
-          updateBufferRef.current.forEach((updatedDevice, id) => {
-            const index = next.findIndex(d => d.id === id);
-            if (index !== -1) {
-              next[index] = updatedDevice;
-              hasChanges = true;
-            }
-          });
-
-          updateBufferRef.current.clear();
-          return hasChanges ? next : prev;
-        });
+      if (rafRef.current === null) {
+        rafRef.current = requestAnimationFrame(flushMessages);
       }
-      rafRef.current = requestAnimationFrame(loop);
-    };
-
-    rafRef.current = requestAnimationFrame(loop);
-    return () => cancelAnimationFrame(rafRef.current);
-  }, []);
-
+    });
 
+    return () => {
+      if (rafRef.current !== null) cancelAnimationFrame(rafRef.current);
+      disconnect();
+    };
+  }, [flushMessages]);
 
   const toggleDevice = useCallback((device_id) => {
+    const current = devicesRef.current.find(d => d.id === device_id);
+    if (current && !isDeviceAvailable(current)) {
+      console.warn(`[Command] ${device_id} is offline, not sending`);
+      return;
+    }
+
     setDevices(prev => prev.map(d => {
       if (d.id === device_id) {
         return { ...d, is_active: !d.is_active };
@@ -101,6 +124,12 @@ function App() {
   }, []);
 
   const updateDevice = useCallback((device_id, updates) => {
+    const current = devicesRef.current.find(d => d.id === device_id);
+    if (current && !isDeviceAvailable(current) && !('name' in updates)) {
+      console.warn(`[Command] ${device_id} is offline, not sending`);
+      return;
+    }
+
     setDevices(prev => prev.map(d =>
       d.id === device_id ? { ...d, ...updates } : d
     ));
@@ -124,14 +153,15 @@ function App() {
     setEditingDeviceId(null);
   }
 
-  function deleteDevice(device_id) {
+  // Stable callbacks (taking the device id) let DeviceCard skip renders when its device is unchanged
+  const deleteDevice = useCallback((device_id) => {
     setDevices(prev => prev.filter(d => d.id !== device_id));
-  }
+  }, []);
 
-  function openRenameModal(device_id) {
+  const openRenameModal = useCallback((device_id) => {
     setEditingDeviceId(device_id);
     setModalOpen(true);
-  }
+  }, []);
 
   function refreshAll() {
     console.log('Refreshing all devices...');
@@ -152,10 +182,10 @@ function App() {
           <DeviceCard
             key={device.id}
             device={device}
-            on_toggle={() => toggleDevice(device.id)}
-            on_update={(updates) => updateDevice(device.id, updates)}
-            on_rename={() => openRenameModal(device.id)}
-            on_delete={() => deleteDevice(device.id)}
+            on_toggle={toggleDevice}
+            on_update={updateDevice}
+            on_rename={openRenameModal}
+            on_delete={deleteDevice}
           />
         ))}
       </div>
@@ -168,6 +198,8 @@ function App() {
           on_close={() => setModalOpen(false)}
         />
       )}
+
+      {SHOW_PERF_OVERLAY && <DevOverlay />}
     </div>
   );
 }
@@ -0,0 +1,35 @@
+/**
+ * DEV OVERLAY COMPONENT
+ * Messages, state updates and card renders per second, sampled once a second
+ */
+
+import React, { useState, useEffect, useRef } from 'react';
+import { perfStats } from '../perf-stats.js';
+
+export default function DevOverlay() {
+  const [rates, setRates] = useState({ messages: 0, flushes: 0, renders: 0 });
+  const last_ref = useRef({ ...perfStats, time: performance.now() });
+
+  useEffect(() => {
+    const timer = setInterval(() => {
+      const now = performance.now();
+      const last = last_ref.current;
+      const seconds = (now - last.time) / 1000;
+      setRates({
+        messages: (perfStats.messages - last.messages) / seconds,
+        flushes: (perfStats.flushes - last.flushes) / seconds,
+        renders: (perfStats.renders - last.renders) / seconds
+      });
+      last_ref.current = { ...perfStats, time: now };
+    }, 1000);
+    return () => clearInterval(timer);
+  }, []);
+
+  return (
+    <div className="fixed bottom-4 right-4 z-50 bg-black/80 border border-slate-700 rounded-xl px-4 py-3 font-mono text-xs text-slate-300 pointer-events-none">
+      <div>{rates.messages.toFixed(1)} msg/s</div>
+      <div>{rates.flushes.toFixed(1)} updates/s</div>
+      <div>{rates.renders.toFixed(1)} card renders/s</div>
+    </div>
+  );
+}
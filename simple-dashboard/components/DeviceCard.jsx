@@ -1,13 +1,18 @@
 /**
  * DEVICE CARD COMPONENT
- * Shows a single device with its controls
+ * Shows a single device with its controls.
+ * Memoised: the callbacks take the device id and are stable, so a card only
+ * re-renders when its own device object changes.
  */
 
-import React, { useState, useRef, useEffect } from 'react';
+import React, { memo, useState, useRef, useEffect } from 'react';
 import { Power, Lightbulb, MoreVertical, Trash2, Edit3 } from 'lucide-react';
 import { DEVICE_TYPES, LIGHT_COLORS } from '../config.js';
+import { isDeviceAvailable } from '../device-mqtt.js';
+import { countRender } from '../perf-stats.js';
 
-export default function DeviceCard({ device, on_toggle, on_update, on_rename, on_delete }) {
+function DeviceCard({ device, on_toggle, on_update, on_rename, on_delete }) {
+  countRender();
   const [menu_open, setMenuOpen] = useState(false);
   const menu_ref = useRef(null);
 
@@ -24,6 +29,7 @@ export default function DeviceCard({ device, on_toggle, on_update, on_rename, on
   const device_type = DEVICE_TYPES[device.type.toUpperCase()];
   const is_plug = device.type === 'plug';
   const is_light = device.type === 'light';
+  const is_available = isDeviceAvailable(device);
 
   // Sync local state with device prop changes (telemetry updates)
   // BUT ONLY when user is NOT actively interacting
@@ -54,14 +60,14 @@ export default function DeviceCard({ device, on_toggle, on_update, on_rename, on
   const commitBrightness = (value) => {
     const brightness = parseInt(value);
     console.log('[DeviceCard] Committing brightness:', brightness);
-    on_update({ brightness });
+    on_update(device.id, { brightness });
     setIsDraggingBrightness(false);  // Re-enable telemetry sync
   };
 
   // Commit color on blur
   const commitColor = (value) => {
     console.log('[DeviceCard] Committing color:', value);
-    on_update({ color: value });
+    on_update(device.id, { color: value });
     setIsSelectingColor(false);  // Re-enable telemetry sync
   };
 
@@ -69,7 +75,7 @@ export default function DeviceCard({ device, on_toggle, on_update, on_rename, on
   const commitColorTemp = (value) => {
     const temp = parseInt(value);
     console.log('[DeviceCard] Committing color temp:', temp);
-    on_update({ color_temp: temp });
+    on_update(device.id, { color_temp: temp });
     setIsDraggingColorTemp(false);  // Re-enable telemetry sync
   };
 
@@ -81,6 +87,9 @@ export default function DeviceCard({ device, on_toggle, on_update, on_rename, on
         <div className="flex items-center gap-3">
           <div className={`w-2.5 h-2.5 rounded-full ${device.is_active ? 'bg-green-500 animate-pulse shadow-[0_0_12px_rgba(34,197,94,0.8)]' : 'bg-red-500/40'}`} />
           <h3 className="text-slate-300 font-bold text-xs tracking-widest uppercase">{device.name}</h3>
+          {!is_available && (
+            <span className="text-[10px] font-bold tracking-widest text-red-400">OFFLINE</span>
+          )}
         </div>
 
         {/* Menu */}
@@ -95,13 +104,13 @@ export default function DeviceCard({ device, on_toggle, on_update, on_rename, on
           {menu_open && (
             <div className="absolute right-0 mt-2 w-32 bg-slate-800 border border-slate-700 rounded-xl shadow-2xl z-20 py-1">
               <button
-                onClick={() => { on_rename(); setMenuOpen(false); }}
+                onClick={() => { on_rename(device.id); setMenuOpen(false); }}
                 className="w-full flex items-center gap-2 px-3 py-2 text-xs font-bold text-slate-300 hover:bg-slate-700 hover:text-white"
               >
                 <Edit3 size={14} /> RENAME
               </button>
               <button
-                onClick={() => { on_delete(); setMenuOpen(false); }}
+                onClick={() => { on_delete(device.id); setMenuOpen(false); }}
                 className="w-full flex items-center gap-2 px-3 py-2 text-xs font-bold text-red-400 hover:bg-red-950/30"
               >
                 <Trash2 size={14} /> DELETE
@@ -160,6 +169,12 @@ export default function DeviceCard({ device, on_toggle, on_update, on_rename, on
             <span className="text-slate-500 text-xs font-bold tracking-widest">CURRENT</span>
             <span className="text-white font-bold text-sm">{device.telemetry.amps.toFixed(2)} A</span>
           </div>
+          {device.telemetry.kwh_today !== undefined && (
+            <div className="flex justify-between items-center">
+              <span className="text-slate-500 text-xs font-bold tracking-widest">TODAY</span>
+              <span className="text-white font-bold text-sm">{device.telemetry.kwh_today.toFixed(2)} kWh</span>
+            </div>
+          )}
         </div>
       )}
 
@@ -242,8 +257,9 @@ export default function DeviceCard({ device, on_toggle, on_update, on_rename, on
 
       {/* Power Button */}
       <button
-        onClick={on_toggle}
-        className={`w-full py-3 rounded-xl font-bold text-sm tracking-wider transition-all ${device.is_active
+        onClick={() => on_toggle(device.id)}
+        disabled={!is_available}
+        className={`w-full py-3 rounded-xl font-bold text-sm tracking-wider transition-all disabled:opacity-40 disabled:cursor-not-allowed ${device.is_active
           ? 'bg-blue-600 hover:bg-blue-700 text-white shadow-lg shadow-blue-500/50'
           : 'bg-slate-800/50 hover:bg-slate-700/50 text-slate-400 border border-slate-700'
           }`}
@@ -253,3 +269,5 @@ export default function DeviceCard({ device, on_toggle, on_update, on_rename, on
     </div>
   );
 }
+
+export default memo(DeviceCard);
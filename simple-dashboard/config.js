@@ -6,6 +6,7 @@
  * HOW TO ADD A NEW DEVICE:
  * 1. Add an entry to the INITIAL_DEVICES array.
  * 2. Define its specific MQTT topics in the 'mqtt.topics' object.
+ * 3. A topic key not listed in TOPIC_FIELDS is not subscribed to; add it there.
  */
 
 // =============================================================================
@@ -14,7 +15,17 @@
 
 export const MQTT_CONFIG = {
   broker_url: 'ws://localhost:9001',
-  reconnect_delay: 3000
+  reconnect_delay: 3000,
+  // Subscribe to the combined 'state_json' topic (one message per device update)
+  // instead of one topic per field. Turn off for backends that only publish per-field topics.
+  use_json_state: true,
+  // Retained "online"/"offline" from the Python gateway (its MQTT Last Will).
+  // While it is offline every device is shown as unavailable.
+  gateway_availability_topic: 'pi/gateway/availability',
+  // Subscribe with one wildcard per field (pi/+/state/json, ...) instead of one topic per device
+  wildcard_subscriptions: true,
+  // Log every received message to the console (slow with many devices publishing)
+  log_messages: false
 };
 
 
@@ -29,6 +40,9 @@ export const TOPIC_PATTERNS = {
     voltage: 'pi/plug/voltage',
     current: 'pi/plug/current',
     state: 'pi/plug/state',
+    energy_today: 'pi/plug/energy_today',
+    state_json: 'pi/plug/state/json',
+    availability: 'pi/plug/availability',
     name: 'pi/plug/name'
   },
   light: {
@@ -38,11 +52,52 @@ export const TOPIC_PATTERNS = {
     brightness_set: 'pi/light/brightness/set',
     color: 'pi/light/color',
     color_set: 'pi/light/color/set',
+    state_json: 'pi/light/state/json',
+    availability: 'pi/light/availability',
     name: 'pi/light/name'
   }
 };
 
 
+// =============================================================================
+// TOPIC FIELDS
+// =============================================================================
+// What an incoming message on each topic key sets on the device, and how the
+// payload is parsed. 'telemetry' fields live under device.telemetry.
+// state_json carries every field at once and is unpacked in device-mqtt.js.
+
+const isOn = (message) => message === 'ON';
+const isOnline = (message) => message === 'online';
+const asText = (message) => message;
+const asFloat = (message) => parseFloat(message);
+const asInt = (message) => parseInt(message);
+
+export const TOPIC_FIELDS = {
+  plug: {
+    state: { field: 'is_active', parse: isOn },
+    power: { field: 'watts', telemetry: true, parse: asFloat },
+    voltage: { field: 'volts', telemetry: true, parse: asFloat },
+    current: { field: 'amps', telemetry: true, parse: asFloat },
+    energy_today: { field: 'kwh_today', telemetry: true, parse: asFloat },
+    state_json: { field: 'state_json', parse: asText },
+    availability: { field: 'available', parse: isOnline },
+    name: { field: 'name', parse: asText }
+  },
+  light: {
+    state: { field: 'is_active', parse: isOn },
+    mode: { field: 'mode', parse: asText },
+    brightness: { field: 'brightness', parse: asInt },
+    color: { field: 'color', parse: asText },
+    color_temp: { field: 'color_temp', parse: asInt },
+    state_json: { field: 'state_json', parse: asText },
+    availability: { field: 'available', parse: isOnline },
+    name: { field: 'name', parse: asText }
+  }
+};
+
+const GATEWAY_FIELD = { field: 'gateway_online', parse: isOnline };
+
+
 // =============================================================================
 // DEVICE TYPE DEFINITIONS
 // =============================================================================
@@ -56,7 +111,7 @@ export const DEVICE_TYPES = {
     has_telemetry: true,
     has_color: false,
     has_brightness: false,
-    telemetry_default: { watts: 0, volts: 0, amps: 0 }
+    telemetry_default: { watts: 0, volts: 0, amps: 0, kwh_today: 0 }
   },
   LIGHT: {
     id: 'light',
@@ -97,7 +152,7 @@ export const INITIAL_DEVICES = [
     room: 'Living Room',
     type: 'plug',
     is_active: false,
-    telemetry: { watts: 0, volts: 0, amps: 0 },
+    telemetry: { watts: 0, volts: 0, amps: 0, kwh_today: 0 },
 
     // Explicit MQTT Topics
     mqtt: {
@@ -107,6 +162,9 @@ export const INITIAL_DEVICES = [
         voltage: 'pi/plug1/voltage',
         current: 'pi/plug1/current',
         state: 'pi/plug1/state',
+        energy_today: 'pi/plug1/energy_today',
+        state_json: 'pi/plug1/state/json',
+        availability: 'pi/plug1/availability',
         name: 'pi/plug1/name'
       }
     }
@@ -133,6 +191,8 @@ export const INITIAL_DEVICES = [
         color_set: 'pi/light1/set',
         color_temp: 'pi/light1/color_temp',
         color_temp_set: 'pi/light1/set',
+        state_json: 'pi/light1/state/json',
+        availability: 'pi/light1/availability',
         name: 'pi/light1/name'
       }
     }
@@ -162,20 +222,122 @@ export function resolveDeviceTopics(device) {
   return TOPIC_PATTERNS[type] || TOPIC_PATTERNS.plug;
 }
 
-export function getSubscribeTopicsForDevice(device) {
+export function getSubscribeKeysForDevice(device) {
   const topics = resolveDeviceTopics(device);
-  const list = [];
 
   if (!topics) return [];
 
-  Object.keys(topics).forEach(key => {
-    // Skip command (publish only) keys
-    if (key !== 'command' && !key.endsWith('_set')) {
-      list.push(topics[key]);
-    }
+  // Combined state carries every field, so only name and availability are needed besides it
+  if (MQTT_CONFIG.use_json_state && topics.state_json) {
+    return ['state_json', 'name', 'availability'].filter(key => topics[key]);
+  }
+
+  // Skip command (publish only) keys
+  return Object.keys(topics).filter(key =>
+    key !== 'state_json' && key !== 'command' && !key.endsWith('_set'));
+}
+
+export function getSubscribeTopicsForDevice(device) {
+  const topics = resolveDeviceTopics(device);
+  return getSubscribeKeysForDevice(device).map(key => topics[key]);
+}
+
+/**
+ * Does an MQTT topic filter match a topic? Handles '+' and a trailing '#'.
+ */
+export function topicMatches(filter, topic) {
+  const filter_parts = filter.split('/');
+  const topic_parts = topic.split('/');
+
+  for (let i = 0; i < filter_parts.length; i++) {
+    if (filter_parts[i] === '#') return true;
+    if (i >= topic_parts.length) return false;
+    if (filter_parts[i] !== '+' && filter_parts[i] !== topic_parts[i]) return false;
+  }
+  return filter_parts.length === topic_parts.length;
+}
+
+/**
+ * Precomputed routing for every device's subscribed topics:
+ *
+ *   routes:        Map(topic -> [{ device_id, key, field, telemetry, parse }])
+ *   subscriptions: topic filters to subscribe to
+ *
+ * A message is routed with a single Map lookup. With wildcard_subscriptions,
+ * the device id segment of each topic is replaced by '+', so pi/+/state/json
+ * covers every device; topics that don't contain their device's id are
+ * subscribed as they are. Messages for devices not in the config arrive
+ * through the wildcards too and are ignored because no route matches them.
+ */
+export function buildRoutingTable(devices = INITIAL_DEVICES) {
+  const routes = new Map();
+  const filters = new Set();
+
+  const add = (topic, route) => {
+    if (!topic) return;
+    const list = routes.get(topic);
+    if (list) list.push(route);
+    else routes.set(topic, [route]);
+  };
+
+  devices.forEach(device => {
+    const topics = resolveDeviceTopics(device);
+    const fields = TOPIC_FIELDS[device.type] || TOPIC_FIELDS.plug;
+    if (!topics) return;
+
+    getSubscribeKeysForDevice(device).forEach(key => {
+      const topic = topics[key];
+      const field = fields[key];
+      if (!field) return;
+
+      add(topic, { device_id: device.id, key, ...field });
+
+      const parts = topic.split('/');
+      const id_index = parts.indexOf(device.id);
+      if (MQTT_CONFIG.wildcard_subscriptions && id_index !== -1) {
+        parts[id_index] = '+';
+        filters.add(parts.join('/'));
+      } else {
+        filters.add(topic);
+      }
+    });
+
+    add(MQTT_CONFIG.gateway_availability_topic, { device_id: device.id, key: 'gateway', ...GATEWAY_FIELD });
   });
 
-  return list;
+  // Exact topics a wildcard already covers (e.g. pi/gateway/availability under pi/+/availability) are dropped
+  const wildcards = [...filters].filter(filter => filter.includes('+') || filter.includes('#'));
+  const subscriptions = [...filters].filter(filter =>
+    wildcards.includes(filter) || !wildcards.some(wildcard => topicMatches(wildcard, filter)));
+
+  const gateway_topic = MQTT_CONFIG.gateway_availability_topic;
+  if (gateway_topic && !subscriptions.some(filter => topicMatches(filter, gateway_topic))) {
+    subscriptions.push(gateway_topic);
+  }
+
+  return { routes, subscriptions };
+}
+
+let routing_cache = { devices: null, use_json_state: null, wildcards: null, table: null };
+
+/**
+ * The routing table for a device list, rebuilt only when the list itself
+ * (or a setting that changes which topics are subscribed) is different.
+ */
+export function getRoutingTable(devices = INITIAL_DEVICES) {
+  const cache = routing_cache;
+  if (cache.table && cache.devices === devices && cache.use_json_state === MQTT_CONFIG.use_json_state &&
+      cache.wildcards === MQTT_CONFIG.wildcard_subscriptions) {
+    return cache.table;
+  }
+
+  routing_cache = {
+    devices,
+    use_json_state: MQTT_CONFIG.use_json_state,
+    wildcards: MQTT_CONFIG.wildcard_subscriptions,
+    table: buildRoutingTable(devices)
+  };
+  return routing_cache.table;
 }
 
 export function getPublishTopic(device, action = 'toggle') {
@@ -4,89 +4,85 @@
  * This file handles logic for device MQTT interactions.
  */
 
-import { resolveDeviceTopics, getSubscribeTopicsForDevice, getPublishTopic } from './config.js';
+import { TOPIC_FIELDS, getRoutingTable, getPublishTopic } from './config.js';
 
 /**
- * Get all subscribe topics for a list of devices.
+ * Get all subscribe topics (wildcard filters where possible) for a list of devices.
  */
 export function getSubscribeTopicsForDevices(devices) {
-    const topics = new Set();
-
     if (!devices || !Array.isArray(devices)) return [];
+    return getRoutingTable(devices).subscriptions;
+}
 
-    devices.forEach(device => {
-        const list = getSubscribeTopicsForDevice(device);
-        if (list && Array.isArray(list)) {
-            list.forEach(t => topics.add(t));
-        }
-    });
+/**
+ * A device can take commands unless it or the gateway bridging it was reported offline.
+ * Devices start out available, so backends that never publish availability keep working.
+ */
+export function isDeviceAvailable(device) {
+    return device.available !== false && device.gateway_online !== false;
+}
 
-    return Array.from(topics);
+/**
+ * Copy the device only if a field or telemetry reading actually changed;
+ * otherwise return it as is, so memoised cards skip the render.
+ */
+function mergeChanges(device, changes, telemetry) {
+    const fields = Object.keys(changes).filter(key => device[key] !== changes[key]);
+    const current = device.telemetry || {};
+    const readings = Object.keys(telemetry).filter(key => current[key] !== telemetry[key]);
+    if (fields.length === 0 && readings.length === 0) return device;
+
+    const updated_device = { ...device };
+    fields.forEach(key => { updated_device[key] = changes[key]; });
+    if (readings.length > 0) updated_device.telemetry = { ...current, ...telemetry };
+    return updated_device;
 }
 
 /**
- * Handle incoming MQTT message (update state).
+ * Apply a combined state/json payload (all fields of one device in one message).
  */
-export function applyMqttMessageToDevice(device, topic, message) {
-    const t = resolveDeviceTopics(device);
-    if (!t) return device;
-
-    let updated_device = { ...device };
-    let has_changes = false;
-
-    // -- PLUG LOGIC --
-    if (device.type === 'plug') {
-        if (topic === t.power) {
-            updated_device.telemetry = { ...updated_device.telemetry, watts: parseFloat(message) };
-            has_changes = true;
-        }
-        if (topic === t.voltage) {
-            updated_device.telemetry = { ...updated_device.telemetry, volts: parseFloat(message) };
-            has_changes = true;
-        }
-        if (topic === t.current) {
-            updated_device.telemetry = { ...updated_device.telemetry, amps: parseFloat(message) };
-            has_changes = true;
-        }
-        if (topic === t.state) {
-            updated_device.is_active = message === 'ON';
-            has_changes = true;
-        }
-        if (topic === t.name) {
-            updated_device.name = message;
-            has_changes = true;
-        }
+function applyJsonState(device, message) {
+    let state;
+    try {
+        state = JSON.parse(message);
+    } catch (e) {
+        console.error('[MQTT] Invalid state JSON:', message);
+        return device;
     }
 
-    // -- LIGHT LOGIC --
-    if (device.type === 'light') {
-        if (topic === t.state) {
-            updated_device.is_active = message === 'ON';
-            has_changes = true;
-        }
-        if (topic === t.mode) {
-            updated_device.mode = message;
-            has_changes = true;
-        }
-        if (topic === t.brightness) {
-            updated_device.brightness = parseInt(message);
-            has_changes = true;
-        }
-        if (topic === t.color) {
-            updated_device.color = message;
-            has_changes = true;
-        }
-        if (topic === t.color_temp) {
-            updated_device.color_temp = parseInt(message);
-            has_changes = true;
-        }
-        if (topic === t.name) {
-            updated_device.name = message;
-            has_changes = true;
-        }
-    }
+    // The JSON keys are the per-field topic keys (state, power, brightness, ...)
+    const fields = TOPIC_FIELDS[device.type] || TOPIC_FIELDS.plug;
+    const changes = {};
+    const telemetry = {};
+
+    Object.keys(state).forEach(key => {
+        const route = fields[key];
+        if (!route || key === 'state_json' || key === 'availability') return;
+        (route.telemetry ? telemetry : changes)[route.field] = route.parse(state[key]);
+    });
+
+    return mergeChanges(device, changes, telemetry);
+}
+
+/**
+ * Apply one routed message (a route from getRoutingTable) to its device.
+ * Returns the same device object when the message changes nothing.
+ */
+export function applyRoute(device, route, message) {
+    if (route.key === 'state_json') return applyJsonState(device, message);
 
-    return has_changes ? updated_device : device;
+    const value = route.parse(message);
+    if (route.telemetry) return mergeChanges(device, {}, { [route.field]: value });
+    return mergeChanges(device, { [route.field]: value }, {});
+}
+
+/**
+ * Handle incoming MQTT message (update state) for one device.
+ */
+export function applyMqttMessageToDevice(device, topic, message) {
+    const routes = getRoutingTable().routes.get(topic) || [];
+    const route = routes.find(r => r.device_id === device.id);
+    return route ? applyRoute(device, route, message) : device;
 }
 
 /**
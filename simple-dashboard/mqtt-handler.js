@@ -42,7 +42,7 @@ export function connectToMQTT(onConnect, onError) {
 
   client.on('message', (topic, payload) => {
     const message = payload.toString();
-    console.log('[MQTT] Received:', topic, '=', message);
+    if (MQTT_CONFIG.log_messages) console.log('[MQTT] Received:', topic, '=', message);
 
     if (messageCallback) {
       messageCallback(topic, message);
@@ -0,0 +1,25 @@
+/**
+ * PERF STATS
+ *
+ * Plain counters for the dev overlay: MQTT messages received, batched state
+ * updates applied and DeviceCard renders. Counting is a single increment,
+ * so it stays on in production; only the overlay that reads it is optional.
+ */
+
+export const perfStats = {
+  messages: 0,
+  flushes: 0,
+  renders: 0
+};
+
+export function countMessage() {
+  perfStats.messages++;
+}
+
+export function countFlush() {
+  perfStats.flushes++;
+}
+
+export function countRender() {
+  perfStats.renders++;
+}
@@ -1,54 +1,99 @@
-import json
-import time
+import logging
 import sys
 import os
-import tinytuya
+import time
 import paho.mqtt.client as mqtt
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-from utils.hsv import decode_hsv_hex, encode_hsv_hex, hsv_to_rgb_hex
-from utils.converters import brightness_percent_to_tuya, tuya_to_brightness_percent
+from utils.pool import DevicePool, is_error
+from utils.shadow import ShadowState
+from utils.commands import CommandQueue, WriteScheduler, coalesce_key
+from utils.listener import PushListener
+from utils.scheduler import PollScheduler
+from utils.publisher import TelemetryPublisher
+from utils.effects import EffectEngine, parse_effect
+from utils.registry import DeviceRegistry, DEVICES_FILE
+from utils.metrics import Metrics, METRICS_TOPIC
+from utils.logs import setup_logging, parse_levels, LOG_LEVEL
+from utils import lightHelpers
+
+log = logging.getLogger("light1_CLI")
 
 
 
 smart_light = None
 device_name = None
+# Topic key ("light1") and prefix ("pi/light1") of the device from devices.json; --device picks one
+device_key = None
+prefix = None
+registry = None
 light = None
 mqtt_client = None
+publisher = None
+metrics = Metrics()
+pool = DevicePool(metrics=metrics)
+commands = CommandQueue(max_workers=1, metrics=metrics)
+mqtt_seconds = metrics.histogram("mqtt_handler_seconds", "Time spent in on_mqtt_message").labels()
+mqtt_errors = metrics.counter("mqtt_handler_errors_total", "MQTT messages that raised").labels()
+writes = None
+shadow = None
+scheduler = PollScheduler()
+effects = None
 
 MQTT_BROKER_HOST = "127.0.0.1"
 MQTT_BROKER_PORT = 1883
 MQTT_KEEPALIVE = 60
 
-def live_mode():
-    print("Live mode - publishing every 2 seconds (Press Ctrl+C to stop)")
-    try:
-        while True:
-            dps = get_status()
-            if dps:
-                state = "ON" if dps.get("20", False) else "OFF"
-                mode = dps.get("21", "unknown")
+# Per-field topics (pi/<device>/state, /brightness, ...) and/or one combined pi/<device>/state/json
+PUBLISH_FIELD_TOPICS = True
+PUBLISH_JSON_STATE = True
 
-                if mode == 'colour':
-                    raw_color = dps.get("24", "000003e803e8")
-                    _, _, v = decode_hsv_hex(raw_color)
-                    brightness = tuya_to_brightness_percent(v)
-                else:
-                    brightness = tuya_to_brightness_percent(dps.get("22", 10))
+# Most device write frames per second; commands arriving faster are merged
+MAX_WRITE_RATE = 5
 
-                color_temp = dps.get("23", 0)
-                raw_color = dps.get("24", "")
-                color_hex = hsv_to_rgb_hex(raw_color)
+# Seconds the last known state can stand in for a status() read on the command path
+SHADOW_MAX_AGE = 10
 
-                mqtt_client.publish("pi/light1/state", state)
-                mqtt_client.publish("pi/light1/mode", mode)
-                mqtt_client.publish("pi/light1/brightness", str(brightness))
-                mqtt_client.publish("pi/light1/color_temp", str(color_temp))
-                mqtt_client.publish("pi/light1/color", color_hex)
-                print(f"{device_name} | {mode} | {brightness}% | Temp:{color_temp} | {color_hex} | {state}")
+def publish_fields(dps, force=False):
+    fields = lightHelpers.read_telemetry(dps)
+    sent = publisher.publish(prefix, fields, lightHelpers.format_telemetry(fields), force=force)
+    return fields, sent
 
-            time.sleep(2)
+def live_mode():
+    print("Live mode - adaptive polling, faster while values change (Press Ctrl+C to stop)")
+    scheduler.add(device_key)
+    try:
+        while True:
+            scheduler.wait(device_key)
+            dps = get_status()
+            if not dps:
+                scheduler.record(device_key, failed=True)
+            else:
+                f, changed = publish_fields(dps)
+                scheduler.record(device_key, changed=bool(changed))
+                log.info("%s | %s%% | Temp:%s | %s | %s", f["mode"], f["brightness"], f["color_temp"], f["color"], f["state"],
+                         extra={"device": device_key, "fields": f})
     except KeyboardInterrupt:
         print("\nLive mode stopped")
+        print(pool.summary())
+        print(f"Commands: {commands.stats()}")
+        print(f"Writes: {writes.stats()}")
+        print(f"Shadow: {shadow.stats()}")
+        print(f"Polling: {scheduler.stats()}")
+
+def on_device_update(key, dps):
+    shadow.update(key, dps)
+    fields, _ = publish_fields(dps)
+    log.info("pushed | %s", " | ".join(str(v) for v in fields.values()), extra={"device": device_key, "fields": fields})
+
+def listen_mode():
+    print("Listen mode - publishing on device updates (Press Ctrl+C to stop)")
+    listener = PushListener(pool, on_device_update)
+    listener.add(device_key)
+    try:
+        listener.run()
+    except KeyboardInterrupt:
+        print("\nListen mode stopped")
+        print(f"{listener.pushes} pushed updates, {listener.polls} fallback polls")
 
 def menu():
     print("\n" + device_name + " Management Hub")
@@ -60,135 +105,198 @@ def menu():
     print("5) Read Power state (on/off)")
     print("6) Turn switch On/Off")
     print("7) Read all (and publish)")
-    print("8) Live mode (publish every 2s)")
+    print("8) Live mode (adaptive polling)")
+    print("9) Play effect (fade/sunrise/breathe/cycle/stop)")
     print("Q) Quit")
 
+def arg_value(flag):
+    if flag in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return None
+
 def load_device():
+    global smart_light, device_name, device_key, prefix, registry
+    registry = DeviceRegistry(arg_value("--devices") or DEVICES_FILE)
+    ref = arg_value("--device")
+    entry = registry.find(ref) if ref else registry.first("light")
+    if entry is None or entry.kind != "light":
+        print(f"No light {ref or ''} in {registry.path} (give it \"type\": \"light\", or pick one with --device <id|name|ip|topic>)")
+        sys.exit(1)
+
+    device_key, prefix, device_name = entry.key, entry.prefix, entry.name
+    smart_light = pool.open(device_key, "light", entry.info)
+    registry.watch(on_registry_change)
+
+    if "--listen" not in sys.argv:
+        pool.start_keepalive()
+
+def on_registry_change(added, removed, reconnect, updated):
+    # devices.json changed: only this process's own device matters here
     global smart_light, device_name
-    with open("devices.json", "r") as f:
-        devices = json.load(f)[0]
-
-    smart_light = tinytuya.BulbDevice(devices["id"], devices["ip"], devices["key"])
-    smart_light.set_version(float(devices.get("version", 3.4)))
-    smart_light.set_socketTimeout(3)
-    device_name = devices["name"]
+    for entry in reconnect:
+        if entry.key == device_key:
+            log.info("address or key changed, reconnecting", extra={"device": device_key})
+            pool.remove(device_key)
+            smart_light = pool.open(device_key, "light", entry.info)
+            shadow.invalidate(device_key)
+    for entry in reconnect + updated:
+        if entry.key == device_key:
+            device_name = entry.name
+    if any(entry.key == device_key for entry in removed):
+        log.warning("removed from %s; still serving it until restart", registry.path, extra={"device": device_key})
 
 def get_status():
     if not smart_light:
         return {}
     try:
         status_data = smart_light.status()
-        return status_data.get("dps", {})
+        dps = status_data.get("dps", {})
+        shadow.update(device_key, dps)
+        return dps
     except Exception as error:
-        print(f"Error reading status: {error}")
+        log.warning("error reading status: %s", error, extra={"device": device_key})
         return {}
 
 
-def publish_telemetry():
+def publish_telemetry(force=False):
     if not smart_light:
         return
     
     try:
         dps = get_status()
         if dps:
-            state = "ON" if dps.get("20", False) else "OFF"
-            mode = dps.get("21", "unknown")
-            
-            if mode == 'colour':
-                raw_color = dps.get("24", "000003e803e8")
-                _, _, v = decode_hsv_hex(raw_color)
-                brightness = tuya_to_brightness_percent(v)
-            else:
-                brightness = tuya_to_brightness_percent(dps.get("22", 10))
-            
-            color_temp = dps.get("23", 0)
-            raw_color = dps.get("24", "")
-            color_hex = hsv_to_rgb_hex(raw_color)
-            
-            mqtt_client.publish("pi/light1/state", state)
-            mqtt_client.publish("pi/light1/mode", mode)
-            mqtt_client.publish("pi/light1/brightness", str(brightness))
-            mqtt_client.publish("pi/light1/color_temp", str(color_temp))
-            mqtt_client.publish("pi/light1/color", color_hex)
-            print(f"Published telemetry: {state} | {mode} | {brightness}%")
+            f, _ = publish_fields(dps, force=force)
+            log.info("published telemetry: %s | %s | %s%%", f["state"], f["mode"], f["brightness"], extra={"device": device_key})
         else:
-            print("Failed to read device status for telemetry")
+            log.warning("failed to read device status for telemetry", extra={"device": device_key})
     except Exception as e:
-        print(f"Error publishing telemetry: {e}")
+        log.error("error publishing telemetry: %s", e, extra={"device": device_key})
+
+
+def on_availability(key, available):
+    # The pool's circuit breaker for the device opened (offline) or closed (online)
+    state = "online" if available else "offline"
+    log.log(logging.INFO if available else logging.WARNING, "%s", state, extra={"device": device_key})
+    if mqtt_client:
+        mqtt_client.publish(f"{prefix}/availability", state, retain=True)
 
 
 def on_mqtt_connect(client, userdata, flags, return_code, properties=None):
     if return_code == 0:
-        print("Connected to MQTT broker")
-        client.subscribe("pi/light1/set")
-        client.subscribe("pi/light1/refresh")
+        log.info("connected to MQTT broker")
+        # The broker may have lost its retained state; resend everything next time
+        publisher.forget()
+        client.subscribe(f"{prefix}/set")
+        client.subscribe(f"{prefix}/refresh")
+        client.subscribe(f"{prefix}/effect")
+        client.publish(f"{prefix}/availability", "online" if pool.available(device_key) else "offline", retain=True)
     else:
-        print(f"MQTT connection failed: {return_code}")
+        log.error("MQTT connection failed: %s", return_code)
 
 
 def on_mqtt_disconnect(client, userdata, flags, reason_code, properties=None):
-    print(f"Disconnected from MQTT: {reason_code}")
+    log.warning("disconnected from MQTT: %s", reason_code)
+
+
+def current_status():
+    # Shadow state unless it has gone stale, plus values queued but not yet written
+    return {**shadow.read(device_key, get_status), **writes.pending_values(device_key)}
+
+
+def write_values(device, dps):
+    result = smart_light.set_multiple_values(dps)
+    if is_error(result):
+        log.warning("write failed: %s", result.get("Error"), extra={"device": device_key})
+        shadow.invalidate(device_key)
+        return
+    log.info("write: %s", dps, extra={"device": device_key})
+
+    # Publish the acknowledged values instead of reading the status straight back
+    ack = result.get("dps") if isinstance(result, dict) else None
+    shadow.update(device_key, ack or dps)
+    scheduler.poke(device_key)
+    state = shadow.get(device_key)
+    if state:
+        publish_fields(state)
+    else:
+        publish_telemetry()
+
+
+def effect_frame(device, dps):
+    # Effect frames skip the telemetry round-trip; the shadow keeps up with what was sent
+    result = smart_light.set_multiple_values(dps)
+    if is_error(result):
+        shadow.invalidate(device_key)
+        return False
+    ack = result.get("dps") if isinstance(result, dict) else None
+    shadow.update(device_key, ack or dps)
+    return True
+
+
+def effect_finished(run):
+    log.info("effect %s", run.reason, extra={"device": device_key})
+    if mqtt_client:
+        mqtt_client.publish(f"{prefix}/effect/state", "none")
+    state = shadow.get(device_key)
+    if state:
+        publish_fields(state)
+
+
+def start_effect(payload):
+    if payload.strip().lower() == "stop":
+        effects.stop([device_key])
+        return
+    effect = parse_effect(payload, current_status(), MAX_WRITE_RATE)
+    if effect:
+        effects.start(device_key, {device_key: effect})
+        log.info("playing %s (%d frames)", effect.name, len(effect), extra={"device": device_key})
+        if mqtt_client:
+            mqtt_client.publish(f"{prefix}/effect/state", effect.name)
+
+
+def run_command(payload):
+    dps = lightHelpers.command_values(current_status, payload)
+    if dps:
+        writes.submit(device_key, dps)
 
 
 def on_mqtt_message(client, userdata, message):
-    global smart_light
-    
+    # Runs on paho's network thread: only queue work here, never touch the device
+    started = time.perf_counter()
     try:
         topic = message.topic
         payload = message.payload.decode("utf-8")
-        print(f"Received: {topic} → {payload}")
+        log.debug("received %s → %s", topic, payload, extra={"device": device_key})
+        entry, command = registry.route(topic)
+        if entry is None or entry.key != device_key:
+            return
+        if not pool.available(device_key):
+            log.warning("offline, command dropped", extra={"device": device_key})
+            return
         
-        if topic == "pi/light1/set":
-            cmd_lower = payload.lower()
-            
-            if cmd_lower == "on":
-                if smart_light:
-                    smart_light.set_value('20', True)
-                    print("Light ON")
-            elif cmd_lower == "off":
-                if smart_light:
-                    smart_light.set_value('20', False)
-                    print("Light OFF")
-            elif cmd_lower == "toggle":
-                if smart_light:
-                    status = get_status()
-                    is_on = status.get("20", False)
-                    smart_light.set_value('20', not is_on)
-                    print(f"Light toggled ({'ON' if not is_on else 'OFF'})")
-            elif cmd_lower == "refresh":
-                publish_telemetry()
+        if command == "effect":
+            commands.submit(device_key, "effect", start_effect, payload)
+            return
+
+        if command == "set":
+            # A plain command takes over from a running effect
+            effects.stop([device_key])
+            if payload.lower() == "refresh":
+                commands.submit(device_key, "refresh", publish_telemetry, True)
                 return
-            
-            elif ":" in payload:
-                parts = payload.split(":", 1)
-                cmd = parts[0].lower().strip()
-                val = parts[1].strip()
-                
-                if cmd == "brightness":
-                    from utils import lightHelpers
-                    lightHelpers.set_brightness(smart_light, get_status, val)
-                elif cmd == "color":
-                    if "," in val:
-                        try:
-                            h, s, v = val.split(",")
-                            from utils import lightHelpers
-                            lightHelpers.set_color(smart_light, h, s, v)
-                        except ValueError:
-                            print("Invalid color format (use h,s,v)")
-                elif cmd == "temperature":
-                    from utils import lightHelpers
-                    lightHelpers.set_temperature(smart_light, get_status, val)
-                else:
-                    print(f"Unknown command: {cmd}")
 
-            time.sleep(0.1)
-            publish_telemetry()
+            key = coalesce_key(payload)
+            if commands.submit(device_key, key, run_command, payload):
+                log.debug("superseded queued %s command (%d dropped so far)", key, commands.dropped, extra={"device": device_key})
         
-        elif topic == "pi/light1/refresh":
-            publish_telemetry()
+        elif command == "refresh":
+            commands.submit(device_key, "refresh", publish_telemetry, True)
     
     except Exception as error:
-        print(f"Error handling message: {error}")
+        mqtt_errors.inc()
+        log.error("error handling %s: %s", message.topic, error, extra={"device": device_key})
+    finally:
+        mqtt_seconds.observe(time.perf_counter() - started)
 
 
 def logic():
@@ -214,13 +322,13 @@ def logic():
             case 1:  # Set Mode
                 mode_choice = int(input("Enter mode [(1) White / (2) Colour / (3) Scene]: "))
                 if mode_choice == 1:
-                    smart_light.set_value("21", "white")
+                    lightHelpers.apply_state(smart_light, None, mode="white")
                     print("Mode set to: White")
                 elif mode_choice == 2:
-                    smart_light.set_value("21", "colour")
+                    lightHelpers.apply_state(smart_light, None, mode="colour")
                     print("Mode set to: Colour")
                 elif mode_choice == 3:
-                    smart_light.set_value("21", "scene")
+                    lightHelpers.apply_state(smart_light, None, mode="scene")
                     print("Mode set to: Scene")
                 else:
                     print("Invalid mode choice")
@@ -228,40 +336,21 @@ def logic():
             
             case 2:  # Set Brightness
                 brightness = int(input("Enter brightness (0-100): "))
-                dps = get_status()
                 percent = max(0, min(100, int(float(brightness))))
-                mode = dps.get("21", "white")
+                sent = lightHelpers.apply_state(smart_light, get_status, brightness=percent)
                 
-                if mode == "colour":
-                    current_color = dps.get("24", "000003e803e8")
-                    h, s, v = decode_hsv_hex(current_color)
-                    v = brightness_percent_to_tuya(percent)
-                    new_hex = encode_hsv_hex(h, s, v)
-                    smart_light.set_multiple_values({'21': 'colour', '24': new_hex})
+                if '24' in sent:
                     print(f"Brightness: {percent}% (colour mode)")
                 else:
-                    tuya_val = brightness_percent_to_tuya(percent)
-                    smart_light.set_value('22', tuya_val)
                     print(f"Brightness: {percent}% (white mode)")
                 input("Press Enter to continue...")
 
             case 3:  # Set Temperature
                 temp = int(input("Enter temperature (0-1000): "))
                 temp_val = max(0, min(1000, int(float(temp))))
-                dps = get_status()
-                mode = dps.get('21', 'white')
-                if mode == 'white':
-                    brightness = dps.get('22', 500)
-                else:
-                    current_color = dps.get('24', '000003e803e8')
-                    _, _, brightness = decode_hsv_hex(current_color)
-                
-                brightness = max(100, brightness)
-                
-                smart_light.set_value('21', 'white')
-                smart_light.set_value('23', temp_val)
-                smart_light.set_value('22', brightness)
-                print(f"Temperature: {temp_val} (brightness: {brightness})")
+                # Mode, temperature and brightness go out in one frame
+                sent = lightHelpers.apply_state(smart_light, get_status, temperature=temp_val)
+                print(f"Temperature: {temp_val} (sent: {sent})")
                 input("Press Enter to continue...")
             
             case 4:  # Set Colour
@@ -274,8 +363,7 @@ def logic():
                 s = max(0, min(1000, int(float(s))))
                 v = max(0, min(1000, int(float(v))))
                 
-                hex_str = encode_hsv_hex(h, s, v)
-                smart_light.set_multiple_values({'21': 'colour', '24': hex_str})
+                lightHelpers.apply_state(smart_light, None, hsv=(h, s, v))
                 print(f"Color set: H={h}, S={s}, V={v}")
                 input("Press Enter to continue...")
             
@@ -288,16 +376,14 @@ def logic():
             case 6:  # Turn switch On/Off
                 toggle_choice = input("Enter [(1) ON / (2) OFF / (3) TOGGLE]: ").strip()
                 if toggle_choice == "1":
-                    smart_light.set_value('20', True)
+                    lightHelpers.apply_state(smart_light, None, power=True)
                     print("Light turned ON")
                 elif toggle_choice == "2":
-                    smart_light.set_value('20', False)
+                    lightHelpers.apply_state(smart_light, None, power=False)
                     print("Light turned OFF")
                 elif toggle_choice == "3":
-                    dps = get_status()
-                    is_on = dps.get("20", False)
-                    smart_light.set_value('20', not is_on)
-                    print(f"Light toggled ({'ON' if not is_on else 'OFF'})")
+                    sent = lightHelpers.apply_state(smart_light, get_status, power="toggle")
+                    print(f"Light toggled ({'ON' if sent.get('20') else 'OFF'})")
                 else:
                     print("Invalid choice")
                 input("Press Enter to continue...")
@@ -305,33 +391,15 @@ def logic():
             case 7:  # Read all and publish
                 dps = get_status()
                 if dps:
-                    state = "ON" if dps.get("20", False) else "OFF"
-                    mode = dps.get("21", "unknown")
-
-                    if mode == 'colour':
-                        raw_color = dps.get("24", "000003e803e8")
-                        _, _, v = decode_hsv_hex(raw_color)
-                        brightness = tuya_to_brightness_percent(v)
-                    else:
-                        brightness = tuya_to_brightness_percent(dps.get("22", 10))
-                    
-                    color_temp = dps.get("23", 0)
-                    raw_color = dps.get("24", "")
-                    color_hex = hsv_to_rgb_hex(raw_color)
+                    f, _ = publish_fields(dps, force=True)
                     
                     print(f"\n{device_name} Status:")
-                    print(f"  State: {state}")
-                    print(f"  Mode: {mode}")
-                    print(f"  Brightness: {brightness}%")
-                    print(f"  Color Temp: {color_temp}")
-                    print(f"  Color (RGB): {color_hex}")
+                    print(f"  State: {f['state']}")
+                    print(f"  Mode: {f['mode']}")
+                    print(f"  Brightness: {f['brightness']}%")
+                    print(f"  Color Temp: {f['color_temp']}")
+                    print(f"  Color (RGB): {f['color']}")
                     print(f"  Raw DPS: {dps}")
-                    
-                    mqtt_client.publish("pi/light1/state", state)
-                    mqtt_client.publish("pi/light1/mode", mode)
-                    mqtt_client.publish("pi/light1/brightness", str(brightness))
-                    mqtt_client.publish("pi/light1/color_temp", str(color_temp))
-                    mqtt_client.publish("pi/light1/color", color_hex)
                     print("\nPublished to MQTT")
                 else:
                     print("Failed to read device status")
@@ -341,26 +409,69 @@ def logic():
                 live_mode()
                 input("Press Enter to continue...")
             
+            case 9:  # Play effect
+                payload = input("Effect (e.g. fade:120,1000,1000:3, sunrise:600, breathe, cycle:20, stop): ").strip()
+                start_effect(payload)
+                input("Press Enter to continue...")
+
             case _:
-                print("Invalid choice. Please select 1-8 or Q to quit.")
+                print("Invalid choice. Please select 1-9 or Q to quit.")
                 input("Press Enter to continue...") 
 
 def main():
-    global mqtt_client
+    global mqtt_client, publisher, writes, shadow, effects, MQTT_BROKER_HOST, MQTT_BROKER_PORT
+
+    # --broker host[:port] overrides the local default
+    broker = arg_value("--broker")
+    if broker:
+        host, _, port = broker.partition(":")
+        MQTT_BROKER_HOST, MQTT_BROKER_PORT = host, int(port or MQTT_BROKER_PORT)
 
+    # --log-level, --device-log-level <key>=<level>, --log-format json|text, --log-file <path>
+    try:
+        levels = arg_value("--device-log-level")
+        setup_logging(arg_value("--log-level") or LOG_LEVEL, arg_value("--log-format") or "auto",
+                      arg_value("--log-file"), parse_levels([levels] if levels else []))
+    except ValueError as error:
+        print(f"Bad log option: {error}")
+        sys.exit(1)
+
+    shadow = ShadowState(SHADOW_MAX_AGE)
     load_device()
 
     mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
     mqtt_client.on_connect = on_mqtt_connect
     mqtt_client.on_disconnect = on_mqtt_disconnect
     mqtt_client.on_message = on_mqtt_message
-
-    print(f"Connecting to MQTT at {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
+    # This process is the device's only bridge, so if it dies the device is unreachable too
+    mqtt_client.will_set(f"{prefix}/availability", "offline", retain=True)
+    pool.on_availability = on_availability
+    publisher = TelemetryPublisher(mqtt_client, field_topics=PUBLISH_FIELD_TOPICS, json_state=PUBLISH_JSON_STATE,
+                                   metrics=metrics)
+
+    writes = WriteScheduler(write_values, max_rate=MAX_WRITE_RATE, max_workers=1, metrics=metrics)
+    # Effect frames bypass the write queue but not its rate limit
+    effects = EffectEngine(lambda device, dps: writes.write_now(device, dps, effect_frame), max_workers=1,
+                           on_finish=effect_finished)
+
+    log.info("connecting to MQTT at %s:%s", MQTT_BROKER_HOST, MQTT_BROKER_PORT)
     mqtt_client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_KEEPALIVE)
     mqtt_client.loop_start()
 
+    # --metrics-port <port> serves /metrics on localhost; --metrics-mqtt publishes to pi/_metrics/<device>
+    metrics_port = arg_value("--metrics-port")
+    if metrics_port:
+        try:
+            log.info("metrics at http://127.0.0.1:%d/metrics", metrics.serve(int(metrics_port)))
+        except OSError as error:
+            log.error("can't serve metrics on port %s: %s", metrics_port, error)
+    if "--metrics-mqtt" in sys.argv:
+        metrics.publish_every(mqtt_client, f"{METRICS_TOPIC}/{device_key}")
+
     if "--live" in sys.argv:
         live_mode()
+    elif "--listen" in sys.argv:
+        listen_mode()
     else:
         logic()
 
@@ -1,42 +1,114 @@
-import json
+import logging
 import time
 import sys
 import os
-import tinytuya
 import paho.mqtt.client as mqtt
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.pool import DevicePool, is_error
+from utils.shadow import ShadowState
+from utils.commands import CommandQueue, WriteScheduler, coalesce_key
+from utils.listener import PushListener
+from utils.scheduler import PollScheduler
+from utils.timeseries import TimeSeriesStore
+from utils.energy import EnergyMeter
+from utils.publisher import TelemetryPublisher, POWER_DEADBAND
 from utils.plugHelpers import watts, volts, amps
+from utils.registry import DeviceRegistry, DEVICES_FILE
+from utils.metrics import Metrics, METRICS_TOPIC
+from utils.logs import setup_logging, parse_levels, LOG_LEVEL
+from utils import plugHelpers
+
+log = logging.getLogger("plug1_CLI")
 
 
 
 smart_plug = None
 device_name = None
+# Topic key ("plug1") and prefix ("pi/plug1") of the device from devices.json; --device picks one
+device_key = None
+prefix = None
+registry = None
 mqtt_client = None
+publisher = None
+metrics = Metrics()
+pool = DevicePool(metrics=metrics)
+commands = CommandQueue(max_workers=1, metrics=metrics)
+mqtt_seconds = metrics.histogram("mqtt_handler_seconds", "Time spent in on_mqtt_message").labels()
+mqtt_errors = metrics.counter("mqtt_handler_errors_total", "MQTT messages that raised").labels()
+writes = None
+shadow = None
+scheduler = PollScheduler()
+history = None
+meter = EnergyMeter()
 
 MQTT_BROKER_HOST = "127.0.0.1"
 MQTT_BROKER_PORT = 1883
 MQTT_KEEPALIVE = 60
 
+# Per-field topics (pi/<device>/state, /power, /voltage, /current, /energy_today) and/or one combined pi/<device>/state/json
+PUBLISH_FIELD_TOPICS = True
+PUBLISH_JSON_STATE = True
+
+# Most device write frames per second; commands arriving faster are merged
+MAX_WRITE_RATE = 5
+
+# Seconds the last known state can stand in for a status() read on the command path
+SHADOW_MAX_AGE = 10
+
+# Power/voltage/current history (SQLite) recorded in live and listen mode
+RECORD_HISTORY = True
+HISTORY_DB = "telemetry.db"
+
+def publish_fields(dps, force=False, record=False):
+    fields = {"name": device_name, **plugHelpers.read_telemetry(dps)}
+    if record:
+        # A fresh reading: count it towards today's energy and the history
+        meter.add(time.time(), fields["power"])
+        if history:
+            history.add(device_key, fields)
+    fields["energy_today"] = round(meter.today(), 3)
+    payloads = {"name": device_name, **plugHelpers.format_telemetry(fields)}
+    sent = publisher.publish(prefix, fields, payloads, force=force)
+    return fields, sent
+
 def live_mode():
-    print("Live mode - publishing every 2 seconds (Press Ctrl+C to stop)")
+    print("Live mode - adaptive polling, faster while values change (Press Ctrl+C to stop)")
+    scheduler.add(device_key)
     try:
         while True:
+            scheduler.wait(device_key)
             dps = get_status()
-            if dps:
-                state = "ON" if dps.get("1", False) else "OFF"
-                power = watts(dps.get("19", 0))
-                voltage = volts(dps.get("20", 0))
-                current = amps(dps.get("18", 0))
-
-                mqtt_client.publish("pi/plug1/state", state)
-                mqtt_client.publish("pi/plug1/power", f"{power:.2f}")
-                mqtt_client.publish("pi/plug1/voltage", f"{voltage:.1f}")
-                mqtt_client.publish("pi/plug1/current", f"{current:.3f}")
-                print(f"{device_name} | {power:.2f}W | {voltage:.1f}V | {current:.3f}A | {state}")
-
-            time.sleep(2)
+            if not dps:
+                scheduler.record(device_key, failed=True)
+            else:
+                f, changed = publish_fields(dps, record=True)
+                scheduler.record(device_key, changed=bool(changed))
+                log.info("%.2fW | %.1fV | %.3fA | %s | %.3fkWh today", f["power"], f["voltage"], f["current"], f["state"],
+                         f["energy_today"], extra={"device": device_key, "fields": f})
     except KeyboardInterrupt:
         print("\nLive mode stopped")
+        print(pool.summary())
+        print(f"Commands: {commands.stats()}")
+        print(f"Writes: {writes.stats()}")
+        print(f"Shadow: {shadow.stats()}")
+        print(f"Polling: {scheduler.stats()}")
+        if history:
+            print(f"History: {history.stats()}")
+
+def on_device_update(key, dps):
+    shadow.update(key, dps)
+    fields, _ = publish_fields(dps, record=True)
+    log.info("pushed | %s", " | ".join(str(v) for v in fields.values()), extra={"device": device_key, "fields": fields})
+
+def listen_mode():
+    print("Listen mode - publishing on device updates (Press Ctrl+C to stop)")
+    listener = PushListener(pool, on_device_update)
+    listener.add(device_key)
+    try:
+        listener.run()
+    except KeyboardInterrupt:
+        print("\nListen mode stopped")
+        print(f"{listener.pushes} pushed updates, {listener.polls} fallback polls")
 
 def menu():
     print("\n" + device_name + " Management Hub")
@@ -47,109 +119,159 @@ def menu():
     print("4) Read Power state (on/off)")
     print("5) Turn switch On/Off")
     print("6) Read all (and publish)")
-    print("7) Live mode (publish every 2s)")
+    print("7) Live mode (adaptive polling)")
     print("Q) Quit")
 
+def arg_value(flag):
+    if flag in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return None
+
 def load_device():
+    global smart_plug, device_name, device_key, prefix, registry
+    registry = DeviceRegistry(arg_value("--devices") or DEVICES_FILE)
+    ref = arg_value("--device")
+    entry = registry.find(ref) if ref else registry.first("plug")
+    if entry is None or entry.kind != "plug":
+        print(f"No plug {ref or ''} in {registry.path} (pick one with --device <id|name|ip|topic>)")
+        sys.exit(1)
+
+    device_key, prefix, device_name = entry.key, entry.prefix, entry.name
+    smart_plug = pool.open(device_key, "plug", entry.info)
+    registry.watch(on_registry_change)
+
+    if "--listen" not in sys.argv:
+        pool.start_keepalive()
+
+def on_registry_change(added, removed, reconnect, updated):
+    # devices.json changed: only this process's own device matters here
     global smart_plug, device_name
-    with open("devices.json", "r") as f:
-        devices = json.load(f)[1]
-
-    smart_plug = tinytuya.OutletDevice(devices["id"], devices["ip"], devices["key"])
-    smart_plug.set_version(float(devices.get("version", 3.4)))
-    smart_plug.set_socketTimeout(3)
-    device_name = devices["name"]
+    for entry in reconnect:
+        if entry.key == device_key:
+            log.info("address or key changed, reconnecting", extra={"device": device_key})
+            pool.remove(device_key)
+            smart_plug = pool.open(device_key, "plug", entry.info)
+            shadow.invalidate(device_key)
+    for entry in reconnect + updated:
+        if entry.key == device_key:
+            device_name = entry.name
+    if any(entry.key == device_key for entry in removed):
+        log.warning("removed from %s; still serving it until restart", registry.path, extra={"device": device_key})
 
 def get_status():
     if not smart_plug:
         return {}
     try:
         status_data = smart_plug.status()
-        return status_data.get("dps", {})
+        dps = status_data.get("dps", {})
+        shadow.update(device_key, dps)
+        return dps
     except Exception as error:
-        print(f"Error reading status: {error}")
+        log.warning("error reading status: %s", error, extra={"device": device_key})
         return {}
 
 
-def publish_telemetry():
+def publish_telemetry(force=False):
     if not smart_plug:
         return
     
     try:
         dps = get_status()
         if dps:
-            state = "ON" if dps.get("1", False) else "OFF"
-            power = watts(dps.get("19", 0))
-            voltage = volts(dps.get("20", 0))
-            current = amps(dps.get("18", 0))
-            
-            mqtt_client.publish("pi/plug1/name", device_name)
-            mqtt_client.publish("pi/plug1/state", state)
-            mqtt_client.publish("pi/plug1/power", f"{power:.2f}")
-            mqtt_client.publish("pi/plug1/voltage", f"{voltage:.1f}")
-            mqtt_client.publish("pi/plug1/current", f"{current:.3f}")
-            
-            print(f"Published telemetry: {state} | {power:.2f}W | {voltage:.1f}V | {current:.3f}A")
+            f, _ = publish_fields(dps, force=force)
+            log.info("published telemetry: %s | %.2fW | %.1fV | %.3fA", f["state"], f["power"], f["voltage"], f["current"],
+                     extra={"device": device_key})
         else:
-            print("Failed to read device status for telemetry")
+            log.warning("failed to read device status for telemetry", extra={"device": device_key})
     except Exception as e:
-        print(f"Error publishing telemetry: {e}")
+        log.error("error publishing telemetry: %s", e, extra={"device": device_key})
+
+
+def on_availability(key, available):
+    # The pool's circuit breaker for the device opened (offline) or closed (online)
+    state = "online" if available else "offline"
+    log.log(logging.INFO if available else logging.WARNING, "%s", state, extra={"device": device_key})
+    if mqtt_client:
+        mqtt_client.publish(f"{prefix}/availability", state, retain=True)
 
 
 def on_mqtt_connect(client, userdata, flags, return_code, properties=None):
     if return_code == 0:
-        print("Connected to MQTT broker")
-        client.subscribe("pi/plug1/set")
-        client.subscribe("pi/plug1/refresh")
+        log.info("connected to MQTT broker")
+        # The broker may have lost its retained state; resend everything next time
+        publisher.forget()
+        client.subscribe(f"{prefix}/set")
+        client.subscribe(f"{prefix}/refresh")
+        client.publish(f"{prefix}/availability", "online" if pool.available(device_key) else "offline", retain=True)
     else:
-        print(f"MQTT connection failed: {return_code}")
+        log.error("MQTT connection failed: %s", return_code)
 
 
 def on_mqtt_disconnect(client, userdata, flags, reason_code, properties=None):
-    print(f"Disconnected from MQTT: {reason_code}")
+    log.warning("disconnected from MQTT: %s", reason_code)
+
+
+def current_status():
+    # Shadow state unless it has gone stale, plus values queued but not yet written
+    return {**shadow.read(device_key, get_status), **writes.pending_values(device_key)}
+
+
+def write_values(device, dps):
+    result = smart_plug.set_multiple_values(dps)
+    if is_error(result):
+        log.warning("write failed: %s", result.get("Error"), extra={"device": device_key})
+        shadow.invalidate(device_key)
+        return
+    log.info("write: %s", dps, extra={"device": device_key})
+
+    # Publish the acknowledged values instead of reading the status straight back
+    ack = result.get("dps") if isinstance(result, dict) else None
+    shadow.update(device_key, ack or dps)
+    scheduler.poke(device_key)
+    state = shadow.get(device_key)
+    if state:
+        publish_fields(state)
+    else:
+        publish_telemetry()
+
+
+def run_command(payload):
+    dps = plugHelpers.command_values(current_status, payload)
+    if dps:
+        writes.submit(device_key, dps)
 
 
 def on_mqtt_message(client, userdata, message):
-    global smart_plug
-    
+    # Runs on paho's network thread: only queue work here, never touch the device
+    started = time.perf_counter()
     try:
         topic = message.topic
         payload = message.payload.decode("utf-8")
-        print(f"Received: {topic} → {payload}")
+        log.debug("received %s → %s", topic, payload, extra={"device": device_key})
+        entry, command = registry.route(topic)
+        if entry is None or entry.key != device_key:
+            return
+        if not pool.available(device_key):
+            log.warning("offline, command dropped", extra={"device": device_key})
+            return
         
-        if topic == "pi/plug1/set":
-            cmd_lower = payload.lower()
-            
-            # Simple commands
-            if cmd_lower == "on":
-                if smart_plug:
-                    smart_plug.set_status(True)
-                    print("Plug ON")
-            elif cmd_lower == "off":
-                if smart_plug:
-                    smart_plug.set_status(False)
-                    print("Plug OFF")
-            elif cmd_lower == "toggle":
-                if smart_plug:
-                    status = get_status()
-                    is_on = status.get("1", False)
-                    smart_plug.set_status(not is_on)
-                    print(f"Plug toggled ({'ON' if not is_on else 'OFF'})")
-            elif cmd_lower == "refresh":
-                publish_telemetry()
-                return  # Don't publish again
-            else:
-                print(f"Unknown command: {payload}")
-            
-            # Update telemetry after command
-            time.sleep(0.5)
-            publish_telemetry()
+        if command == "set":
+            if payload.lower() == "refresh":
+                commands.submit(device_key, "refresh", publish_telemetry, True)
+                return
+
+            key = coalesce_key(payload)
+            if commands.submit(device_key, key, run_command, payload):
+                log.debug("superseded queued %s command (%d dropped so far)", key, commands.dropped, extra={"device": device_key})
         
-        elif topic == "pi/plug1/refresh":
-            publish_telemetry()
+        elif command == "refresh":
+            commands.submit(device_key, "refresh", publish_telemetry, True)
     
     except Exception as error:
-        print(f"Error handling message: {error}")
+        mqtt_errors.inc()
+        log.error("error handling %s: %s", message.topic, error, extra={"device": device_key})
+    finally:
+        mqtt_seconds.observe(time.perf_counter() - started)
 
 
 def logic():
@@ -170,28 +292,28 @@ def logic():
             case 1:  # Read Power
                 dps = get_status()
                 p = watts(dps.get("19", 0))
-                mqtt_client.publish("pi/plug1/power", f"{p:.2f}")
+                mqtt_client.publish(f"{prefix}/power", f"{p:.2f}")
                 print(f"Power: {p:.2f}W")
                 input("Press Enter to continue...")
 
             case 2:  # Read Voltage
                 dps = get_status()
                 v = volts(dps.get("20", 0))
-                mqtt_client.publish("pi/plug1/voltage", f"{v:.1f}")
+                mqtt_client.publish(f"{prefix}/voltage", f"{v:.1f}")
                 print(f"Voltage: {v:.1f}V")
                 input("Press Enter to continue...")
 
             case 3:  # Read Current
                 dps = get_status()
                 a = amps(dps.get("18", 0))
-                mqtt_client.publish("pi/plug1/current", f"{a:.3f}")
+                mqtt_client.publish(f"{prefix}/current", f"{a:.3f}")
                 print(f"Current: {a:.3f}A")
                 input("Press Enter to continue...")
 
             case 4:  # Read Power state
                 dps = get_status()
                 state = "ON" if dps.get("1", False) else "OFF"
-                mqtt_client.publish("pi/plug1/state", state)
+                mqtt_client.publish(f"{prefix}/state", state)
                 print(f"Power state: {state}")
                 input("Press Enter to continue...")
 
@@ -215,23 +337,15 @@ def logic():
             case 6:  # Read all and publish
                 dps = get_status()
                 if dps:
-                    state = "ON" if dps.get("1", False) else "OFF"
-                    power = watts(dps.get("19", 0))
-                    voltage = volts(dps.get("20", 0))
-                    current = amps(dps.get("18", 0))
+                    f, _ = publish_fields(dps, force=True)
                     
                     print(f"\n{device_name} Status:")
-                    print(f"  State: {state}")
-                    print(f"  Power: {power:.2f}W")
-                    print(f"  Voltage: {voltage:.1f}V")
-                    print(f"  Current: {current:.3f}A")
+                    print(f"  State: {f['state']}")
+                    print(f"  Power: {f['power']:.2f}W")
+                    print(f"  Voltage: {f['voltage']:.1f}V")
+                    print(f"  Current: {f['current']:.3f}A")
+                    print(f"  Energy today: {f['energy_today']:.3f}kWh")
                     print(f"  Raw DPS: {dps}")
-                    
-                    mqtt_client.publish("pi/plug1/name", device_name)
-                    mqtt_client.publish("pi/plug1/state", state)
-                    mqtt_client.publish("pi/plug1/power", f"{power:.2f}")
-                    mqtt_client.publish("pi/plug1/voltage", f"{voltage:.1f}")
-                    mqtt_client.publish("pi/plug1/current", f"{current:.3f}")
                     print("\nPublished to MQTT")
                 else:
                     print("Failed to read device status")
@@ -246,24 +360,67 @@ def logic():
                 input("Press Enter to continue...")
 
 def main():
-    global mqtt_client
+    global mqtt_client, publisher, writes, shadow, history, MQTT_BROKER_HOST, MQTT_BROKER_PORT
+
+    # --broker host[:port] overrides the local default
+    broker = arg_value("--broker")
+    if broker:
+        host, _, port = broker.partition(":")
+        MQTT_BROKER_HOST, MQTT_BROKER_PORT = host, int(port or MQTT_BROKER_PORT)
 
+    # --log-level, --device-log-level <key>=<level>, --log-format json|text, --log-file <path>
+    try:
+        levels = arg_value("--device-log-level")
+        setup_logging(arg_value("--log-level") or LOG_LEVEL, arg_value("--log-format") or "auto",
+                      arg_value("--log-file"), parse_levels([levels] if levels else []))
+    except ValueError as error:
+        print(f"Bad log option: {error}")
+        sys.exit(1)
+
+    shadow = ShadowState(SHADOW_MAX_AGE)
     load_device()
 
     mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
     mqtt_client.on_connect = on_mqtt_connect
     mqtt_client.on_disconnect = on_mqtt_disconnect
     mqtt_client.on_message = on_mqtt_message
-
-    print(f"Connecting to MQTT at {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
+    # This process is the device's only bridge, so if it dies the device is unreachable too
+    mqtt_client.will_set(f"{prefix}/availability", "offline", retain=True)
+    pool.on_availability = on_availability
+    publisher = TelemetryPublisher(mqtt_client, deadbands={"power": POWER_DEADBAND},
+                                   field_topics=PUBLISH_FIELD_TOPICS, json_state=PUBLISH_JSON_STATE,
+                                   metrics=metrics)
+
+    writes = WriteScheduler(write_values, max_rate=MAX_WRITE_RATE, max_workers=1, metrics=metrics)
+    if RECORD_HISTORY:
+        history = TimeSeriesStore(HISTORY_DB)
+        meter.seed_from(history, device_key)
+        history.start()
+
+    log.info("connecting to MQTT at %s:%s", MQTT_BROKER_HOST, MQTT_BROKER_PORT)
     mqtt_client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_KEEPALIVE)
     mqtt_client.loop_start()
 
+    # --metrics-port <port> serves /metrics on localhost; --metrics-mqtt publishes to pi/_metrics/<device>
+    metrics_port = arg_value("--metrics-port")
+    if metrics_port:
+        try:
+            log.info("metrics at http://127.0.0.1:%d/metrics", metrics.serve(int(metrics_port)))
+        except OSError as error:
+            log.error("can't serve metrics on port %s: %s", metrics_port, error)
+    if "--metrics-mqtt" in sys.argv:
+        metrics.publish_every(mqtt_client, f"{METRICS_TOPIC}/{device_key}")
+
     if "--live" in sys.argv:
         live_mode()
+    elif "--listen" in sys.argv:
+        listen_mode()
     else:
         logic()
 
+    if history:
+        history.close()
+
 
 if __name__ == "__main__":
     main()
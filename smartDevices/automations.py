@@ -0,0 +1,105 @@
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import paho.mqtt.client as mqtt
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils.rules import RuleEngine, load_rules, RULES_FILE
+from utils.logs import setup_logging, LOG_LEVEL
+
+log = logging.getLogger("automations")
+
+
+MQTT_BROKER_HOST = "127.0.0.1"
+MQTT_BROKER_PORT = 1883
+MQTT_KEEPALIVE = 60
+STATS_INTERVAL = 300
+
+
+class Automations:
+    """
+    Runs rules.json against the telemetry the CLI scripts publish. Actions
+    are published as ordinary commands (pi/<device>/set, /effect), which the
+    CLI owning the device carries out with its helpers. The gateway runs the
+    same rules in-process instead (gateway.py --rules).
+    """
+
+    def __init__(self, config):
+        self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.mqtt_client.on_connect = self.on_mqtt_connect
+        self.mqtt_client.on_disconnect = self.on_mqtt_disconnect
+        self.mqtt_client.on_message = self.on_mqtt_message
+        self.engine = RuleEngine(config, self.act)
+        # Set by stop() (SIGTERM from systemd) to end run() cleanly
+        self.stop_event = threading.Event()
+
+    def act(self, topic, payload):
+        log.info("-> %s %s", topic, payload)
+        self.mqtt_client.publish(topic, payload)
+
+    def on_mqtt_connect(self, client, userdata, flags, return_code, properties=None):
+        if return_code == 0:
+            log.info("connected to MQTT broker, watching %d topics", len(self.engine.topics()))
+            for topic in self.engine.topics():
+                client.subscribe(topic)
+        else:
+            log.error("MQTT connection failed: %s", return_code)
+
+    def on_mqtt_disconnect(self, client, userdata, flags, reason_code, properties=None):
+        log.warning("disconnected from MQTT: %s", reason_code)
+
+    def on_mqtt_message(self, client, userdata, message):
+        received = time.perf_counter()
+        try:
+            for rule in self.engine.on_message(message.topic, message.payload.decode("utf-8"), received):
+                log.info("rule %s fired on %s", rule.name, message.topic)
+        except Exception as error:
+            log.error("error handling %s: %s", message.topic, error)
+
+    def run(self):
+        log.info("connecting to MQTT at %s:%s", MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+        self.mqtt_client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_KEEPALIVE)
+        self.mqtt_client.loop_start()
+        self.engine.start()
+        try:
+            while not self.stop_event.wait(STATS_INTERVAL):
+                log.info("rules: %s", self.engine.stats())
+        finally:
+            self.engine.stop()
+            self.mqtt_client.loop_stop()
+            self.mqtt_client.disconnect()
+            log.info("rules: %s", self.engine.stats())
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run automations from rules.json against MQTT telemetry")
+    parser.add_argument("--rules", default=RULES_FILE, help="path to rules.json")
+    parser.add_argument("--log-level", default=LOG_LEVEL, help="DEBUG, INFO, WARNING or ERROR")
+    parser.add_argument("--log-format", choices=("auto", "json", "text"), default="auto",
+                        help="JSON lines, or text; auto picks text on a terminal")
+    args = parser.parse_args()
+    try:
+        setup_logging(args.log_level, args.log_format)
+    except ValueError as error:
+        parser.error(str(error))
+
+    config = load_rules(args.rules)
+    if not config.get("rules"):
+        print(f"No rules in {args.rules}")
+        return
+    automations = Automations(config)
+    signal.signal(signal.SIGTERM, lambda signum, frame: automations.stop())
+    try:
+        automations.run()
+    except KeyboardInterrupt:
+        log.info("automations stopped")
+
+
+if __name__ == "__main__":
+    main()
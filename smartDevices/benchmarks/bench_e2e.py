@@ -0,0 +1,339 @@
+"""
+End-to-end benchmark: dashboard command -> MQTT -> CLI/gateway -> device ->
+telemetry back on MQTT, against a local Mosquitto and simulated devices.
+
+    python smartDevices/benchmarks/bench_e2e.py --target gateway --devices 10,50,100 --rates 1,5,20
+    python smartDevices/benchmarks/bench_e2e.py --target cli --devices 4,16 --compare e2e-cli-old.json
+
+For each device count the devices are simulated (utils/simulator.py) and
+the system under test is started against them: one gateway.py, or one
+light1_CLI.py / plug1_CLI.py --live process per device. Then for each
+command rate, on/off commands are published round-robin to pi/<device>/set
+and timed until pi/<device>/state/json reports the new state. Polls per
+second come from the simulated devices, messages per second from a pi/#
+subscriber, and CPU/RSS from /proc for the processes under test (Linux).
+
+Results are written as JSON; --compare prints the change against an
+earlier results file.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from utils.registry import parse_devices
+from utils.rules import LatencyStats
+from utils.simulator import Simulator
+
+DEVICE_COUNTS = "10,50"
+COMMAND_RATES = "1,5,20"
+DURATION = 20
+DEVICE_LATENCY = 0.02
+# How long every device gets to publish its first state, and a command its telemetry
+WARMUP_TIMEOUT = 60
+COMMAND_TIMEOUT = 5
+LATENCY_SAMPLES = 100_000
+
+# Metrics --compare reports, and whether bigger is better
+COMPARED = {"rtt_p50_ms": False, "rtt_p95_ms": False, "rtt_p99_ms": False, "completed_ratio": True,
+            "polls_per_s": True, "messages_per_s": True, "cpu_percent": False, "rss_mb": False}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def process_usage(pids):
+    """(cpu seconds, rss MB) summed over pids, from /proc; (None, None) where that isn't available."""
+    ticks, rss = 0, 0
+    try:
+        for pid in pids:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            ticks += int(fields[11]) + int(fields[12])
+            with open(f"/proc/{pid}/status") as f:
+                rss += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    except (OSError, StopIteration, IndexError, ValueError):
+        return None, None
+    return ticks / os.sysconf("SC_CLK_TCK"), rss / 1024
+
+
+class Observer:
+    """The dashboard's side: sends commands and times them until their telemetry arrives."""
+
+    def __init__(self, host, port):
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.seen = set()
+        self.pending = {}
+        self.rtt = LatencyStats(LATENCY_SAMPLES)
+        self.superseded = 0
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.on_message = self.on_message
+        self.client.connect(host, port)
+        self.client.subscribe("pi/#")
+        self.client.loop_start()
+
+    def on_message(self, client, userdata, message):
+        received = time.perf_counter()
+        if message.retain:
+            # Left on the broker by an earlier run, not something the target just sent
+            return
+        with self.lock:
+            self.messages += 1
+            parts = message.topic.split("/")
+            if len(parts) != 4 or parts[2:] != ["state", "json"]:
+                return
+            key = parts[1]
+            self.seen.add(key)
+            try:
+                state = json.loads(message.payload).get("state")
+            except ValueError:
+                return
+            pending = self.pending.get(key)
+            if not pending:
+                return
+            # The oldest command asking for this state is done; anything older was merged away
+            for index, (sent, expected) in enumerate(pending):
+                if expected == state:
+                    self.rtt.add(received - sent)
+                    self.superseded += index
+                    del pending[:index + 1]
+                    break
+
+    def command(self, key, payload):
+        with self.lock:
+            self.pending.setdefault(key, []).append((time.perf_counter(), payload.upper()))
+        self.client.publish(f"pi/{key}/set", payload)
+
+    def outstanding(self):
+        with self.lock:
+            return sum(len(pending) for pending in self.pending.values())
+
+    def reset(self):
+        with self.lock:
+            self.pending = {}
+            self.rtt = LatencyStats(LATENCY_SAMPLES)
+            self.superseded = 0
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def start_target(target, entries, devices_file, broker, workdir):
+    python = sys.executable
+    if target == "gateway":
+        command = [python, os.path.join(ROOT, "gateway.py"), "--devices", devices_file, "--broker", broker,
+                   "--no-history"]
+        return [subprocess.Popen(command, cwd=workdir, stdin=subprocess.DEVNULL,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+    processes = []
+    for entry in entries:
+        script = os.path.join(ROOT, "CLI_Version", f"{entry.kind}1_CLI.py")
+        # Each plug CLI keeps its own telemetry.db, so give each process its own directory
+        cwd = os.path.join(workdir, entry.key)
+        os.makedirs(cwd, exist_ok=True)
+        command = [python, script, "--live", "--devices", devices_file, "--device", entry.key, "--broker", broker]
+        processes.append(subprocess.Popen(command, cwd=cwd, stdin=subprocess.DEVNULL,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    return processes
+
+
+def stop_target(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_rate(observer, simulator, processes, states, rate, duration):
+    observer.reset()
+    keys = list(states)
+    pids = [process.pid for process in processes]
+    queries = simulator.stats()["queries"]
+    messages = observer.messages
+    cpu, _ = process_usage(pids)
+    started = time.perf_counter()
+
+    sent = 0
+    while time.perf_counter() - started < duration:
+        key = keys[sent % len(keys)]
+        states[key] = "off" if states[key] == "on" else "on"
+        observer.command(key, states[key])
+        sent += 1
+        # Fixed schedule, so a slow publish doesn't lower the offered rate
+        delay = started + sent / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    deadline = time.perf_counter() + COMMAND_TIMEOUT
+    while observer.outstanding() and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    cpu_after, rss = process_usage(pids)
+    rtt = observer.rtt.summary()
+    completed = rtt["count"]
+    return {
+        "rate": rate, "commands": sent, "completed": completed, "completed_ratio": round(completed / sent, 4),
+        "superseded": observer.superseded, "timeouts": observer.outstanding(),
+        "rtt_p50_ms": rtt.get("p50_ms"), "rtt_p95_ms": rtt.get("p95_ms"), "rtt_p99_ms": rtt.get("p99_ms"),
+        "rtt_max_ms": rtt.get("max_ms"),
+        "polls_per_s": round((simulator.stats()["queries"] - queries) / elapsed, 2),
+        "messages_per_s": round((observer.messages - messages) / elapsed, 2),
+        "cpu_percent": round((cpu_after - cpu) / elapsed * 100, 1) if cpu_after is not None else None,
+        "rss_mb": round(rss, 1) if rss is not None else None,
+    }
+
+
+def run_devices(args, observer, count, workdir):
+    lights = (count + 1) // 2
+    simulator = Simulator.create(lights, count - lights, network=args.network, version=args.version,
+                                 latency=args.latency, jitter=args.latency / 2, loss=args.loss,
+                                 push_interval=None)
+    simulator.start()
+    devices_file = os.path.join(workdir, f"devices-{count}.json")
+    with open(devices_file, "w") as f:
+        json.dump(simulator.entries(), f)
+    entries = parse_devices(simulator.entries())
+    keys = [entry.key for entry in entries]
+    # What each device was last told; simulated devices start switched on
+    states = dict.fromkeys(keys, "on")
+
+    with observer.lock:
+        observer.seen = set()
+    processes = start_target(args.target, entries, devices_file, args.broker, workdir)
+    results = []
+    try:
+        started = time.perf_counter()
+        while len(observer.seen & set(keys)) < len(keys):
+            if time.perf_counter() - started > WARMUP_TIMEOUT:
+                raise RuntimeError(f"only {len(observer.seen & set(keys))}/{len(keys)} devices reported in")
+            if any(process.poll() is not None for process in processes):
+                raise RuntimeError(f"{args.target} exited during start-up")
+            time.sleep(0.1)
+        startup = time.perf_counter() - started
+        print(f"{count} devices: all reporting after {startup:.1f}s")
+
+        for rate in args.rates:
+            result = {"devices": count, "startup_s": round(startup, 2),
+                      **run_rate(observer, simulator, processes, states, rate, args.duration)}
+            print(f"  {rate:>6} cmd/s: rtt p50 {result['rtt_p50_ms']} p95 {result['rtt_p95_ms']} "
+                  f"p99 {result['rtt_p99_ms']} ms, {result['completed']}/{result['commands']} completed, "
+                  f"{result['polls_per_s']} polls/s, {result['messages_per_s']} msg/s, "
+                  f"cpu {result['cpu_percent']}%, rss {result['rss_mb']} MB")
+            results.append(result)
+    finally:
+        stop_target(processes)
+        simulator.stop()
+    return results
+
+
+def compare(previous, current):
+    old = {(run["devices"], run["rate"]): run for run in previous["runs"]}
+    print(f"\nCompared with {previous.get('commit') or 'previous run'} ({previous.get('started')}):")
+    for run in current["runs"]:
+        before = old.get((run["devices"], run["rate"]))
+        if before is None:
+            continue
+        changes = []
+        for metric, higher_is_better in COMPARED.items():
+            a, b = before.get(metric), run.get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a * 100
+            worse = change < 0 if higher_is_better else change > 0
+            changes.append(f"{metric} {a} -> {b} ({change:+.0f}%{' !' if worse and abs(change) >= 10 else ''})")
+        print(f"  {run['devices']} devices @ {run['rate']} cmd/s: " + ", ".join(changes))
+
+
+def start_broker():
+    if shutil.which("mosquitto") is None:
+        return None, None
+    port = free_port()
+    broker = subprocess.Popen(["mosquitto", "-p", str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            return broker, f"127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    broker.kill()
+    raise RuntimeError("mosquitto did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Command-to-telemetry latency and throughput against simulated devices")
+    parser.add_argument("--target", choices=("gateway", "cli"), default="gateway", help="what to benchmark")
+    parser.add_argument("--devices", default=DEVICE_COUNTS, help="comma-separated device counts")
+    parser.add_argument("--rates", default=COMMAND_RATES, help="comma-separated total command rates (per second)")
+    parser.add_argument("--duration", type=float, default=DURATION, help="seconds of commands per rate")
+    parser.add_argument("--latency", type=float, default=DEVICE_LATENCY, help="simulated device reply latency")
+    parser.add_argument("--loss", type=float, default=0.0, help="simulated frame loss (0-1)")
+    parser.add_argument("--version", choices=("3.3", "3.4", "mixed"), default="mixed", help="device protocol")
+    parser.add_argument("--network", default="127.1.0.0/16", help="loopback addresses for the simulated devices")
+    parser.add_argument("--broker", help="use this broker (host:port) instead of starting mosquitto")
+    parser.add_argument("--output", help="results file (default e2e-<target>-<time>.json)")
+    parser.add_argument("--compare", metavar="RESULTS", help="an earlier results file to compare against")
+    args = parser.parse_args()
+    args.rates = [float(rate) for rate in args.rates.split(",")]
+
+    broker = None
+    if not args.broker:
+        broker, args.broker = start_broker()
+        if broker is None:
+            parser.error("mosquitto isn't on PATH; start a broker and pass --broker host:port")
+    host, _, port = args.broker.partition(":")
+    observer = Observer(host, int(port or 1883))
+
+    results = {"benchmark": "e2e", "target": args.target, "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+               "cpus": os.cpu_count(),
+               "settings": {"duration": args.duration, "latency": args.latency, "loss": args.loss,
+                            "version": args.version},
+               "runs": []}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for count in (int(count) for count in args.devices.split(",")):
+                results["runs"].extend(run_devices(args, observer, count, workdir))
+    finally:
+        observer.stop()
+        if broker:
+            broker.terminate()
+            broker.wait()
+
+    output = args.output or f"e2e-{args.target}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils import energy
+
+PLUGS = 12
+DAYS = 365
+
+
+def samples(plug, days, start):
+    count = days * 86400
+    np = energy.np
+    if np is None:
+        ts = [start + i for i in range(count) if (i * 7919 + plug) % 100]
+        return ts, [50.0] * len(ts)
+    ts = start + np.arange(count, dtype=float)
+    # Drop ~1% of samples so the intervals are irregular
+    ts = ts[np.random.default_rng(plug).random(count) > 0.01]
+    return ts, 50 + 40 * np.sin(ts / 3600)
+
+
+def main():
+    days = DAYS
+    if energy.np is None:
+        print("numpy is not installed; timing the pure-Python fallback on one day instead")
+        days = 1
+    start = time.mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1))
+
+    total_wh = 0.0
+    elapsed = 0.0
+    count = 0
+    for plug in range(PLUGS):
+        ts, watts = samples(plug, days, start)
+        count += len(ts)
+        began = time.perf_counter()
+        total_wh += sum(energy.energy_by_period(ts, watts).values())
+        elapsed += time.perf_counter() - began
+
+    print(f"{PLUGS} plugs x {days} days of ~1s samples ({count:,} samples): {elapsed:.2f}s integrating, "
+          f"{count / elapsed / 1e6:.1f}M samples/s, {total_wh / 1000:.1f} kWh")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils import hsv
+
+COUNT = 200_000
+DISTINCT = 500
+
+
+def timed(label, fn, count):
+    began = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - began
+    print(f"{label:<38} {elapsed * 1000:8.1f} ms  {elapsed / count * 1e9:7.0f} ns/colour")
+    return elapsed
+
+
+def main():
+    rng = random.Random(0)
+    unique = [hsv.encode_hsv_hex(rng.randrange(360), rng.randrange(1001), rng.randrange(1001))
+              for _ in range(COUNT)]
+    # A fleet's telemetry repeats the same few colours over and over
+    repeated = [unique[rng.randrange(DISTINCT)] for _ in range(COUNT)]
+    uncached = hsv.hsv_to_rgb_hex.__wrapped__
+
+    print(f"{COUNT:,} colours, numpy {'available' if hsv.np is not None else 'not installed'}")
+    base = timed("per-call, uncached", lambda: [uncached(c) for c in unique], COUNT)
+    hsv.hsv_to_rgb_hex.cache_clear()
+    timed(f"per-call, cached ({DISTINCT} distinct)", lambda: [hsv.hsv_to_rgb_hex(c) for c in repeated], COUNT)
+    batch = timed("batch hsv_hex_to_rgb_hex_batch", lambda: hsv.hsv_hex_to_rgb_hex_batch(unique), COUNT)
+    print(f"batch speed-up over per-call: {base / batch:.1f}x")
+
+    h, s, v = zip(*hsv.decode_hsv_hex_batch(unique))
+    base = timed("per-call encode_hsv_hex", lambda: [hsv.encode_hsv_hex(*x) for x in zip(h, s, v)], COUNT)
+    batch = timed("batch encode_hsv_hex_batch", lambda: hsv.encode_hsv_hex_batch(h, s, v), COUNT)
+    print(f"batch speed-up over per-call: {base / batch:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.metrics import Metrics
+
+CALLS = 1_000_000
+DEVICES = 100
+
+
+def main():
+    metrics = Metrics()
+    calls = metrics.histogram("tuya_call_seconds", "Time for a device call to return", ("device", "method"))
+    errors = metrics.counter("tuya_call_errors_total", "Device calls that failed", ("device", "method"))
+    keys = [f"light{index}" for index in range(DEVICES)]
+
+    began = time.perf_counter()
+    for index in range(CALLS):
+        calls.labels(keys[index % DEVICES], "status").observe(0.02)
+    observe = (time.perf_counter() - began) / CALLS
+    print(f"histogram: {observe * 1e9:.0f} ns per labelled observe()")
+
+    began = time.perf_counter()
+    for index in range(CALLS):
+        errors.labels(keys[index % DEVICES], "status").inc()
+    inc = (time.perf_counter() - began) / CALLS
+    print(f"counter:   {inc * 1e9:.0f} ns per labelled inc()")
+    # A warm Tuya LAN round trip is ~20 ms
+    print(f"overhead on a 20 ms status() call: {observe / 0.02 * 100:.4f}%")
+
+    began = time.perf_counter()
+    text = metrics.render()
+    print(f"render: {len(text.splitlines()):,} lines in {(time.perf_counter() - began) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.rules import RuleEngine, Rule
+
+RULES = 5000
+DEVICES = 500
+MESSAGES = 200_000
+
+
+def make_rules(rng):
+    rules = []
+    for index in range(RULES):
+        plug = f"plug{rng.randrange(DEVICES)}"
+        when = [f"pi/{plug}/power > {rng.randrange(100, 2000)}"]
+        if index % 3 == 0:
+            when.append(f"pi/{plug}/state == ON")
+        rules.append({"name": f"rule{index}", "when": when, "then": {f"pi/light{index % 50}/set": "off"}})
+    return rules
+
+
+def make_messages(rng):
+    messages = []
+    for _ in range(MESSAGES):
+        plug = f"plug{rng.randrange(DEVICES)}"
+        if rng.random() < 0.1:
+            messages.append((f"pi/{plug}/state", rng.choice(("ON", "OFF"))))
+        else:
+            messages.append((f"pi/{plug}/power", f"{rng.uniform(0, 2500):.2f}"))
+    return messages
+
+
+def scan_all(rules, messages):
+    # What checking every rule on every message costs, for comparison
+    compiled = [Rule(spec) for spec in rules]
+    for topic, payload in messages:
+        try:
+            number = float(payload)
+        except ValueError:
+            number = None
+        for rule in compiled:
+            for condition in rule.conditions:
+                if condition.topic == topic:
+                    condition.true = condition.test(payload, number)
+
+
+def main():
+    rng = random.Random(0)
+    rules = make_rules(rng)
+    messages = make_messages(rng)
+    actions = []
+
+    began = time.perf_counter()
+    engine = RuleEngine({"rules": rules}, lambda topic, payload: actions.append(topic))
+    print(f"compiled {RULES:,} rules on {len(engine.topics()):,} topics in {(time.perf_counter() - began) * 1000:.1f} ms")
+
+    began = time.perf_counter()
+    for topic, payload in messages:
+        engine.on_message(topic, payload)
+    indexed = time.perf_counter() - began
+    stats = engine.stats()
+    print(f"indexed: {MESSAGES:,} messages in {indexed:.2f}s ({indexed / MESSAGES * 1e6:.1f} us/message), "
+          f"{stats['conditions_checked'] / MESSAGES:.1f} conditions/message, {stats['fired']:,} firings")
+    print(f"trigger to action: {stats['trigger_to_action']}")
+
+    sample = messages[:MESSAGES // 100]
+    began = time.perf_counter()
+    scan_all(rules, sample)
+    scanned = (time.perf_counter() - began) / len(sample)
+    print(f"scan-all: {scanned * 1e6:.1f} us/message ({scanned / (indexed / MESSAGES):.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
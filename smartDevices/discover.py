@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils.discovery import Discovery, scan, local_network, SCAN_TIMEOUT
+from utils.registry import DEVICES_FILE, DeviceRegistry
+
+LISTEN_SECONDS = 6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find Tuya devices on the LAN and check devices.json against them")
+    parser.add_argument("--devices", default=DEVICES_FILE, help="path to devices.json")
+    parser.add_argument("--listen", type=float, default=LISTEN_SECONDS, help="seconds to listen for beacons")
+    parser.add_argument("--network", help="network to scan, e.g. 192.168.1.0/24 (default: the local /24)")
+    parser.add_argument("--timeout", type=float, default=SCAN_TIMEOUT, help="connect timeout per host")
+    parser.add_argument("--write", action="store_true", help="save addresses that changed back to devices.json")
+    args = parser.parse_args()
+
+    registry = DeviceRegistry(args.devices) if os.path.exists(args.devices) else None
+    discovery = Discovery()
+    try:
+        discovery.open()
+        discovery.start()
+    except OSError as error:
+        print(f"Can't listen for beacons ({error}); scanning only")
+
+    # Beacons keep arriving on the listener thread while the scan runs
+    network = args.network or local_network()
+    started = time.monotonic()
+    hosts = scan(network, timeout=args.timeout)
+    print(f"Scanned {network} in {time.monotonic() - started:.1f}s: {len(hosts)} hosts with port 6668 open")
+    time.sleep(max(0.0, args.listen - (time.monotonic() - started)))
+    discovery.stop()
+
+    heard = discovery.snapshot()
+    moved = {}
+    print(f"\n{'ID':<24} {'IP':<16} {'VER':<5} {'NAME':<20} STATUS")
+    for device_id, info in sorted(heard.items(), key=lambda item: item[1]["ip"]):
+        entry = registry.by_id.get(device_id) if registry else None
+        if entry is None:
+            status = "not in devices.json"
+        elif entry.info["ip"] != info["ip"]:
+            status = f"MOVED (devices.json has {entry.info['ip']})"
+            moved[device_id] = info["ip"]
+        else:
+            status = "ok"
+        print(f"{device_id:<24} {info['ip']:<16} {str(info['version']):<5} "
+              f"{entry.name if entry else '-':<20} {status}")
+
+    silent = sorted(set(hosts) - {info["ip"] for info in heard.values()})
+    if silent:
+        print(f"\nPort 6668 open but no beacon heard: {', '.join(silent)}")
+    if registry:
+        missing = [entry.name for entry in registry if str(entry.info["id"]) not in heard]
+        if missing:
+            print(f"Not heard from: {', '.join(missing)}")
+
+    if moved and args.write:
+        with open(args.devices, "r") as f:
+            entries = json.load(f)
+        for info in entries:
+            if str(info.get("id")) in moved:
+                info["ip"] = moved[str(info["id"])]
+        with open(args.devices, "w") as f:
+            json.dump(entries, f, indent=2)
+        print(f"\nUpdated {len(moved)} addresses in {args.devices}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,587 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import paho.mqtt.client as mqtt
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils import lightHelpers, plugHelpers
+from utils.pool import DevicePool, is_error
+from utils.shadow import ShadowState, SHADOW_MAX_AGE
+from utils.commands import CommandQueue, WriteScheduler, coalesce_key, MAX_WRITE_RATE
+from utils.listener import PushListener
+from utils.publisher import TelemetryPublisher, POWER_DEADBAND
+from utils.scheduler import PollScheduler, MIN_INTERVAL, MAX_INTERVAL
+from utils.timeseries import TimeSeriesStore, DB_FILE
+from utils.energy import EnergyMeter
+from utils.effects import EffectEngine, parse_effect
+from utils.rules import RuleEngine, load_rules, RULES_FILE
+from utils.registry import DeviceRegistry, DEVICES_FILE
+from utils.discovery import Discovery
+from utils.metrics import Metrics, METRICS_PORT, METRICS_TOPIC, PUBLISH_INTERVAL
+from utils.groups import GroupDispatcher, load_groups, resolve_members, GROUPS_FILE, MAX_GROUP_WORKERS
+from utils.logs import setup_logging, parse_levels, LOG_LEVEL
+
+log = logging.getLogger("gateway")
+
+
+MQTT_BROKER_HOST = "127.0.0.1"
+MQTT_BROKER_PORT = 1883
+MQTT_KEEPALIVE = 60
+
+# Retained "online"/"offline"; the broker publishes "offline" if the gateway dies (Last Will)
+GATEWAY_AVAILABILITY_TOPIC = "pi/gateway/availability"
+
+POLL_INTERVAL = 2
+MAX_WORKERS = 8
+
+HELPERS = {"light": lightHelpers, "plug": plugHelpers}
+
+
+class GatewayDevice:
+    def __init__(self, pool, info, kind, topic_id):
+        self.info = info
+        self.kind = kind
+        self.topic_id = topic_id
+        self.prefix = f"pi/{topic_id}"
+        self.helpers = HELPERS[kind]
+        self.update(info)
+        self.lock = threading.Lock()
+
+        self.tuya = pool.open(topic_id, kind, info)
+
+    def update(self, info):
+        # Settings that can change in devices.json without reconnecting
+        self.info = info
+        self.name = info.get("name", self.topic_id)
+        # Higher priority polls more often (see utils/scheduler.py)
+        self.priority = float(info.get("priority", 1))
+
+    def get_status(self):
+        try:
+            status_data = self.tuya.status()
+            return status_data.get("dps", {})
+        except Exception as error:
+            log.warning("error reading status: %s", error, extra={"device": self.topic_id})
+            return {}
+
+
+def load_devices(registry, pool):
+    return [GatewayDevice(pool, entry.info, entry.kind, entry.key) for entry in registry]
+
+
+class Gateway:
+    def __init__(self, pool, devices, max_workers=MAX_WORKERS, poll_interval=POLL_INTERVAL, listen=False,
+                 power_deadband=POWER_DEADBAND, field_topics=True, max_write_rate=MAX_WRITE_RATE,
+                 shadow_max_age=SHADOW_MAX_AGE, groups=None, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 history=None, rules=None, registry=None, discovery=None, metrics=None, metrics_port=None,
+                 metrics_topic=None):
+        self.pool = pool
+        self.listen = listen
+        self.devices = {device.topic_id: device for device in devices}
+        self.poll_interval = poll_interval
+        self.scheduler = PollScheduler(poll_interval, min_interval, max_interval)
+        self.wakeups = {}
+        self.polls = {}
+        self.listener = None
+        # DeviceRegistry to watch for devices.json changes, or None for a fixed device list
+        self.registry = registry
+        # Discovery feeding device addresses from Tuya beacons into the registry, or None
+        self.discovery = discovery
+        # TimeSeriesStore for plug telemetry, or None to keep no history
+        self.history = history
+        # Running kWh per plug, published as pi/<plug>/energy_today
+        self.meters = {key: EnergyMeter() for key, device in self.devices.items() if device.kind == "plug"}
+        # Shared with the pool, so device call latency lands in the same registry
+        self.metrics = metrics or Metrics()
+        # Where to serve /metrics and publish JSON snapshots; None for neither
+        self.metrics_port = metrics_port
+        self.metrics_topic = metrics_topic
+        self.mqtt_seconds = self.metrics.histogram("mqtt_handler_seconds", "Time spent in on_mqtt_message").labels()
+        self.mqtt_errors = self.metrics.counter("mqtt_handler_errors_total", "MQTT messages that raised").labels()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tuya")
+        self.commands = CommandQueue(self.executor, metrics=self.metrics)
+        self.writes = WriteScheduler(self.write_values, self.executor, max_rate=max_write_rate, metrics=self.metrics)
+        self.shadow = ShadowState(shadow_max_age)
+        # Effects write frames straight to the bulbs at the write scheduler's rate
+        self.effects = EffectEngine(self.send_frame, on_finish=self.effect_finished)
+        self.frame_rate = max_write_rate
+        self.group_config = groups or {}
+        self.groups = resolve_members(self.group_config, self.devices)
+        self.dispatcher = GroupDispatcher(max(1, min(MAX_GROUP_WORKERS, max(map(len, self.groups.values()), default=1))))
+        # Automations fed straight from our own telemetry; actions go through handle_command
+        self.rules = RuleEngine(rules or {}, self.handle_command)
+        self.loop = None
+        self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.mqtt_client.on_connect = self.on_mqtt_connect
+        self.mqtt_client.on_disconnect = self.on_mqtt_disconnect
+        self.mqtt_client.on_message = self.on_mqtt_message
+        self.mqtt_client.will_set(GATEWAY_AVAILABILITY_TOPIC, "offline", retain=True)
+        self.pool.on_availability = self.on_availability
+        self.publisher = TelemetryPublisher(self.mqtt_client, deadbands={"power": power_deadband},
+                                            field_topics=field_topics, metrics=self.metrics)
+
+    # -- device I/O (runs on the worker pool) --
+
+    def read_status(self, device):
+        with device.lock:
+            dps = device.get_status()
+        self.shadow.update(device.topic_id, dps)
+        return dps
+
+    def current_status(self, device):
+        # Shadow state unless it has gone stale, plus values queued but not yet written
+        dps = self.shadow.read(device.topic_id, lambda: self.read_status(device))
+        return {**dps, **self.writes.pending_values(device.topic_id)}
+
+    def run_command(self, device, payload):
+        dps = device.helpers.command_values(lambda: self.current_status(device), payload)
+        if dps:
+            self.writes.submit(device.topic_id, dps)
+
+    def write_values(self, key, dps):
+        device = self.devices[key]
+        with device.lock:
+            result = device.tuya.set_multiple_values(dps)
+        if is_error(result):
+            log.warning("write failed: %s", result.get("Error"), extra={"device": key})
+            self.shadow.invalidate(key)
+            return False
+
+        # Publish the acknowledged values instead of reading the status straight back
+        ack = result.get("dps") if isinstance(result, dict) else None
+        self.shadow.update(key, ack or dps)
+        self.poke(key)
+        state = self.shadow.get(key)
+        if state:
+            self.publish_telemetry(device, state)
+        else:
+            self.publish_telemetry(device, self.read_status(device))
+        return True
+
+    def group_values(self, key, payload):
+        if not self.pool.available(key):
+            raise RuntimeError("offline")
+        device = self.devices[key]
+        return device.helpers.command_values(lambda: self.current_status(device), payload)
+
+    def group_command(self, name, payload):
+        # Work out every member's values first, then write them all at once
+        # Members still go through the write scheduler, so its per-device rate limit holds
+        report = self.dispatcher.run(name, self.groups[name], lambda key: self.group_values(key, payload),
+                                     self.writes.write_now)
+        report["command"] = payload
+        self.mqtt_client.publish(f"pi/group/{name}/report", json.dumps(report, separators=(",", ":")))
+        log.info("group %s: %s -> %d sent, %d failed, %d not applicable, spread %sms, total %sms", name, payload,
+                 report["sent"], len(report["failed"]), len(report["not_applicable"]), report["spread_ms"],
+                 report["total_ms"])
+
+    # -- effects --
+
+    def send_frame(self, key, dps):
+        # Frames are paced by the effect engine; the write scheduler still enforces the device's rate
+        return self.writes.write_now(key, dps, self.effect_frame)
+
+    def effect_frame(self, key, dps):
+        # One effect frame: no status read-back or telemetry, just keep the shadow current
+        device = self.devices[key]
+        with device.lock:
+            result = device.tuya.set_multiple_values(dps)
+        if is_error(result):
+            self.shadow.invalidate(key)
+            return False
+        ack = result.get("dps") if isinstance(result, dict) else None
+        self.shadow.update(key, ack or dps)
+        return True
+
+    def start_effect(self, label, keys, payload):
+        if payload.strip().lower() == "stop":
+            self.effects.stop(keys)
+            return
+        effects = {}
+        for key in keys:
+            if not self.pool.available(key):
+                continue
+            effect = parse_effect(payload, self.current_status(self.devices[key]), self.frame_rate)
+            if effect is None:
+                return
+            effects[key] = effect
+        if self.effects.start(label, effects):
+            for key in effects:
+                self.mqtt_client.publish(f"{self.devices[key].prefix}/effect/state", effects[key].name)
+            log.info("effect %s on %s", payload, ", ".join(effects))
+
+    def effect_finished(self, run):
+        for key in run.members:
+            device = self.devices[key]
+            self.mqtt_client.publish(f"{device.prefix}/effect/state", "none")
+            state = self.shadow.get(key)
+            if state:
+                self.publish_telemetry(device, state)
+
+    def refresh(self, device):
+        self.publish_telemetry(device, self.read_status(device), force=True)
+
+    def publish_telemetry(self, device, dps, force=False, record=False):
+        if not dps:
+            return []
+        fields = device.helpers.read_telemetry(dps)
+        meter = self.meters.get(device.topic_id)
+        if meter is not None:
+            if record:
+                meter.add(time.time(), fields["power"])
+                if self.history is not None:
+                    self.history.add(device.topic_id, fields)
+            fields["energy_today"] = round(meter.today(), 3)
+        payloads = device.helpers.format_telemetry(fields)
+        sent = self.publisher.publish(device.prefix, fields, payloads, force=force)
+        for field in sent:
+            self.rules.on_message(f"{device.prefix}/{field}", payloads[field])
+        return sent
+
+    # -- availability --
+
+    def on_availability(self, key, available):
+        # Called by the pool when a device's circuit breaker closes or opens
+        device = self.devices.get(key)
+        if device is None:
+            return
+        state = "online" if available else "offline"
+        log.log(logging.INFO if available else logging.WARNING, "%s", state, extra={"device": key})
+        self.mqtt_client.publish(f"{device.prefix}/availability", state, retain=True)
+
+    def seed_meters(self):
+        # Pick today's energy totals back up from recorded history after a restart
+        for key, meter in self.meters.items():
+            meter.seed_from(self.history, key)
+
+    # -- devices.json changes --
+
+    def on_registry_change(self, added, removed, reconnect, updated):
+        # Called on the registry's watch thread; device tasks belong to the event loop
+        self.loop.call_soon_threadsafe(self.apply_registry_change, added, removed, reconnect, updated)
+
+    def apply_registry_change(self, added, removed, reconnect, updated):
+        for entry in removed + reconnect:
+            self.remove_device(entry.key)
+        for entry in added + reconnect:
+            self.add_device(entry)
+        for entry in updated:
+            device = self.devices[entry.key]
+            device.update(entry.info)
+            self.scheduler.set_priority(entry.key, device.priority)
+            self.mqtt_client.publish(f"{device.prefix}/name", device.name, retain=True)
+        self.groups = resolve_members(self.group_config, self.devices)
+
+    def add_device(self, entry):
+        device = GatewayDevice(self.pool, entry.info, entry.kind, entry.key)
+        self.devices[device.topic_id] = device
+        if device.kind == "plug":
+            meter = self.meters[device.topic_id] = EnergyMeter()
+            if self.history is not None:
+                meter.seed_from(self.history, device.topic_id)
+        if self.listener is not None:
+            self.listener.add(device.topic_id)
+        elif not self.listen:
+            self.start_polling(device, 0)
+        self.mqtt_client.publish(f"{device.prefix}/name", device.name, retain=True)
+        log.info("added as %s", device.prefix, extra={"device": device.topic_id})
+
+    def remove_device(self, key):
+        device = self.devices.pop(key, None)
+        if device is None:
+            return
+        task = self.polls.pop(key, None)
+        if task is not None:
+            task.cancel()
+        if self.listener is not None:
+            self.listener.remove(key)
+        self.effects.stop([key])
+        self.scheduler.remove(key)
+        self.wakeups.pop(key, None)
+        self.meters.pop(key, None)
+        self.pool.remove(key)
+        self.mqtt_client.publish(f"{device.prefix}/availability", "offline", retain=True)
+        log.info("removed", extra={"device": key})
+
+    # -- polling --
+
+    def start_polling(self, device, offset):
+        task = asyncio.create_task(self.poll_device(device, offset))
+        self.polls[device.topic_id] = task
+        task.add_done_callback(self.poll_stopped)
+
+    def poll_stopped(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            log.error("polling stopped: %r", task.exception())
+
+    def poke(self, key):
+        # A command just went out: poll this device soon and wake its task
+        self.scheduler.poke(key)
+        wake = self.wakeups.get(key)
+        if wake is not None and self.loop is not None:
+            self.loop.call_soon_threadsafe(wake.set)
+
+    async def poll_device(self, device, offset):
+        key = device.topic_id
+        wake = self.wakeups[key] = asyncio.Event()
+        self.scheduler.add(key, device.priority, offset)
+        while True:
+            delay = self.scheduler.delay(key)
+            if delay > 0:
+                # Sleep until due, or until a poke brings the next poll forward
+                wake.clear()
+                try:
+                    await asyncio.wait_for(wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            dps = await self.loop.run_in_executor(self.executor, self.read_status, device)
+            changed = self.publish_telemetry(device, dps, record=True)
+            self.scheduler.record(key, changed=bool(changed), failed=not dps)
+
+    # -- push mode --
+
+    def on_device_update(self, key, dps):
+        self.shadow.update(key, dps)
+        device = self.devices.get(key)
+        if device:
+            self.publish_telemetry(device, dps, record=True)
+
+    async def listen_forever(self):
+        self.listener = PushListener(self.pool, self.on_device_update)
+        for key in self.devices:
+            self.listener.add(key)
+        self.listener.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.listener.stop()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        log.info("connecting to MQTT at %s:%s", MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+        self.mqtt_client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_KEEPALIVE)
+        self.mqtt_client.loop_start()
+        if self.history is not None:
+            self.seed_meters()
+            self.history.start()
+        if self.rules.rules:
+            log.info("running %d rules on %d topics", len(self.rules.rules), len(self.rules.topics()))
+            self.rules.start()
+        if self.registry is not None:
+            self.registry.watch(self.on_registry_change)
+        if self.metrics_port:
+            try:
+                port = self.metrics.serve(self.metrics_port)
+                log.info("metrics at http://127.0.0.1:%d/metrics", port)
+            except OSError as error:
+                log.error("can't serve metrics on port %s: %s", self.metrics_port, error)
+        if self.metrics_topic:
+            self.metrics.publish_every(self.mqtt_client, self.metrics_topic)
+        if self.discovery is not None:
+            try:
+                self.discovery.start()
+                log.info("listening for device beacons")
+            except OSError as error:
+                log.error("can't listen for device beacons: %s", error)
+                self.discovery = None
+
+        if self.listen:
+            log.info("listening for pushed updates from %d devices", len(self.devices))
+            main = self.listen_forever()
+        else:
+            # The push listener sends its own heartbeats; polling needs the pool's
+            self.pool.start_keepalive()
+            log.info("polling %d devices every %s-%ss (base %ss)", len(self.devices),
+                     self.scheduler.min_interval, self.scheduler.max_interval, self.poll_interval)
+            # Spread first polls across the interval so devices are not read in lock-step
+            spacing = self.poll_interval / max(1, len(self.devices))
+            for index, device in enumerate(list(self.devices.values())):
+                self.start_polling(device, index * spacing)
+            # Each device polls on its own task, added and removed as devices.json changes
+            main = asyncio.Event().wait()
+        try:
+            await main
+        finally:
+            for task in self.polls.values():
+                task.cancel()
+            if self.registry is not None:
+                self.registry.stop()
+            if self.discovery is not None:
+                self.discovery.stop()
+                log.info("discovery: %s", self.discovery.stats())
+            # A clean shutdown doesn't fire the Last Will, so say so ourselves
+            try:
+                self.mqtt_client.publish(GATEWAY_AVAILABILITY_TOPIC, "offline", retain=True).wait_for_publish(1)
+            except (RuntimeError, ValueError):
+                pass
+            self.mqtt_client.loop_stop()
+            self.mqtt_client.disconnect()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.dispatcher.shutdown()
+            self.effects.shutdown()
+            self.rules.stop()
+            self.metrics.stop()
+            self.pool.close()
+            if self.history is not None:
+                self.history.close()
+                log.info("history: %s", self.history.stats())
+            log.info("%s", self.pool.summary())
+            log.info("commands: %s", self.commands.stats())
+            log.info("writes: %s", self.writes.stats())
+            log.info("shadow: %s", self.shadow.stats())
+            breakers = {key: stats["breaker"] for key, stats in self.pool.stats().items()}
+            log.info("breakers: %s", breakers)
+            log.info("groups: %s", self.dispatcher.stats())
+            log.info("effects: %s", self.effects.stats())
+            if self.rules.rules:
+                log.info("rules: %s", self.rules.stats())
+            if not self.listen:
+                log.info("polling: %s", self.scheduler.stats())
+
+    # -- MQTT callbacks (run on paho's network thread, must not block) --
+
+    def on_mqtt_connect(self, client, userdata, flags, return_code, properties=None):
+        if return_code == 0:
+            log.info("connected to MQTT broker")
+            # The broker may have lost its retained state; resend everything next time
+            self.publisher.forget()
+            client.subscribe("pi/+/set")
+            client.subscribe("pi/+/refresh")
+            client.subscribe("pi/refresh")
+            client.subscribe("pi/group/+/set")
+            client.subscribe("pi/+/effect")
+            client.subscribe("pi/group/+/effect")
+            client.publish(GATEWAY_AVAILABILITY_TOPIC, "online", retain=True)
+            for device in self.devices.values():
+                client.publish(f"{device.prefix}/name", device.name, retain=True)
+                state = "online" if self.pool.available(device.topic_id) else "offline"
+                client.publish(f"{device.prefix}/availability", state, retain=True)
+        else:
+            log.error("MQTT connection failed: %s", return_code)
+
+    def on_mqtt_disconnect(self, client, userdata, flags, reason_code, properties=None):
+        log.warning("disconnected from MQTT: %s", reason_code)
+
+    def on_mqtt_message(self, client, userdata, message):
+        started = time.perf_counter()
+        try:
+            self.handle_command(message.topic, message.payload.decode("utf-8"))
+        except Exception as error:
+            self.mqtt_errors.inc()
+            log.error("error handling %s: %s", message.topic, error)
+        self.mqtt_seconds.observe(time.perf_counter() - started)
+
+    def handle_command(self, topic, payload):
+        # Commands from MQTT and from rule actions; only queues work, never blocks
+        if topic == "pi/refresh":
+            for device in self.devices.values():
+                if self.pool.available(device.topic_id):
+                    self.commands.submit(device.topic_id, "refresh", self.refresh, device)
+            return
+
+        parts = topic.split("/")
+        if len(parts) == 4 and parts[1] == "group" and parts[3] in ("set", "effect"):
+            members = self.groups.get(parts[2])
+            if members is None:
+                return
+            if parts[3] == "effect":
+                lights = [key for key in members if self.devices[key].kind == "light"]
+                self.commands.submit(f"group/{parts[2]}", "effect", self.start_effect,
+                                     f"group/{parts[2]}", lights, payload)
+                return
+            # A plain command takes over from any effect playing on the members
+            self.effects.stop(members)
+            # Group commands queue like a device of their own, so repeats still coalesce
+            self.commands.submit(f"group/{parts[2]}", coalesce_key(payload), self.group_command,
+                                 parts[2], payload)
+            return
+
+        device = self.devices.get(parts[1]) if len(parts) == 3 else None
+        if device is None:
+            return
+
+        if not self.pool.available(device.topic_id):
+            # Breaker is open: the command would only be refused by the pool
+            log.warning("offline, dropped %s", payload, extra={"device": device.topic_id})
+        elif parts[2] == "refresh" or payload.lower() == "refresh":
+            self.commands.submit(device.topic_id, "refresh", self.refresh, device)
+        elif parts[2] == "effect":
+            if device.kind == "light":
+                self.commands.submit(device.topic_id, "effect", self.start_effect,
+                                     device.topic_id, [device.topic_id], payload)
+        elif parts[2] == "set":
+            self.effects.stop([device.topic_id])
+            self.commands.submit(device.topic_id, coalesce_key(payload), self.run_command, device, payload)
+
+
+def main():
+    global MQTT_BROKER_HOST, MQTT_BROKER_PORT
+    parser = argparse.ArgumentParser(description="Poll every device in devices.json over one MQTT connection")
+    parser.add_argument("--devices", default=DEVICES_FILE, help="path to devices.json")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="starting poll interval in seconds")
+    parser.add_argument("--min-interval", type=float, default=MIN_INTERVAL,
+                        help="poll interval right after a change or command")
+    parser.add_argument("--max-interval", type=float, default=MAX_INTERVAL,
+                        help="longest poll interval for a device whose values are not changing")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="max concurrent device calls")
+    parser.add_argument("--listen", action="store_true", help="publish pushed device updates instead of polling")
+    parser.add_argument("--power-deadband", type=float, default=POWER_DEADBAND,
+                        help="smallest plug power change (W) worth publishing")
+    parser.add_argument("--max-write-rate", type=float, default=MAX_WRITE_RATE,
+                        help="most write frames per second sent to one device")
+    parser.add_argument("--shadow-max-age", type=float, default=SHADOW_MAX_AGE,
+                        help="seconds cached state may replace a status read on the command path")
+    parser.add_argument("--no-field-topics", action="store_true",
+                        help="publish only pi/<device>/state/json, not one topic per field")
+    parser.add_argument("--history", default=DB_FILE, help="SQLite file for plug telemetry history")
+    parser.add_argument("--no-history", action="store_true", help="don't record plug telemetry history")
+    parser.add_argument("--groups", default=GROUPS_FILE, help="path to groups.json (pi/group/<name>/set)")
+    parser.add_argument("--rules", default=RULES_FILE, help="path to rules.json (automations)")
+    parser.add_argument("--discover", action="store_true",
+                        help="follow devices to new IP addresses from their UDP beacons")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve Prometheus metrics on 127.0.0.1:<port>/metrics (0 = off)")
+    parser.add_argument("--metrics-mqtt", action="store_true",
+                        help=f"also publish a JSON metrics snapshot to {METRICS_TOPIC} every {PUBLISH_INTERVAL}s")
+    parser.add_argument("--broker", default=f"{MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}", help="MQTT broker host[:port]")
+    parser.add_argument("--log-level", default=LOG_LEVEL, help="DEBUG, INFO, WARNING or ERROR")
+    parser.add_argument("--device-log-level", action="append", metavar="DEVICE=LEVEL",
+                        help="log level for one device (topic id), e.g. light1=DEBUG; repeatable")
+    parser.add_argument("--log-format", choices=("auto", "json", "text"), default="auto",
+                        help="JSON lines, or text; auto picks text on a terminal")
+    parser.add_argument("--log-file", help="also write logs to this file (rotated at 1 MB)")
+    args = parser.parse_args()
+    try:
+        setup_logging(args.log_level, args.log_format, args.log_file, parse_levels(args.device_log_level))
+    except ValueError as error:
+        parser.error(str(error))
+    host, _, port = args.broker.partition(":")
+    MQTT_BROKER_HOST, MQTT_BROKER_PORT = host, int(port or MQTT_BROKER_PORT)
+
+    metrics = Metrics()
+    pool = DevicePool(metrics=metrics)
+    registry = DeviceRegistry(args.devices)
+    gateway = Gateway(pool, load_devices(registry, pool), max_workers=args.workers,
+                      poll_interval=args.interval, listen=args.listen, power_deadband=args.power_deadband,
+                      field_topics=not args.no_field_topics, max_write_rate=args.max_write_rate,
+                      shadow_max_age=args.shadow_max_age, groups=load_groups(args.groups),
+                      min_interval=args.min_interval, max_interval=args.max_interval,
+                      history=None if args.no_history else TimeSeriesStore(args.history),
+                      rules=load_rules(args.rules), registry=registry,
+                      discovery=Discovery(registry) if args.discover else None, metrics=metrics,
+                      metrics_port=args.metrics_port, metrics_topic=METRICS_TOPIC if args.metrics_mqtt else None)
+    try:
+        asyncio.run(gateway.run())
+    except KeyboardInterrupt:
+        log.info("gateway stopped")
+
+
+if __name__ == "__main__":
+    main()
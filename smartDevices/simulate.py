@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils.simulator import Simulator, NETWORK, PUSH_INTERVAL
+from utils.pool import TUYA_PORT
+
+STATS_INTERVAL = 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve virtual Tuya bulbs and plugs on loopback addresses")
+    parser.add_argument("--lights", type=int, default=1, help="number of virtual bulbs (DPS 20-24)")
+    parser.add_argument("--plugs", type=int, default=1, help="number of virtual metering plugs (DPS 1, 18-20)")
+    parser.add_argument("--version", choices=("3.3", "3.4", "mixed"), default="3.3",
+                        help="protocol version; mixed alternates 3.3 and 3.4")
+    parser.add_argument("--network", default=NETWORK, help="addresses to listen on, one per device")
+    parser.add_argument("--port", type=int, default=TUYA_PORT, help="TCP port every device listens on")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added before every reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds, at random")
+    parser.add_argument("--loss", type=float, default=0.0, help="chance (0-1) a frame is dropped unanswered")
+    parser.add_argument("--push-interval", type=float, default=PUSH_INTERVAL,
+                        help="seconds between unsolicited metering pushes from each plug (0 = never)")
+    parser.add_argument("--no-push-changes", action="store_true",
+                        help="don't push a device's changes to its other connected clients")
+    parser.add_argument("--beacons", type=int, metavar="PORT", help="broadcast UDP beacons to this port (6667)")
+    parser.add_argument("--write", metavar="PATH", help="write a devices.json for the virtual devices here")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL, help="seconds between stats lines")
+    args = parser.parse_args()
+    if args.lights + args.plugs < 1:
+        parser.error("nothing to simulate")
+
+    simulator = Simulator.create(args.lights, args.plugs, network=args.network, port=args.port,
+                                 version=args.version, beacon_port=args.beacons, latency=args.latency,
+                                 jitter=args.jitter, loss=args.loss, push_interval=args.push_interval or None,
+                                 push_changes=not args.no_push_changes)
+    simulator.start()
+    if args.write:
+        with open(args.write, "w") as f:
+            json.dump(simulator.entries(), f, indent=2)
+        print(f"Wrote {len(simulator.devices)} devices to {args.write}")
+    first, last = simulator.devices[0], simulator.devices[-1]
+    print(f"Serving {args.lights} lights and {args.plugs} plugs on {first.ip}-{last.ip}:{first.port}")
+    try:
+        while True:
+            time.sleep(args.stats_interval)
+            print(simulator.stats())
+    except KeyboardInterrupt:
+        simulator.stop()
+        print("\nSimulator stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from utils.pool import DevicePool, is_error
+
+
+class DeadDevice:
+    # Fails every call like an unplugged bulb, counting how often it was tried
+    socket = None
+
+    def __init__(self):
+        self.calls = 0
+        self.alive = False
+
+    def set_socketPersistent(self, persist):
+        pass
+
+    def set_socketRetryLimit(self, limit):
+        pass
+
+    def close(self):
+        pass
+
+    def status(self):
+        self.calls += 1
+        return {"dps": {"20": True}} if self.alive else {"Error": "Network Error: Device Unreachable"}
+
+    def heartbeat(self, nowait=False):
+        self.calls += 1
+        return None if self.alive else {"Error": "Network Error: Device Unreachable"}
+
+
+def test_breaker_opens_after_threshold_and_half_opens():
+    changes = []
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05, on_change=changes.append)
+    breaker.failure()
+    assert breaker.state == CLOSED
+    breaker.failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.success()
+    assert changes == [OPEN, HALF_OPEN, CLOSED]
+
+
+def test_failed_probe_doubles_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, reset_timeout_max=1)
+    breaker.failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert 0.05 < breaker.retry_at - time.monotonic() <= 0.1
+
+
+def test_pool_skips_open_device_and_reports_availability():
+    pool = DevicePool(backoff_base=0.05, failure_threshold=2)
+    availability = []
+    pool.on_availability = lambda key, available: availability.append((key, available))
+    device = DeadDevice()
+    bulb = pool.add("light1", device)
+
+    for _ in range(10):
+        assert is_error(bulb.status())
+    assert device.calls == 2
+    assert availability == [("light1", False)]
+
+    device.alive = True
+    time.sleep(0.06)
+    assert pool.probe_due("light1")
+    pool.keepalive()
+    assert pool.available("light1")
+    assert availability == [("light1", False), ("light1", True)]
+    assert bulb.status() == {"dps": {"20": True}}
@@ -0,0 +1,84 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.commands import CommandQueue, WriteScheduler, coalesce_key
+
+
+def test_coalesce_key():
+    assert coalesce_key("on") == coalesce_key("OFF") == "power"
+    assert coalesce_key("brightness:40") == "brightness"
+    assert coalesce_key("toggle") is None
+
+
+def test_queued_commands_coalesce_last_write_wins():
+    ran = []
+    started, gate = threading.Event(), threading.Event()
+
+    def busy():
+        started.set()
+        gate.wait(2)
+
+    commands = CommandQueue(max_workers=1)
+    # Hold the device's worker so the rest stay queued
+    commands.submit("light1", None, busy)
+    assert started.wait(2)
+    for payload in ("brightness:10", "toggle", "on", "toggle", "brightness:20", "off"):
+        commands.submit("light1", coalesce_key(payload), ran.append, payload)
+    assert commands.depth("light1") == 4
+    gate.set()
+    commands.executor.shutdown(wait=True)
+
+    assert ran == ["toggle", "toggle", "brightness:20", "off"]
+    assert commands.stats() == {"submitted": 7, "executed": 5, "dropped": 2, "failed": 0, "queued": 0}
+
+
+def test_failed_command_is_counted_and_the_queue_carries_on():
+    ran = []
+
+    def broken():
+        raise ConnectionError("Device Unreachable")
+
+    commands = CommandQueue(max_workers=1)
+    commands.submit("plug1", None, broken)
+    commands.submit("plug1", None, ran.append, "on")
+    commands.executor.shutdown(wait=True)
+    assert ran == ["on"]
+    stats = commands.stats()
+    assert stats["failed"] == 1 and stats["executed"] == 1
+
+
+def test_rate_limit_does_not_hold_a_worker():
+    written = []
+    done = threading.Event()
+
+    def write(device, dps):
+        written.append((device, dps, time.monotonic()))
+        if len(written) == 3:
+            done.set()
+
+    # One worker: a rate-limited device must not keep it asleep
+    writes = WriteScheduler(write, max_rate=5, max_workers=1)
+    writes.submit("light1", {'22': 100})
+    time.sleep(0.02)
+    writes.submit("light1", {'22': 200})
+    writes.submit("light2", {'20': True})
+    assert done.wait(2)
+
+    order = [device for device, _, _ in written]
+    assert order == ["light1", "light2", "light1"]
+    light1 = [at for device, _, at in written if device == "light1"]
+    assert light1[1] - light1[0] >= 0.19
+    assert writes.stats()["writes"] == 3
+
+
+def test_write_now_shares_the_rate_limit():
+    written = []
+    writes = WriteScheduler(lambda device, dps: written.append(time.monotonic()), max_rate=10, max_workers=1)
+    frames = []
+    for _ in range(3):
+        writes.write_now("light1", {'24': "000003e803e8"}, lambda device, dps: frames.append(time.monotonic()))
+    assert frames[2] - frames[0] >= 0.19
+    assert writes.stats()["writes"] == 3 and writes.write_rate() > 0
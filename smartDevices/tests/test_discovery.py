@@ -0,0 +1,83 @@
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+import tinytuya
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.discovery import Discovery, decode_beacon, scan
+from utils.registry import DeviceRegistry
+
+
+def beacon(device_id, ip, version="3.3", encrypted=True):
+    # What a bulb broadcasts on 6667 (encrypted) or 6666 (plain)
+    payload = json.dumps({"ip": ip, "gwId": device_id, "active": 2, "encrypt": encrypted,
+                          "productKey": "keyabc", "version": version}).encode()
+    if encrypted:
+        payload = tinytuya.AESCipher(tinytuya.udpkey).encrypt(payload, False)
+    message = tinytuya.TuyaMessage(0, 0x13, 0, struct.pack(">I", 0) + payload, 0, True, tinytuya.PREFIX_55AA_VALUE)
+    return tinytuya.pack_message(message)
+
+
+def test_decode_beacon():
+    assert decode_beacon(beacon("bf01", "10.0.0.5"))["ip"] == "10.0.0.5"
+    assert decode_beacon(beacon("bf01", "10.0.0.5", encrypted=False))["gwId"] == "bf01"
+    assert decode_beacon(b"not a beacon") is None
+
+
+def test_beacons_move_registry_devices(tmp_path):
+    path = tmp_path / "devices.json"
+    path.write_text(json.dumps([
+        {"name": "Ceiling", "id": "bf01", "ip": "192.168.1.10", "key": "k1", "type": "light", "version": 3.3},
+        {"name": "Heater", "id": "bf02", "ip": "192.168.1.11", "key": "k2"},
+    ]))
+    registry = DeviceRegistry(str(path))
+    moved = threading.Event()
+    changes = []
+
+    def on_change(added, removed, reconnect, updated):
+        changes.append([entry.key for entry in reconnect])
+        moved.set()
+
+    registry.listeners.append(on_change)
+    discovery = Discovery(registry, ports=(0,), bind="127.0.0.1")
+    port = discovery.open()[0]
+    discovery.start()
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            sender.sendto(beacon("bf02", "192.168.1.11", version="3.3"), ("127.0.0.1", port))
+            sender.sendto(beacon("bf01", "192.168.1.10", version="3.3"), ("127.0.0.1", port))
+            sender.sendto(beacon("bf01", "192.168.1.57", version="3.3"), ("127.0.0.1", port))
+            sender.sendto(beacon("ffff", "192.168.1.99"), ("127.0.0.1", port))
+            assert moved.wait(2)
+            deadline = time.time() + 2
+            while discovery.stats()["beacons"] < 4 and time.time() < deadline:
+                time.sleep(0.01)
+    finally:
+        discovery.stop()
+
+    # Heater's version came from the beacon but its address didn't change: nothing to reconnect
+    assert ["light1"] in changes
+    assert registry.find("bf01").info["ip"] == "192.168.1.57"
+    assert registry.find("192.168.1.57").name == "Ceiling"
+    assert discovery.address("ffff")["ip"] == "192.168.1.99"
+    assert discovery.stats()["beacons"] == 4
+
+
+def test_parallel_scan_finds_listening_hosts():
+    servers = [socket.create_server(("127.0.0.2", 0))]
+    port = servers[0].getsockname()[1]
+    servers.append(socket.create_server(("127.0.0.5", port)))
+    try:
+        assert scan("127.0.0.0/29", port=port) == ["127.0.0.2", "127.0.0.5"]
+        started = time.monotonic()
+        scan("127.0.1.0/24", port=port)
+        # 254 hosts probed at once, not one after another
+        assert time.monotonic() - started < 2
+    finally:
+        for server in servers:
+            server.close()
@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils import effects
+from utils.hsv import decode_hsv_hex
+
+
+class Recorder:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.frames = {}
+        self.times = {}
+
+    def send(self, device, dps):
+        with self.lock:
+            self.frames.setdefault(device, []).append(dps)
+            self.times.setdefault(device, []).append(time.monotonic())
+        time.sleep(self.delay)
+
+
+def play(engine, label, devices, timeout=5):
+    done = threading.Event()
+    engine.on_finish = lambda run: done.set()
+    run = engine.start(label, devices)
+    assert done.wait(timeout)
+    return run
+
+
+def test_fade_takes_short_way_round_and_ends_on_target():
+    effect = effects.fade((350, 1000, 1000), (10, 1000, 500), duration=1, frame_rate=10)
+    hues = [decode_hsv_hex(frame['24'])[0] for frame in effect.frames]
+
+    assert len(effect) == 10
+    assert hues[-1] == 10 and all(h >= 350 or h <= 10 for h in hues)
+    assert decode_hsv_hex(effect.frames[-1]['24'])[2] == 500
+    assert effect.frame(0)['21'] == 'colour' and effect.frame(0)['20'] is True
+    assert effect.frame(10) is None
+
+
+def test_looping_effects_and_parse():
+    status = {'20': True, '21': 'colour', '24': '007803e803e8'}
+    breathe = effects.parse_effect("breathe:2", status, frame_rate=10)
+    values = [decode_hsv_hex(frame['24'])[2] for frame in breathe.frames]
+
+    assert breathe.loop and len(breathe) == 20
+    assert max(values) == 1000 and min(values) == effects.MIN_VALUE
+    assert breathe.frame(20) == breathe.frames[0]
+    assert effects.parse_effect("fade:off:1", status, 10).frame(9)['20'] is False
+    assert effects.parse_effect("sunrise:10", status, 10).frame(99)['21'] == 'white'
+    assert effects.parse_effect("sparkle", status) is None
+    assert effects.parse_effect("fade:1,2", status) is None
+
+
+def test_frames_go_out_on_a_steady_timer():
+    recorder = Recorder()
+    engine = effects.EffectEngine(recorder.send)
+    fade = effects.fade((0, 1000, 100), (0, 1000, 1000), duration=0.5, frame_rate=40)
+    started = time.monotonic()
+    play(engine, "bulb", {"light1": fade})
+
+    sent = recorder.frames["light1"]
+    assert [frame['24'] for frame in sent] == [frame['24'] for frame in fade.frames]
+    # Frame n is sent at start + n/40 without drift piling up
+    times = recorder.times["light1"]
+    assert abs((times[-1] - started) - 19 / 40) < 0.05
+    assert engine.stats()["frames_dropped"] == 0
+
+
+def test_slow_device_drops_frames_but_gets_the_last_one():
+    slow, fast = Recorder(delay=0.06), Recorder()
+    engine = effects.EffectEngine(lambda device, dps: (slow if device == "slow" else fast).send(device, dps))
+    effect = effects.fade((0, 1000, 100), (120, 1000, 1000), duration=0.5, frame_rate=40)
+    started = time.monotonic()
+    play(engine, "group", {"slow": effect, "fast": effect})
+
+    assert len(fast.frames["fast"]) == 20
+    # A backlog would take 20 x 60ms; dropping keeps the slow bulb close to schedule
+    assert len(slow.frames["slow"]) < 12
+    assert time.monotonic() - started < 0.8
+    assert slow.frames["slow"][0]['21'] == 'colour'
+    assert slow.frames["slow"][-1]['24'] == effect.frames[-1]['24']
+    assert engine.stats()["frames_dropped"] > 0
+
+
+def test_stop_ends_a_looping_effect():
+    recorder = Recorder()
+    finished = []
+    engine = effects.EffectEngine(recorder.send, on_finish=lambda run: finished.append(run.reason))
+    engine.start("light1", {"light1": effects.cycle(period=1, frame_rate=50)})
+    time.sleep(0.1)
+
+    assert engine.running("light1") == "cycle"
+    assert engine.stop(["light1"]) == ["light1"]
+    time.sleep(0.05)
+    count = len(recorder.frames["light1"])
+    time.sleep(0.1)
+
+    assert len(recorder.frames["light1"]) == count
+    assert finished == ["stopped"] and engine.running("light1") is None
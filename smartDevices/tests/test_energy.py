@@ -0,0 +1,132 @@
+import os
+import random
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils import energy
+from utils.energy import EnergyMeter, energy_by_hour, energy_by_period, integrate
+
+
+def local(year, month, day, hour, minute=0, second=0):
+    return time.mktime((year, month, day, hour, minute, second, 0, 0, -1))
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        if energy.np is None:
+            pytest.skip("numpy not installed")
+    else:
+        monkeypatch.setattr(energy, "np", None)
+    return request.param
+
+
+def test_constant_power(backend):
+    start = local(2024, 3, 5, 12)
+    ts = [start + i for i in range(3601)]
+    assert integrate(ts, [100.0] * len(ts)) == pytest.approx(100.0)
+
+
+def test_ramp_with_irregular_samples(backend):
+    # 0 -> 1000 W over one hour is exactly 500 Wh; the trapezoid rule is exact for lines
+    start = local(2024, 3, 5, 12)
+    rng = random.Random(4)
+    offsets = sorted({0, 3600, *(rng.uniform(0, 3600) for _ in range(500))})
+    ts = [start + offset for offset in offsets]
+    watts = [offset / 3600 * 1000 for offset in offsets]
+    pairs = list(zip(ts, watts))
+    rng.shuffle(pairs)
+    ts, watts = zip(*pairs)
+    assert integrate(list(ts), list(watts), max_gap=3600) == pytest.approx(500.0)
+
+
+def test_gaps_are_not_integrated(backend):
+    start = local(2024, 3, 5, 12)
+    ts = [start, start + 60, start + 60 + 600, start + 720]
+    # 60 s at 60 W, a 10 minute hole, then 60 s at 60 W
+    assert integrate(ts, [60.0] * 4, max_gap=300) == pytest.approx(2.0)
+
+
+def test_interval_split_at_hour_boundary(backend):
+    start = local(2024, 3, 5, 12, 59)
+    hours, wh = energy_by_hour([start, start + 120], [0.0, 120.0], max_gap=300)
+    # Power crosses 60 W at the boundary: 0.5 Wh before, 1.5 Wh after
+    assert hours == [local(2024, 3, 5, 12), local(2024, 3, 5, 13)]
+    assert wh == pytest.approx([0.5, 1.5])
+
+
+def test_day_and_tariff_totals(backend):
+    start = local(2024, 3, 5, 6)
+    ts = [start + i * 60 for i in range(int(26 * 60) + 1)]
+    totals = energy_by_period(ts, [1000.0] * len(ts), tariffs={"peak": ((7, 10), (17, 20))})
+    assert totals[("2024-03-05", "peak")] == pytest.approx(6000.0)
+    assert totals[("2024-03-05", "offpeak")] == pytest.approx(12000.0)
+    assert totals[("2024-03-06", "peak")] == pytest.approx(1000.0)
+    assert totals[("2024-03-06", "offpeak")] == pytest.approx(7000.0)
+
+
+def test_backends_agree(monkeypatch):
+    if energy.np is None:
+        pytest.skip("numpy not installed")
+    rng = random.Random(1)
+    start = local(2024, 3, 5, 0)
+    ts, t = [], start
+    for _ in range(20000):
+        t += rng.choice([1, 2, 2, 5, 30, 400])
+        ts.append(t)
+    watts = [rng.uniform(0, 2000) for _ in ts]
+
+    fast = energy_by_hour(ts, watts)
+    monkeypatch.setattr(energy, "np", None)
+    slow = energy_by_hour(ts, watts)
+    assert fast[0] == slow[0]
+    assert fast[1] == pytest.approx(slow[1])
+
+
+def test_duplicate_timestamps_agree(monkeypatch):
+    if energy.np is None:
+        pytest.skip("numpy not installed")
+    start = local(2024, 3, 5, 0)
+    # Repeated samples at one instant, alone in their hour and next to real intervals
+    ts = [start + 100, start + 100, start + 3600 + 50, start + 3600 + 50, start + 3600 + 60, start + 3600 + 60]
+    watts = [10.0, 20.0, 30.0, 30.0, 40.0, 40.0]
+
+    fast = energy_by_hour(ts, watts)
+    monkeypatch.setattr(energy, "np", None)
+    slow = energy_by_hour(ts, watts)
+    assert fast[0] == slow[0] == [start + 3600]
+    assert fast[1] == pytest.approx(slow[1])
+
+
+def test_meter_resets_at_midnight(backend):
+    meter = EnergyMeter()
+    t = local(2024, 3, 5, 23, 58)
+    for i in range(5):
+        meter.add(t + i * 60, 600.0)
+    # 23:58 -> 00:00 is 20 Wh yesterday, 00:00 -> 00:02 is 20 Wh today
+    assert meter.day == "2024-03-06"
+    assert meter.today() == pytest.approx(0.02)
+    assert meter.total_wh == pytest.approx(40.0)
+
+
+def test_meter_seeds_today_from_history(tmp_path):
+    from utils.timeseries import TimeSeriesStore
+
+    store = TimeSeriesStore(str(tmp_path / "t.db"))
+    midnight = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+    # Stay clear of the query's [start, now) end at millisecond resolution
+    now = time.time() - 1
+    # 200 W since midnight (or the last 10 minutes, just after midnight)
+    start = max(midnight, now - 600)
+    samples = int((now - start) // 10)
+    for i in range(samples + 1):
+        store.add("plug1", {"power": 200.0}, ts=start + i * 10)
+    store.flush()
+
+    meter = EnergyMeter()
+    meter.seed_from(store, "plug1")
+    assert meter.today() == pytest.approx(200 * samples * 10 / 3600 / 1000)
+    store.close()
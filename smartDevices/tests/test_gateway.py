@@ -0,0 +1,121 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from gateway import Gateway, GatewayDevice
+
+
+class FakeTuya:
+    def __init__(self, dps):
+        self.dps = dps
+        self.reads = 0
+
+    def status(self):
+        self.reads += 1
+        return {"dps": dict(self.dps)}
+
+
+class FakePool:
+    # Just enough of DevicePool for routing: devices open instantly, some can be offline
+    def __init__(self, dps, offline=()):
+        self.dps = dps
+        self.offline = set(offline)
+        self.devices = {}
+
+    def open(self, key, kind, info):
+        self.devices[key] = FakeTuya(self.dps[kind])
+        return self.devices[key]
+
+    def available(self, key):
+        return key not in self.offline
+
+
+class FakeClient:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, payload, retain=False):
+        self.messages.append((topic, payload, retain))
+
+
+class RecordingQueue:
+    # Stands in for CommandQueue: records what would run, runs it on demand
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, device, key, fn, *args):
+        self.submitted.append((device, key, fn.__name__, args))
+
+    def run(self, gateway):
+        for _, _, name, args in self.submitted:
+            getattr(gateway, name)(*args)
+
+
+def make_gateway(offline=()):
+    pool = FakePool({"light": {'20': True, '22': 500}, "plug": {'1': True, '19': 1200}}, offline)
+    devices = [GatewayDevice(pool, {"name": "Ceiling"}, "light", "light1"),
+               GatewayDevice(pool, {"name": "Desk Lamp"}, "light", "light2"),
+               GatewayDevice(pool, {"name": "Heater"}, "plug", "plug1")]
+    gateway = Gateway(pool, devices, groups={"lounge": ["light1", "Desk Lamp", "plug1"]})
+    gateway.mqtt_client = gateway.publisher.client = FakeClient()
+    gateway.commands = RecordingQueue()
+    return gateway
+
+
+def routed(gateway):
+    return [(device, key, name) for device, key, name, _ in gateway.commands.submitted]
+
+
+def test_device_topics_are_routed():
+    gateway = make_gateway()
+    gateway.handle_command("pi/light1/set", "brightness:40")
+    gateway.handle_command("pi/plug1/set", "on")
+    gateway.handle_command("pi/light2/refresh", "")
+    gateway.handle_command("pi/light1/effect", "breathe")
+    # Effects only play on lights
+    gateway.handle_command("pi/plug1/effect", "breathe")
+    assert routed(gateway) == [
+        ("light1", "brightness", "run_command"),
+        ("plug1", "power", "run_command"),
+        ("light2", "refresh", "refresh"),
+        ("light1", "effect", "start_effect"),
+    ]
+    device, payload = gateway.commands.submitted[0][3]
+    assert device is gateway.devices["light1"] and payload == "brightness:40"
+
+
+def test_group_topics_are_routed():
+    gateway = make_gateway()
+    gateway.handle_command("pi/group/lounge/set", "off")
+    gateway.handle_command("pi/group/lounge/effect", "breathe")
+    assert routed(gateway) == [
+        ("group/lounge", "power", "group_command"),
+        ("group/lounge", "effect", "start_effect"),
+    ]
+    assert gateway.commands.submitted[0][3] == ("lounge", "off")
+    # Members resolved by name; the plug is left out of the effect
+    assert gateway.groups["lounge"] == ["light1", "light2", "plug1"]
+    assert gateway.commands.submitted[1][3] == ("group/lounge", ["light1", "light2"], "breathe")
+
+
+def test_unknown_and_offline_targets_are_dropped():
+    gateway = make_gateway(offline=["light2"])
+    for topic in ("pi/nope/set", "pi/group/nope/set", "pi/group/nope/effect", "pi/light1/unknown",
+                  "pi/light1/set/extra", "pi/light2/set"):
+        gateway.handle_command(topic, "on")
+    assert gateway.commands.submitted == []
+
+
+def test_refresh_fans_out_to_available_devices():
+    gateway = make_gateway(offline=["light2"])
+    gateway.handle_command("pi/refresh", "")
+    assert routed(gateway) == [("light1", "refresh", "refresh"), ("plug1", "refresh", "refresh")]
+
+    gateway.commands.run(gateway)
+    topics = [topic for topic, _, _ in gateway.mqtt_client.messages]
+    assert "pi/light1/state/json" in topics and "pi/plug1/power" in topics
+    assert not any(topic.startswith("pi/light2/") for topic in topics)
+    # A refresh reads the device and republishes everything, changed or not
+    gateway.commands.run(gateway)
+    assert gateway.pool.devices["plug1"].reads == 2
+    assert [topic for topic, _, _ in gateway.mqtt_client.messages].count("pi/plug1/power") == 2
@@ -0,0 +1,110 @@
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.groups import GroupDispatcher, load_groups, resolve_members
+
+
+class Named:
+    def __init__(self, name):
+        self.name = name
+
+
+def test_load_and_resolve_groups(tmp_path):
+    path = tmp_path / "groups.json"
+    path.write_text(json.dumps({"lounge": ["light1", "Desk Lamp", "nope", "light1"]}))
+    devices = {"light1": Named("Ceiling"), "light2": Named("Desk Lamp")}
+
+    assert resolve_members(load_groups(str(path)), devices) == {"lounge": ["light1", "light2"]}
+    assert load_groups(str(tmp_path / "missing.json")) == {}
+
+
+def test_members_are_written_together():
+    members = [f"light{i}" for i in range(20)]
+    started = {}
+    lock = threading.Lock()
+
+    def send(member, values):
+        with lock:
+            started[member] = time.monotonic()
+        time.sleep(0.05)
+
+    dispatcher = GroupDispatcher(max_workers=20)
+    report = dispatcher.run("room", members, lambda member: {'20': False}, send)
+
+    assert report["sent"] == 20 and report["failed"] == []
+    # Sequential writes would take 20 x 50ms; all start inside one window
+    assert max(started.values()) - min(started.values()) < 0.04
+    assert all(result["latency_ms"] >= 50 for result in report["members"].values())
+
+
+def test_report_failures_and_skips():
+    def prepare(member):
+        if member == "bad_read":
+            raise OSError("offline")
+        if member == "plug":
+            return None
+        return {} if member == "same" else {'1': True}
+
+    def send(member, values):
+        if member == "bad_write":
+            return False
+
+    dispatcher = GroupDispatcher(max_workers=2)
+    report = dispatcher.run("mixed", ["ok", "same", "plug", "bad_read", "bad_write", "ok2"], prepare, send)
+
+    assert sorted(report["failed"]) == ["bad_read", "bad_write"]
+    assert report["members"]["same"] == {"ok": True, "latency_ms": 0.0, "skipped": True}
+    assert report["members"]["plug"] == {"ok": False, "latency_ms": None, "not_applicable": True}
+    assert report["not_applicable"] == ["plug"]
+    assert report["members"]["bad_read"]["error"] == "offline"
+    assert report["sent"] == 3
+    assert dispatcher.stats() == {"dispatched": 1, "member_failures": 2}
+
+
+def test_concurrent_groups_do_not_deadlock():
+    dispatcher = GroupDispatcher(max_workers=4, barrier_timeout=2)
+    reports = []
+
+    def fire(index):
+        members = [f"g{index}_light{i}" for i in range(4)]
+        reports.append(dispatcher.run(f"group{index}", members, lambda member: {'20': True},
+                                      lambda member, values: time.sleep(0.01)))
+
+    threads = [threading.Thread(target=fire, args=(index,), daemon=True) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(reports) == 6 and all(report["failed"] == [] for report in reports)
+    dispatcher.shutdown()
+
+
+def test_broken_barrier_counts_as_failed_member():
+    dispatcher = GroupDispatcher(max_workers=2, barrier_timeout=0.05)
+    sent = []
+    # A wave of two where the other member never arrives
+    start, end, ok, error = dispatcher._send(threading.Barrier(2), lambda member, values: sent.append(member),
+                                             "light1", {'20': True})
+    assert (start, ok, error) == (None, False, "barrier broken") and sent == []
+    dispatcher.shutdown()
+
+
+def test_broken_barrier_member_is_not_counted_as_sent():
+    dispatcher = GroupDispatcher(max_workers=4)
+    send_member = dispatcher._send
+
+    def send_or_break(barrier, send, member, values):
+        if member == "light2":
+            barrier.abort()
+        return send_member(barrier, send, member, values)
+
+    dispatcher._send = send_or_break
+    report = dispatcher.run("lounge", ["light1", "light2"], lambda member: {'20': True}, lambda member, values: None)
+    assert report["sent"] == 0
+    assert sorted(report["failed"]) == ["light1", "light2"]
+    dispatcher.shutdown()
@@ -0,0 +1,59 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils import hsv
+from utils.hsv import (decode_hsv_hex, encode_hsv_hex, hsv_to_rgb_hex, decode_hsv_hex_batch,
+                       encode_hsv_hex_batch, hsv_to_rgb_batch, hsv_hex_to_rgb_hex_batch)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        if hsv.np is None:
+            pytest.skip("numpy not installed")
+    else:
+        monkeypatch.setattr(hsv, "np", None)
+    return request.param
+
+
+def random_colours(count, seed=7):
+    rng = random.Random(seed)
+    return [encode_hsv_hex(rng.randrange(360), rng.randrange(1001), rng.randrange(1001)) for _ in range(count)]
+
+
+def test_batch_matches_single_value(backend):
+    colours = random_colours(2000) + ["000003e803e8", "00F003E803E8", "0000000003e8"]
+    assert decode_hsv_hex_batch(colours) == [decode_hsv_hex(c) for c in colours]
+    assert hsv_hex_to_rgb_hex_batch(colours) == [hsv_to_rgb_hex(c) for c in colours]
+
+    h, s, v = zip(*decode_hsv_hex_batch(colours))
+    assert encode_hsv_hex_batch(h, s, v) == [c.lower() for c in colours]
+
+
+def test_batch_handles_invalid_values(backend):
+    colours = ["", None, "123", "zzzzzzzzzzzz", "000003e803e8"]
+    assert decode_hsv_hex_batch(colours) == [(0, 1000, 1000)] * 4 + [(0, 1000, 1000)]
+    assert hsv_hex_to_rgb_hex_batch(colours) == ["#ffffff", "#ffffff", "#ffffff", "#ff0000", "#ff0000"]
+    assert decode_hsv_hex_batch([]) == []
+
+
+def test_encode_batch_wraps_and_clamps(backend):
+    assert encode_hsv_hex_batch([370, -10], [1200, -5], [500.7, 1000]) == [
+        encode_hsv_hex(370, 1200, 500.7), encode_hsv_hex(-10, -5, 1000)]
+
+
+def test_rgb_batch(backend):
+    assert hsv_to_rgb_batch([0, 120, 240, 0], [1000, 1000, 1000, 0], [1000, 1000, 1000, 500]) == [
+        (255, 0, 0), (0, 255, 0), (0, 0, 255), (127, 127, 127)]
+
+
+def test_single_value_path_is_cached():
+    hsv_to_rgb_hex.cache_clear()
+    for _ in range(10):
+        hsv_to_rgb_hex("007803e803e8")
+    info = hsv_to_rgb_hex.cache_info()
+    assert info.hits == 9 and info.misses == 1
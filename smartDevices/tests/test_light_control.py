@@ -1,37 +1,11 @@
 import tinytuya
 import json
 import os
+import sys
 import time
-import colorsys
-
-# =============================================================================
-# Helper Functions
-# =============================================================================
-
-def hex_to_hsv(hex_color):
-    """
-    Expects hex input "HHHHSSSSVVVV" (Tuya)
-    Returns: (h_int, s_float, v_float)
-    """
-    if not hex_color or len(hex_color) != 12:
-        return (0, 0, 0.0)
-    
-    h = int(hex_color[0:4], 16)
-    s = int(hex_color[4:8], 16) / 1000.0
-    v = int(hex_color[8:12], 16) / 1000.0
-    return (h, s, v)
-
-def tuya_color_to_hex(dps_value):
-    """
-    Converts Tuya DPS 24 hex string (HHHHSSSSVVVV) to HTML Hex Color (#RRGGBB).
-    """
-    try:
-        h, s, v = hex_to_hsv(dps_value)
-        r, g, b = colorsys.hsv_to_rgb(h/360.0, s, v)
-        return f"#{int(r*255):02x}{int(g*255):02x}{int(b*255):02x}"
-    except Exception as e:
-        print(f"Error converting color: {e}")
-        return "#ffffff"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.pool import DevicePool
+from utils.hsv import hsv_to_rgb_hex
 
 # =============================================================================
 # MAIN DIAGNOSTIC SCRIPT
@@ -50,14 +24,9 @@ def main():
         print(f"ID: {light_info['id']}")
         print(f"IP: {light_info['ip']}")
 
-        smart_light = tinytuya.BulbDevice(
-            light_info["id"],
-            light_info["ip"],
-            light_info["key"]
-        )
-        smart_light.set_version(float(light_info.get("version", 3.4)))
-        smart_light.set_socketPersistent(False)
-        smart_light.set_socketTimeout(5)
+        # One persistent, pooled socket: the 3.4 session key is negotiated once
+        pool = DevicePool(socket_timeout=5)
+        smart_light = pool.open("light1", "light", light_info)
 
         print("\n--- STATUS CHECK ---")
         status = smart_light.status()
@@ -67,7 +36,7 @@ def main():
         print(f"Mode (DPS 21): {dps.get('21')}")
         print(f"Brightness (DPS 22): {dps.get('22')}")
         print(f"Color Temp (DPS 23): {dps.get('23')}")
-        print(f"Color Data (DPS 24): {dps.get('24')}")
+        print(f"Color Data (DPS 24): {dps.get('24')} ({hsv_to_rgb_hex(dps.get('24', ''))})")
         
         print("\n--- TEST: Toggle OFF ---")
         print("Turning OFF...")
@@ -116,6 +85,10 @@ def main():
         status = smart_light.status()
         print(f"New Color (Expect {hex_blue}): {status.get('dps', {}).get('24')}")
 
+        print("\n--- CONNECTION POOL ---")
+        print(pool.summary())
+        pool.close()
+
         print("\n--- DIAGNOSTIC COMPLETE ---")
 
     except Exception as e:
@@ -0,0 +1,86 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils import lightHelpers
+
+
+class FakeBulb:
+    # Counts device transactions: every status read and every write frame
+    def __init__(self, dps):
+        self.dps = dict(dps)
+        self.reads = 0
+        self.frames = []
+
+    def status(self):
+        self.reads += 1
+        return {"dps": dict(self.dps)}
+
+    def get_status(self):
+        return self.status()["dps"]
+
+    def set_value(self, dp, value):
+        self.frames.append({str(dp): value})
+        self.dps[str(dp)] = value
+
+    def set_multiple_values(self, values):
+        self.frames.append(dict(values))
+        self.dps.update(values)
+
+
+COLOUR = {'20': True, '21': 'colour', '22': 400, '23': 100, '24': '007803e801f4'}
+WHITE = {'20': True, '21': 'white', '22': 600, '23': 100, '24': '000003e803e8'}
+
+
+def test_temperature_from_colour_is_one_frame():
+    bulb = FakeBulb(COLOUR)
+    lightHelpers.set_temperature(bulb, bulb.get_status, 300)
+    assert bulb.reads == 1
+    assert bulb.frames == [{'21': 'white', '23': 300, '22': 500}]
+
+
+def test_temperature_in_white_only_sends_temperature():
+    bulb = FakeBulb(WHITE)
+    lightHelpers.set_temperature(bulb, bulb.get_status, 300)
+    assert bulb.frames == [{'23': 300}]
+
+
+def test_temperature_and_colour_print_what_was_written(capsys):
+    bulb = FakeBulb(COLOUR)
+    lightHelpers.set_temperature(bulb, bulb.get_status, 1500)
+    lightHelpers.set_color(bulb, 400, 2000, -5)
+    assert capsys.readouterr().out.splitlines() == [
+        "Temperature: 1000 (brightness: 500)",
+        "Color: H=40, S=1000, V=0",
+    ]
+    assert bulb.frames[-1] == {'21': 'colour', '24': '002803e80000'}
+
+
+def test_brightness_in_colour_mode_rewrites_colour():
+    bulb = FakeBulb(COLOUR)
+    lightHelpers.set_brightness(bulb, bulb.get_status, 100)
+    assert bulb.frames == [{'24': '007803e803e8'}]
+
+
+def test_unchanged_brightness_sends_nothing():
+    bulb = FakeBulb(WHITE)
+    lightHelpers.set_brightness(bulb, bulb.get_status, lightHelpers.read_telemetry(WHITE)["brightness"])
+    assert bulb.frames == []
+
+
+def test_toggle_is_one_read_and_one_write():
+    bulb = FakeBulb(WHITE)
+    lightHelpers.toggle(bulb, bulb.get_status)
+    assert bulb.reads == 1
+    assert bulb.frames == [{'20': False}]
+
+
+def test_command_values():
+    bulb = FakeBulb(COLOUR)
+    assert lightHelpers.command_values(bulb.get_status, "on") == {'20': True}
+    assert lightHelpers.command_values(bulb.get_status, "color:0,1000,1000") == {'21': 'colour', '24': '000003e803e8'}
+    assert bulb.reads == 0
+
+    assert lightHelpers.command_values(bulb.get_status, "temperature:300") == {'21': 'white', '23': 300, '22': 500}
+    assert lightHelpers.command_values(bulb.get_status, "brightness:abc") is None
+    assert lightHelpers.command_values(bulb.get_status, "dance") is None
@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.listener import PushListener
+
+
+class FlakyPool:
+    # No sockets, so every device is on the fallback poll; "plug1" always raises
+    connections = {}
+
+    def __init__(self):
+        self.polled = []
+
+    def probe_due(self, key):
+        return False
+
+    def call(self, key, method, *args, **kwargs):
+        self.polled.append(key)
+        if key == "plug1":
+            raise ConnectionError("Device Unreachable")
+        return {"dps": {"20": True}}
+
+
+def test_failing_device_does_not_stop_the_listener():
+    pool = FlakyPool()
+    updates = []
+    listener = PushListener(pool, lambda key, dps: updates.append(key), fallback_poll_interval=0)
+    listener.add("plug1")
+    listener.add("light1")
+    listener.start()
+    try:
+        time.sleep(2.5)
+        assert listener._thread.is_alive()
+        assert pool.polled.count("plug1") >= 2
+        assert "light1" in updates
+    finally:
+        listener.stop()
+        listener._thread.join(2)
@@ -0,0 +1,77 @@
+import io
+import json
+import logging
+import os
+import queue
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.logs import DedupFilter, DroppingQueueHandler, Logs, parse_levels
+
+
+def record(msg, level=logging.WARNING, created=0.0, **extra):
+    entry = logging.makeLogRecord({"name": "gateway", "msg": msg, "levelno": level,
+                                   "levelname": logging.getLevelName(level), **extra})
+    entry.created = created
+    return entry
+
+
+def test_repeated_errors_are_written_once_per_window():
+    dedup = DedupFilter(window=60)
+    results = [dedup.filter(record("error reading status: timeout", created=t, device="plug1"))
+               for t in (0, 2, 4, 6)]
+    assert results == [True, False, False, False]
+    # Another device, another message or an info line is not a repeat
+    assert dedup.filter(record("error reading status: timeout", created=6, device="plug2"))
+    assert dedup.filter(record("write failed", created=6, device="plug1"))
+    assert dedup.filter(record("ON", level=logging.INFO, created=6, device="plug1"))
+    assert dedup.filter(record("ON", level=logging.INFO, created=7, device="plug1"))
+
+    after = record("error reading status: timeout", created=61, device="plug1")
+    assert dedup.filter(after) and after.repeated == 3
+    assert dedup.suppressed == 3
+
+
+def test_json_records_and_device_levels():
+    stream = io.StringIO()
+    logs = Logs("WARNING", "json", stream=stream, device_levels={"light1": "DEBUG"}).start()
+    log = logging.getLogger("gateway")
+    try:
+        log.debug("received %s", "pi/light1/set", extra={"device": "light1"})
+        log.debug("received %s", "pi/plug1/set", extra={"device": "plug1"})
+        log.info("polling 2 devices")
+        log.warning("offline", extra={"device": "plug1", "fields": {"power": 1.5}})
+        try:
+            raise OSError("no route")
+        except OSError:
+            log.exception("write failed", extra={"device": "light1"})
+    finally:
+        logs.stop()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(line["msg"], line.get("device")) for line in lines] == [
+        ("received pi/light1/set", "light1"), ("offline", "plug1"), ("write failed", "light1")]
+    assert lines[0]["level"] == "DEBUG" and lines[0]["logger"] == "gateway"
+    assert lines[1]["fields"] == {"power": 1.5}
+    assert "OSError: no route" in lines[2]["exc"]
+    assert logs.stats()["dropped"] == 0
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(2))
+    for index in range(5):
+        handler.handle(record("frame %d", created=index, args=(index,)))
+    assert handler.dropped == 3
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "frame 0" and queued.args is None
+
+
+def test_parse_levels():
+    assert parse_levels(["light1=debug", "plug1=ERROR,plug2=error"]) == {
+        "light1": "DEBUG", "plug1": "ERROR", "plug2": "ERROR"}
+    with pytest.raises(ValueError):
+        parse_levels(["light1"])
+    with pytest.raises(ValueError):
+        Logs(device_levels={"light1": "LOUD"})
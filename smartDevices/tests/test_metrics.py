@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.commands import CommandQueue
+from utils.metrics import Metrics, Histogram
+from utils.pool import DevicePool, is_error
+from utils.simulator import Simulator, VirtualDevice
+
+
+def test_histogram_and_text_format():
+    metrics = Metrics()
+    calls = metrics.histogram("call_seconds", "Call latency", ("device",), buckets=(0.01, 0.1, 1))
+    for value in (0.005, 0.05, 0.05, 0.5, 3):
+        calls.labels('lamp "1"').observe(value)
+    metrics.counter("errors_total", "Errors", ("device",)).labels("lamp").inc(2)
+    metrics.gauge("queue_depth", "Queued", lambda: {("lamp",): 3}, ("device",))
+
+    text = metrics.render()
+    assert '# TYPE pi_iot_call_seconds histogram' in text
+    assert 'pi_iot_call_seconds_bucket{device="lamp \\"1\\"",le="0.1"} 3' in text
+    assert 'pi_iot_call_seconds_bucket{device="lamp \\"1\\"",le="+Inf"} 5' in text
+    assert 'pi_iot_call_seconds_count{device="lamp \\"1\\""} 5' in text
+    assert 'pi_iot_errors_total{device="lamp"} 2' in text
+    assert 'pi_iot_queue_depth{device="lamp"} 3' in text
+
+    histogram = Histogram((0.01, 0.1, 1))
+    for value in [0.005] * 90 + [0.5] * 10:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 0.01 and histogram.quantile(0.95) == 1
+
+
+def test_pool_records_latency_and_errors():
+    metrics = Metrics()
+    devices = [VirtualDevice(0, "light", "127.0.0.2", 0, "3.3"), VirtualDevice(1, "plug", "127.0.0.3", 0, "3.3", loss=1.0)]
+    with Simulator(devices) as simulator:
+        light_info, plug_info = simulator.entries()
+        pool = DevicePool(socket_timeout=0.3, metrics=metrics)
+        light = pool.open("light1", "light", light_info)
+        plug = pool.open("plug1", "plug", plug_info)
+        assert "dps" in light.status()
+        assert "dps" in light.set_multiple_values({"22": 500})
+        assert is_error(plug.status())
+        pool.close()
+
+    snapshot = metrics.snapshot()
+    assert snapshot['tuya_call_seconds{device="light1",method="status"}']["count"] == 1
+    assert snapshot['tuya_call_seconds{device="light1",method="set_multiple_values"}']["count"] == 1
+    assert snapshot['tuya_call_errors_total{device="plug1",method="status"}'] == 1
+    assert 'tuya_call_errors_total{device="light1",method="status"}' not in snapshot
+    assert snapshot['device_up{device="light1"}'] == 1
+
+
+def test_command_queue_depth_and_wait():
+    metrics = Metrics()
+    queue = CommandQueue(max_workers=1, metrics=metrics)
+    started, release, done = threading.Event(), threading.Event(), threading.Event()
+    queue.submit("light1", None, lambda: started.set() or release.wait())
+    assert started.wait(2)
+    queue.submit("light1", "brightness", done.set)
+    assert metrics.snapshot()['command_queue_depth{device="light1"}'] == 1
+    release.set()
+    assert done.wait(2)
+    queue.executor.shutdown(wait=True)
+    snapshot = metrics.snapshot()
+    assert snapshot['command_queue_depth{device="light1"}'] == 0
+    assert snapshot['command_wait_seconds{device="light1"}']["count"] == 2
+
+
+def test_http_endpoint_and_mqtt_snapshot():
+    metrics = Metrics()
+    metrics.counter("messages_total", "Messages").labels().inc()
+    port = metrics.serve(0)
+
+    class Client:
+        def __init__(self):
+            self.published = threading.Event()
+            self.messages = []
+
+        def publish(self, topic, payload):
+            self.messages.append((topic, json.loads(payload)))
+            self.published.set()
+
+    client = Client()
+    metrics.publish_every(client, interval=0.05)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert "pi_iot_messages_total 1" in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other", timeout=2)
+        assert client.published.wait(2)
+        topic, snapshot = client.messages[0]
+        assert topic == "pi/_metrics" and snapshot["messages_total"] == 1
+    finally:
+        metrics.stop()
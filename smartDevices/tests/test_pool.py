@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.pool import DevicePool, LatencyCounter
+
+
+class HandshakeDevice:
+    # First call on a closed socket pays for the handshake; later ones reuse the socket
+    def __init__(self, handshake=0.03, round_trip=0.002):
+        self.handshake = handshake
+        self.round_trip = round_trip
+        self.socket = None
+
+    def set_socketPersistent(self, persist):
+        pass
+
+    def set_socketRetryLimit(self, limit):
+        pass
+
+    def close(self):
+        self.socket = None
+
+    def status(self):
+        if self.socket is None:
+            time.sleep(self.handshake)
+            self.socket = object()
+        time.sleep(self.round_trip)
+        return {"dps": {"1": True}}
+
+
+def test_latency_counter_average():
+    counter = LatencyCounter()
+    assert counter.average == 0.0
+    for seconds in (0.01, 0.02, 0.03):
+        counter.add(seconds)
+    assert counter.count == 3 and abs(counter.average - 0.02) < 1e-9
+
+
+def test_cold_and_warm_calls_are_split():
+    pool = DevicePool()
+    device = HandshakeDevice()
+    pool.add("plug1", device)
+    for _ in range(5):
+        pool.call("plug1", "status")
+    # Dropping the socket makes the next call cold again
+    device.close()
+    pool.call("plug1", "status")
+
+    conn = pool.connection("plug1")
+    assert (conn.cold.count, conn.warm.count) == (2, 4)
+    assert conn.cold.average >= 0.03 > conn.warm.average
+
+    stats = pool.stats()["plug1"]
+    assert stats["cold_calls"] == 2 and stats["warm_calls"] == 4
+    expected = 4 * (conn.cold.average - conn.warm.average)
+    assert abs(stats["handshake_saved_s"] - expected) < 0.001
+    assert stats["handshake_saved_s"] >= 4 * 0.025
+
+
+def test_heartbeats_without_reply_are_not_counted():
+    pool = DevicePool()
+    device = HandshakeDevice()
+    device.heartbeat = lambda nowait=False: None
+    pool.add("plug1", device)
+    pool.call("plug1", "heartbeat", nowait=True)
+    assert pool.stats()["plug1"]["cold_calls"] == 0
+    assert pool.stats()["plug1"]["handshake_saved_s"] == 0.0
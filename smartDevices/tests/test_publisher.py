@@ -0,0 +1,75 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.publisher import TelemetryPublisher
+
+
+class FakeClient:
+    # Records publishes like paho's client.publish(topic, payload, retain=...)
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, payload, retain=False):
+        self.messages.append((topic, payload, retain))
+
+    def topics(self):
+        return [topic for topic, _, _ in self.messages]
+
+
+def publish(publisher, **fields):
+    return publisher.publish("pi/plug1", fields, {key: str(value) for key, value in fields.items()})
+
+
+def test_only_changed_fields_are_published():
+    client = FakeClient()
+    publisher = TelemetryPublisher(client, json_state=False)
+    assert publish(publisher, state="ON", power=12.0) == ["state", "power"]
+    assert publish(publisher, state="ON", power=12.0) == []
+    assert publish(publisher, state="OFF", power=12.0) == ["state"]
+
+    assert client.topics() == ["pi/plug1/state", "pi/plug1/power", "pi/plug1/state"]
+    assert publisher.published == 3 and publisher.suppressed == 3
+
+
+def test_deadband_is_measured_from_the_last_published_value():
+    client = FakeClient()
+    publisher = TelemetryPublisher(client, deadbands={"power": 1.0}, json_state=False)
+    publish(publisher, power=100.0)
+    # Each step is under the deadband, but the drift adds up past it
+    sent = [publish(publisher, power=power) for power in (100.4, 100.8, 101.2, 101.5)]
+    assert sent == [[], [], ["power"], []]
+    assert client.messages[-1] == ("pi/plug1/power", "101.2", True)
+
+
+def test_retain_flag_and_force():
+    client = FakeClient()
+    publisher = TelemetryPublisher(client, retain=False, json_state=False)
+    publish(publisher, state="ON")
+    assert publish(publisher, state="ON") == []
+    publisher.publish("pi/plug1", {"state": "ON"}, {"state": "ON"}, force=True)
+    assert client.messages == [("pi/plug1/state", "ON", False)] * 2
+
+
+def test_combined_state_json_carries_all_fields_and_ts():
+    client = FakeClient()
+    publisher = TelemetryPublisher(client)
+    publish(publisher, state="ON", power=12.0)
+    publish(publisher, state="ON", power=12.0)
+    publish(publisher, state="OFF", power=12.0)
+
+    states = [message for message in client.messages if message[0] == "pi/plug1/state/json"]
+    # One per publish that changed something, each with every field, not just the changed ones
+    assert len(states) == 2 and all(retain for _, _, retain in states)
+    state = json.loads(states[-1][1])
+    assert state.pop("ts") > 0
+    assert state == {"state": "OFF", "power": 12.0}
+
+
+def test_field_topics_can_be_switched_off():
+    client = FakeClient()
+    publisher = TelemetryPublisher(client, field_topics=False)
+    assert publish(publisher, state="ON", power=12.0) == ["state", "power"]
+    assert publish(publisher, state="ON", power=12.0) == []
+    assert client.topics() == ["pi/plug1/state/json"]
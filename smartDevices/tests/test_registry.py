@@ -0,0 +1,75 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.registry import DeviceRegistry, parse_devices
+
+DEVICES = [
+    {"name": "Ceiling", "id": "bf01", "ip": "192.168.1.10", "key": "k1", "type": "light"},
+    {"name": "Heater", "id": "bf02", "ip": "192.168.1.11", "key": "k2"},
+    {"name": "Desk", "id": "bf03", "ip": "192.168.1.12", "key": "k3", "category": "dj", "topic": "desk"},
+]
+
+
+def write(path, devices):
+    path.write_text(json.dumps(devices))
+    # Make sure the mtime moves even on coarse-grained filesystems
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_lookups_and_routing(tmp_path):
+    path = tmp_path / "devices.json"
+    write(path, DEVICES)
+    registry = DeviceRegistry(str(path))
+
+    assert [entry.key for entry in registry] == ["light1", "plug1", "desk"]
+    assert registry.find("bf02").key == "plug1"
+    assert registry.find("Desk").kind == "light"
+    assert registry.find("192.168.1.10").key == "light1"
+    assert registry.first("plug").name == "Heater"
+
+    entry, rest = registry.route("pi/desk/set")
+    assert entry.name == "Desk" and rest == "set"
+    assert registry.route("pi/desk/effect/state")[1] == "effect/state"
+    assert registry.route("pi/nope/set") == (None, None)
+    assert registry.route("other/desk/set") == (None, None)
+
+
+def test_validation_reports_every_problem():
+    with pytest.raises(ValueError) as error:
+        parse_devices([
+            {"name": "a", "id": "1", "ip": "10.0.0.1", "key": "k"},
+            {"name": "b", "id": "1", "ip": "10.0.0.2", "key": "k"},
+            {"name": "c", "ip": "10.0.0.3"},
+            {"name": "d", "id": "4", "ip": "10.0.0.4", "key": "k", "topic": "plug1"},
+        ])
+    message = str(error.value)
+    assert "id '1'" in message and "missing id, key" in message and "topic 'plug1'" in message
+
+
+def test_reload_classifies_changes_and_rejects_bad_files(tmp_path):
+    path = tmp_path / "devices.json"
+    write(path, DEVICES)
+    registry = DeviceRegistry(str(path))
+    seen = []
+    registry.listeners.append(lambda *changes: seen.append([[entry.key for entry in group] for group in changes]))
+
+    changed = [dict(device) for device in DEVICES]
+    changed[0]["name"] = "Big Ceiling"      # metadata only
+    changed[1]["ip"] = "192.168.1.99"       # needs a new connection
+    del changed[2]
+    changed.append({"name": "Fan", "id": "bf04", "ip": "192.168.1.13", "key": "k4"})
+    write(path, changed)
+
+    assert registry.check() is not None
+    assert seen == [[["plug2"], ["desk"], ["plug1"], ["light1"]]]
+    assert registry.find("Big Ceiling").key == "light1" and registry.find("Ceiling") is None
+    assert registry.check() is None  # Unchanged since the last read
+
+    write(path, [{"name": "broken"}])
+    assert registry.check() is None
+    assert len(registry) == 3 and registry.stats()["rejected"] == 1
@@ -0,0 +1,81 @@
+import datetime
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.rules import RuleEngine, load_rules, sun_time
+
+
+def engine_for(rules, location=None):
+    actions = []
+    engine = RuleEngine({"rules": rules, "location": location}, lambda topic, payload: actions.append((topic, payload)))
+    return engine, actions
+
+
+def test_threshold_rule_fires_on_the_edge_only():
+    engine, actions = engine_for([
+        {"name": "overload", "when": "pi/plug1/power > 1500", "then": {"pi/plug1/set": "off"}},
+    ])
+
+    for payload in ("200.00", "1600.00", "1700.00", "100.00", "1800.00"):
+        engine.on_message("pi/plug1/power", payload)
+
+    # Fires going over, not again while still over, and again after dropping back
+    assert actions == [("pi/plug1/set", "off"), ("pi/plug1/set", "off")]
+    assert engine.stats()["trigger_to_action"]["count"] == 2
+
+
+def test_all_conditions_must_hold_and_index_skips_other_topics():
+    engine, actions = engine_for([
+        {"name": "lamp", "when": ["pi/plug1/state == ON", "pi/plug1/power < 5"],
+         "then": {"pi/light1/effect": "fade:off:10"}},
+        {"name": "other", "when": "pi/plug2/power > 1", "then": {"pi/plug2/set": "off"}},
+    ])
+
+    engine.on_message("pi/light1/brightness", "50")
+    engine.on_message("pi/plug1/power", "2.5")
+    assert actions == []
+    engine.on_message("pi/plug1/state", "ON")
+    assert actions == [("pi/light1/effect", "fade:off:10")]
+
+    stats = engine.stats()
+    assert stats["messages"] == 3 and stats["matched"] == 2
+    assert stats["conditions_checked"] == 2  # plug2's rule was never looked at
+
+
+def test_cooldown():
+    engine, actions = engine_for([
+        {"name": "flap", "when": "pi/plug1/state == ON", "then": {"pi/light1/set": "on"}, "cooldown": 60},
+    ])
+    for payload in ("ON", "OFF", "ON"):
+        engine.on_message("pi/plug1/state", payload)
+    assert len(actions) == 1
+
+
+def test_time_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"location": {"lat": 51.5, "lon": -0.12}, "rules": [
+        {"name": "morning", "at": "07:30", "then": {"pi/light1/effect": "sunrise:900"}},
+        {"name": "dusk", "at": "sunset-15", "then": {"pi/light1/set": "on"}},
+    ]}))
+    engine, actions = engine_for(load_rules(str(path))["rules"], {"lat": 51.5, "lon": -0.12})
+
+    morning = time.mktime((2026, 6, 21, 7, 30, 0, 0, 0, -1))
+    engine.last_tick = morning - 30
+    assert [rule.name for rule in engine.tick(morning + 30)] == ["morning"]
+    assert engine.tick(morning + 90) == []
+    assert actions == [("pi/light1/effect", "sunrise:900")]
+    assert load_rules(str(tmp_path / "missing.json")) == {"rules": []}
+
+
+def test_sun_times_for_london_midsummer():
+    day = datetime.date(2026, 6, 21)
+    rise = datetime.datetime.fromtimestamp(sun_time(day, 51.5, -0.12, True), datetime.timezone.utc)
+    set_ = datetime.datetime.fromtimestamp(sun_time(day, 51.5, -0.12, False), datetime.timezone.utc)
+
+    # 03:43 and 20:21 UTC
+    assert abs((rise.hour * 60 + rise.minute) - (3 * 60 + 43)) <= 3
+    assert abs((set_.hour * 60 + set_.minute) - (20 * 60 + 21)) <= 3
+    assert sun_time(day, 80, 0, True) is None  # Midnight sun
@@ -0,0 +1,56 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.scheduler import PollScheduler
+
+
+def test_stable_device_backs_off_to_max():
+    scheduler = PollScheduler(base_interval=2, min_interval=1, max_interval=10, growth=2)
+    scheduler.add("plug1")
+    intervals = [scheduler.record("plug1") for _ in range(5)]
+    assert intervals == [4, 8, 10, 10, 10]
+
+
+def test_change_polls_fast_again():
+    scheduler = PollScheduler(base_interval=2, min_interval=0.5, max_interval=10)
+    scheduler.add("plug1")
+    scheduler.record("plug1")
+    assert scheduler.record("plug1", changed=True) == 0.5
+
+
+def test_failures_back_off_exponentially():
+    scheduler = PollScheduler(base_interval=2, failure_max_interval=30)
+    scheduler.add("light1", priority=4)
+    intervals = [scheduler.record("light1", failed=True) for _ in range(5)]
+    assert intervals == [4, 8, 16, 30, 30]
+    assert scheduler.record("light1") < 4
+
+
+def test_priority_divides_interval():
+    scheduler = PollScheduler(base_interval=2, min_interval=1, max_interval=10, growth=2)
+    scheduler.add("low")
+    scheduler.add("high", priority=2)
+    assert scheduler.record("low") == 4
+    assert scheduler.record("high") == 2
+
+
+def test_poke_wakes_waiting_poller():
+    scheduler = PollScheduler(base_interval=2, min_interval=0.05, max_interval=60)
+    scheduler.add("light1")
+    scheduler.record("light1")
+
+    threading.Timer(0.05, scheduler.poke, ("light1",)).start()
+    start = time.monotonic()
+    assert scheduler.wait("light1", timeout=2)
+    assert time.monotonic() - start < 0.5
+
+
+def test_stats_report_savings():
+    scheduler = PollScheduler(base_interval=1)
+    scheduler.add("plug1")
+    stats = scheduler.stats()
+    assert stats["fixed_rate"] == 1
+    assert stats["devices"]["plug1"]["polls"] == 0
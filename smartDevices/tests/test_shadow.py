@@ -0,0 +1,64 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.shadow import ShadowState
+
+
+class StatusReads:
+    # Stands in for device.get_status, counting the real reads
+    def __init__(self, dps):
+        self.dps = dps
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return dict(self.dps)
+
+
+def test_hits_and_misses():
+    shadow = ShadowState(max_age=10)
+    status = StatusReads({'20': True, '22': 500})
+    assert shadow.read("light1", status) == {'20': True, '22': 500}
+    shadow.update("light1", {'22': 800})
+    assert shadow.read("light1", status) == {'20': True, '22': 800}
+    assert shadow.read("light1", status)['22'] == 800
+    assert status.calls == 1
+    assert shadow.stats() == {"hits": 2, "misses": 1, "hit_rate": 0.667}
+
+
+def test_stale_shadow_is_read_again():
+    shadow = ShadowState(max_age=0.05)
+    status = StatusReads({'1': False})
+    shadow.update("plug1", {'1': True})
+    assert shadow.read("plug1", status) == {'1': True}
+    time.sleep(0.06)
+    assert shadow.get("plug1") is None
+    assert shadow.read("plug1", status) == {'1': False}
+    assert status.calls == 1
+
+
+def test_invalidate_forces_a_read():
+    shadow = ShadowState()
+    status = StatusReads({'1': False})
+    shadow.update("plug1", {'1': True})
+    shadow.invalidate("plug1")
+    assert shadow.read("plug1", status) == {'1': False}
+    assert shadow.stats()["misses"] == 1
+    # Empty updates (a failed read) leave the shadow alone
+    shadow.update("plug1", {})
+    assert shadow.get("plug1") == {'1': False}
+
+
+def test_counters_are_exact_across_threads():
+    shadow = ShadowState()
+    shadow.update("light1", {'20': True})
+    threads = [threading.Thread(target=lambda: [shadow.read("light1", dict) for _ in range(2000)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert shadow.stats()["hits"] == 16000
@@ -0,0 +1,79 @@
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.pool import DevicePool, create_device, is_error
+from utils.registry import DeviceRegistry
+from utils.simulator import Simulator, VirtualDevice
+
+
+def test_pool_talks_to_33_and_34_devices(tmp_path):
+    devices = [VirtualDevice(0, "light", "127.0.0.2", 0, "3.3"), VirtualDevice(1, "plug", "127.0.0.3", 0, "3.4")]
+    with Simulator(devices) as simulator:
+        path = tmp_path / "devices.json"
+        path.write_text(json.dumps(simulator.entries()))
+        registry = DeviceRegistry(str(path))
+        pool = DevicePool(socket_timeout=2)
+        light = pool.open("light1", "light", registry.get("light1").info)
+        plug = pool.open("plug1", "plug", registry.get("plug1").info)
+
+        assert light.status()["dps"]["22"] == 1000
+        assert light.set_value(22, 250)["dps"] == {"22": 250}
+        assert light.status()["dps"]["22"] == 250
+
+        # Switching the plug off takes its load with it; the mains voltage stays
+        assert plug.status()["dps"]["19"] > 0
+        assert plug.turn_off()["dps"]["1"] is False
+        reading = plug.status()["dps"]
+        assert reading["18"] == 0 and reading["19"] == 0 and 2200 < reading["20"] < 2400
+        pool.close()
+
+
+def test_changes_and_metering_are_pushed():
+    plug = VirtualDevice(0, "plug", "127.0.0.4", 0, "3.4", push_interval=0.2)
+    with Simulator([plug]) as simulator:
+        entry = simulator.entries()[0]
+        watcher, writer = (create_device(entry, "plug", socket_timeout=1) for _ in range(2))
+        assert "dps" in watcher.status()
+
+        writer.turn_off()
+        pushed = watcher.receive()
+        assert pushed["dps"]["1"] is False
+
+        writer.turn_on()
+        deadline = time.time() + 3
+        metering = None
+        while time.time() < deadline and not (metering and metering["dps"].get("19")):
+            metering = watcher.receive()
+        assert metering["dps"]["19"] > 0
+        assert simulator.stats()["pushes"] >= 3
+        watcher.close()
+        writer.close()
+
+
+def test_latency_and_loss():
+    slow = VirtualDevice(0, "light", "127.0.0.5", 0, "3.3", latency=0.2)
+    lossy = VirtualDevice(1, "light", "127.0.0.6", 0, "3.3", loss=1.0)
+    with Simulator([slow, lossy]) as simulator:
+        slow_entry, lossy_entry = simulator.entries()
+        device = create_device(slow_entry, "light", socket_timeout=2)
+        started = time.monotonic()
+        assert "dps" in device.status()
+        assert time.monotonic() - started >= 0.2
+        device.close()
+
+        device = create_device(lossy_entry, "light", socket_timeout=0.3)
+        device.set_socketRetryLimit(1)
+        assert is_error(device.status())
+        assert lossy.dropped >= 1 and lossy.replies == 0
+        device.close()
+
+    # Wrong key: the frame fails its checksum check and the device hangs up
+    with Simulator([VirtualDevice(2, "plug", "127.0.0.7", 0, "3.4")]) as simulator:
+        entry = dict(simulator.entries()[0], key="0123456789abcdef")
+        device = create_device(entry, "plug", socket_timeout=0.5)
+        device.set_socketRetryLimit(1)
+        assert is_error(device.status())
+        device.close()
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from utils.timeseries import TimeSeriesStore
+
+HOUR = 3600
+START = 1_700_000_000 - 1_700_000_000 % HOUR
+
+
+def test_raw_samples_round_trip(tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "t.db"))
+    store.add("plug1", {"name": "Kettle", "state": "ON", "power": 12.5, "voltage": 231.0}, ts=START)
+    store.add("plug1", {"power": 14.0}, ts=START + 2)
+    assert store.flush() == 3
+
+    rows = store.query("power", START, START + 10, resolution="raw")
+    assert rows == {"plug1": [(START, 12.5, 12.5, 12.5), (START + 2, 14.0, 14.0, 14.0)]}
+    store.close()
+
+
+def test_rollups_and_retention(tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "t.db"), retention={"raw": HOUR})
+    # Two hours of a 10W/20W square wave, one sample every 10s, on two plugs
+    for i in range(2 * HOUR // 10):
+        store.add("plug1", {"power": 10.0 if i % 2 else 20.0}, ts=START + i * 10)
+        store.add("plug2", {"power": 100.0}, ts=START + i * 10)
+    store.flush()
+    store.rollup(now=START + 2 * HOUR + 120)
+
+    minutes = store.query("power", START, START + 2 * HOUR, resolution="minute")
+    assert len(minutes["plug1"]) == 120
+    assert minutes["plug1"][0] == (START, 15.0, 10.0, 20.0)
+
+    hours = store.query("power", START, START + 2 * HOUR, resolution="hour", devices=["plug2"])
+    assert hours == {"plug2": [(START, 100.0, 100.0, 100.0), (START + HOUR, 100.0, 100.0, 100.0)]}
+
+    store.prune(now=START + 2 * HOUR + 120)
+    raw = store.query("power", START, START + 2 * HOUR, resolution="raw")
+    assert raw["plug1"][0][0] >= START + HOUR
+    # Rolled-up minutes survive the raw retention
+    assert len(store.query("power", START, START + 2 * HOUR, resolution="minute")["plug1"]) == 120
+    store.close()
+
+
+def test_late_samples_are_rolled_up(tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "t.db"))
+    for i in range(6):
+        store.add("plug1", {"power": 10.0}, ts=START + i * 10)
+    store.flush()
+    store.rollup(now=START + HOUR + 120)
+
+    # Flushed after its minute (and hour) had already been rolled up
+    store.add("plug1", {"power": 80.0}, ts=START + 5)
+    store.flush()
+    store.rollup(now=START + HOUR + 180)
+
+    assert store.query("power", START, START + 60, resolution="minute") == {"plug1": [(START, 20.0, 10.0, 80.0)]}
+    assert store.query("power", START, START + HOUR, resolution="hour") == {"plug1": [(START, 20.0, 10.0, 80.0)]}
+    store.close()
+
+
+def test_buffer_is_bounded(tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "t.db"), max_buffer=100)
+    for i in range(150):
+        store.add("plug1", {"power": float(i)}, ts=START + i)
+    assert store.stats()["dropped"] == 50
+    store.flush()
+    rows = store.query("power", START, START + 200, resolution="raw")["plug1"]
+    assert rows[0][1] == 50.0 and len(rows) == 100
+    store.close()
+
+
+def test_month_query_is_fast(tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "t.db"))
+    store.db.executemany("INSERT INTO series (id, device, field) VALUES (?, ?, 'power')",
+                         [(n, f"plug{n}") for n in range(1, 11)])
+    store.db.executemany(
+        "INSERT INTO hour (series, bucket, count, total, low, high) VALUES (?, ?, 360, 3600, 5, 15)",
+        [(n, START + h * HOUR) for n in range(1, 11) for h in range(31 * 24)])
+    store.db.commit()
+    store.close()
+
+    store = TimeSeriesStore(str(tmp_path / "t.db"))
+    began = time.perf_counter()
+    rows = store.query("power", START, START + 31 * 24 * HOUR)
+    assert time.perf_counter() - began < 0.5
+    assert len(rows) == 10 and all(len(series) == 31 * 24 for series in rows.values())
+    assert rows["plug1"][0] == (START, 10.0, 5.0, 15.0)
+    store.close()
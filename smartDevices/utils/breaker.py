@@ -0,0 +1,96 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+FAILURE_THRESHOLD = 2
+RESET_TIMEOUT = 1
+RESET_TIMEOUT_MAX = 60
+
+
+class CircuitBreaker:
+    """
+    Per-device health: closed while calls succeed, open after
+    failure_threshold failures in a row. While open, calls are refused
+    without touching the network. Once the reset timeout has passed, one
+    probe call is let through (half-open): success closes the breaker, and
+    failure opens it again with double the timeout, up to reset_timeout_max.
+
+    on_change(state) is called on every state change.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 reset_timeout_max=RESET_TIMEOUT_MAX, on_change=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.reset_timeout_max = reset_timeout_max
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def available(self):
+        return self.state == CLOSED
+
+    def probe_due(self):
+        return self.state == OPEN and time.monotonic() >= self.retry_at
+
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.retry_at:
+                state = self._set(HALF_OPEN)
+            else:
+                # Open, or half-open with the probe still in flight
+                self.rejected += 1
+                return False
+        self._notify(state)
+        return True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.trips = 0
+            state = self._set(CLOSED)
+        self._notify(state)
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            state = None
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.trips += 1
+                timeout = min(self.reset_timeout_max, self.reset_timeout * 2 ** (self.trips - 1))
+                self.retry_at = time.monotonic() + timeout
+                if self.state != OPEN:
+                    self.opened += 1
+                state = self._set(OPEN)
+        self._notify(state)
+
+    def _set(self, state):
+        # Returns the new state if it changed, for _notify outside the lock
+        if state == self.state:
+            return None
+        self.state = state
+        return state
+
+    def _notify(self, state):
+        if state is not None and self.on_change:
+            self.on_change(state)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_in": round(max(0.0, self.retry_at - time.monotonic()), 1) if self.state == OPEN else 0.0,
+        }
@@ -0,0 +1,235 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+MAX_WORKERS = 4
+MAX_WRITE_RATE = 5
+RATE_WINDOW = 10
+
+
+def coalesce_key(payload):
+    """
+    Commands with the same key replace each other while still queued: only
+    the latest brightness/colour/temperature value matters, and a pending
+    "on" is superseded by a later "off". Toggles never coalesce.
+    """
+    cmd = payload.split(":", 1)[0].lower().strip()
+    if cmd in ("on", "off"):
+        return "power"
+    if cmd in ("brightness", "color", "temperature", "refresh"):
+        return cmd
+    return None
+
+
+class CommandQueue:
+    """
+    Per-device command queues drained on a shared worker pool, so MQTT
+    callbacks only enqueue and return. Each device's commands run in order,
+    one at a time; different devices run in parallel.
+    """
+
+    def __init__(self, executor=None, max_workers=MAX_WORKERS, metrics=None):
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="commands")
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.active = set()
+        self.submitted = 0
+        self.executed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.metrics = metrics
+        if metrics is not None:
+            self.wait_seconds = metrics.histogram("command_wait_seconds", "Time a command spent queued",
+                                                  ("device",))
+            self.run_seconds = metrics.histogram("command_seconds", "Time to carry out a command", ("device",))
+            self.failures = metrics.counter("command_errors_total", "Commands that raised", ("device",))
+            metrics.gauge("command_queue_depth", "Commands queued and not yet started", self.depths, ("device",))
+
+    def submit(self, device, key, fn, *args):
+        """Queue fn(*args) for device; returns True if it replaced a queued command."""
+        with self.lock:
+            queue = self.pending.setdefault(device, OrderedDict())
+            self.submitted += 1
+            superseded = key is not None and key in queue
+            if superseded:
+                # Drop the queued one; the new command goes to the back
+                del queue[key]
+                self.dropped += 1
+            queue[key if key is not None else object()] = (fn, args, time.monotonic())
+
+            if device not in self.active:
+                self.active.add(device)
+                self.executor.submit(self._drain, device)
+        return superseded
+
+    def _drain(self, device):
+        while True:
+            with self.lock:
+                queue = self.pending.get(device)
+                if not queue:
+                    self.active.discard(device)
+                    return
+                _, (fn, args, queued) = queue.popitem(last=False)
+
+            started = time.monotonic()
+            try:
+                fn(*args)
+                with self.lock:
+                    self.executed += 1
+            except Exception as error:
+                with self.lock:
+                    self.failed += 1
+                if self.metrics is not None:
+                    self.failures.labels(device).inc()
+                log.warning("command failed: %s", error, extra={"device": device})
+            if self.metrics is not None:
+                self.wait_seconds.labels(device).observe(started - queued)
+                self.run_seconds.labels(device).observe(time.monotonic() - started)
+
+    def depth(self, device=None):
+        with self.lock:
+            if device is not None:
+                return len(self.pending.get(device, ()))
+            return sum(len(queue) for queue in self.pending.values())
+
+    def depths(self):
+        with self.lock:
+            return {(device,): len(queue) for device, queue in self.pending.items()}
+
+    def stats(self):
+        with self.lock:
+            counts = {
+                "submitted": self.submitted,
+                "executed": self.executed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+        return {**counts, "queued": self.depth()}
+
+
+class WriteScheduler:
+    """
+    Merges pending DPS writes per device into a single set_multiple_values
+    frame and sends at most max_rate frames per second to each device.
+    Values submitted while a device is waiting for its next slot are merged
+    in, so the last value submitted is always the one that gets written.
+    """
+
+    def __init__(self, write, executor=None, max_rate=MAX_WRITE_RATE, max_workers=MAX_WORKERS, metrics=None):
+        self.write = write
+        self.min_interval = 1.0 / max_rate
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="writes")
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.active = set()
+        self.last_write = {}
+        self.recent = deque()
+        self.submitted = 0
+        self.merged = 0
+        self.writes = 0
+        self.failed = 0
+        if metrics is not None:
+            metrics.gauge("write_queue_dps", "DPS values waiting for the device's next write slot",
+                          lambda: {(device,): len(dps) for device, dps in list(self.pending.items())}, ("device",))
+
+    def submit(self, device, dps):
+        with self.lock:
+            self.submitted += 1
+            pending = self.pending.setdefault(device, {})
+            if pending:
+                self.merged += 1
+            pending.update(dps)
+
+            if device not in self.active:
+                self.active.add(device)
+                self.executor.submit(self._drain, device)
+
+    def pending_values(self, device):
+        # Values accepted but not yet written, to overlay on a status read
+        with self.lock:
+            return dict(self.pending.get(device, {}))
+
+    def write_now(self, device, dps, write=None):
+        """
+        Write on the caller's own thread instead of the pool, for group members
+        released together and effect frames, still within the device's rate
+        limit and counted in the stats. Waits for the device's next slot and
+        returns what write (default: the scheduler's) returned.
+        """
+        with self.lock:
+            self.submitted += 1
+            now = time.monotonic()
+            slot = max(now, self.last_write.get(device, 0.0) + self.min_interval)
+            self.last_write[device] = slot
+        if slot > now:
+            time.sleep(slot - now)
+        with self.lock:
+            self.recent.append(time.monotonic())
+
+        try:
+            result = (write or self.write)(device, dps)
+        except Exception:
+            self.failed += 1
+            raise
+        self.writes += 1
+        return result
+
+    def _resume(self, device):
+        try:
+            self.executor.submit(self._drain, device)
+        except RuntimeError:
+            # The pool has shut down
+            with self.lock:
+                self.active.discard(device)
+
+    def _drain(self, device):
+        while True:
+            wait = self.last_write.get(device, 0.0) + self.min_interval - time.monotonic()
+            if wait > 0:
+                # Come back when the slot opens rather than holding a pool worker asleep
+                timer = threading.Timer(wait, self._resume, (device,))
+                timer.daemon = True
+                timer.start()
+                return
+
+            with self.lock:
+                dps = self.pending.pop(device, None)
+                if not dps:
+                    self.active.discard(device)
+                    return
+                now = time.monotonic()
+                self.last_write[device] = now
+                self.recent.append(now)
+
+            try:
+                self.write(device, dps)
+                self.writes += 1
+            except Exception as error:
+                self.failed += 1
+                log.warning("write failed: %s", error, extra={"device": device})
+
+    def depth(self):
+        with self.lock:
+            return sum(len(dps) for dps in self.pending.values())
+
+    def write_rate(self):
+        # Frames per second over the last RATE_WINDOW seconds
+        with self.lock:
+            cutoff = time.monotonic() - RATE_WINDOW
+            while self.recent and self.recent[0] < cutoff:
+                self.recent.popleft()
+            return len(self.recent) / RATE_WINDOW
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "merged": self.merged,
+            "writes": self.writes,
+            "failed": self.failed,
+            "queued_dps": self.depth(),
+            "write_rate": round(self.write_rate(), 2),
+        }
@@ -0,0 +1,159 @@
+import asyncio
+import ipaddress
+import json
+import logging
+import select
+import socket
+import threading
+import time
+import tinytuya
+from utils.pool import TUYA_PORT
+
+log = logging.getLogger(__name__)
+
+# Tuya devices broadcast a beacon every few seconds: plain on 6666 (3.1), encrypted on 6667 (3.2+)
+BEACON_PORTS = (6666, 6667)
+SELECT_TIMEOUT = 1
+
+# Active scan: a host counts as a Tuya candidate if its TCP 6668 accepts within SCAN_TIMEOUT
+SCAN_TIMEOUT = 0.5
+SCAN_CONCURRENCY = 256
+
+
+def decode_beacon(data):
+    # Beacon bytes -> {"gwId", "ip", "version", ...}, or None if it isn't one
+    try:
+        beacon = json.loads(tinytuya.decrypt_udp(data))
+    except Exception:
+        return None
+    if not isinstance(beacon, dict) or not beacon.get("gwId") or not beacon.get("ip"):
+        return None
+    return beacon
+
+
+def local_network(prefix=24):
+    """The /24 (by default) this machine's outgoing interface is on."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        # No packet is sent; connect() only picks the route and source address
+        probe.connect(("10.255.255.255", 1))
+        address = probe.getsockname()[0]
+    return ipaddress.ip_network(f"{address}/{prefix}", strict=False)
+
+
+async def _probe(host, port, timeout, limit):
+    async with limit:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return host
+
+
+async def scan_hosts(hosts, port=TUYA_PORT, timeout=SCAN_TIMEOUT, concurrency=SCAN_CONCURRENCY):
+    limit = asyncio.Semaphore(concurrency)
+    found = await asyncio.gather(*(_probe(str(host), port, timeout, limit) for host in hosts))
+    return [host for host in found if host]
+
+
+def scan(network=None, port=TUYA_PORT, timeout=SCAN_TIMEOUT, concurrency=SCAN_CONCURRENCY):
+    """
+    Hosts on a network (default: the local /24) that accept a connection on
+    the Tuya port. All hosts are probed at once, up to `concurrency` open
+    sockets, so a /24 takes about one timeout rather than 254 of them.
+    """
+    network = ipaddress.ip_network(network) if network else local_network()
+    hosts = list(network.hosts()) or [network.network_address]
+    return asyncio.run(scan_hosts(hosts, port, timeout, concurrency))
+
+
+class Discovery:
+    """
+    Listens for the UDP beacons Tuya devices broadcast and keeps an
+    id -> {ip, version, product, seen} map of everything heard. With a
+    DeviceRegistry attached, a known device showing up at a new address is
+    handed to registry.set_address(), which reconnects it there.
+    """
+
+    def __init__(self, registry=None, ports=BEACON_PORTS, bind=""):
+        self.registry = registry
+        self.ports = ports
+        self.bind = bind
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.sockets = []
+        self.beacons = 0
+        self.moved = 0
+        self._running = False
+        self._thread = None
+
+    def open(self):
+        for port in self.ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                # Let other Tuya tools on this machine listen to the beacons too
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((self.bind, port))
+            self.sockets.append(sock)
+        return [sock.getsockname()[1] for sock in self.sockets]
+
+    def handle(self, data, source=None):
+        """Record one beacon; returns the decoded beacon or None."""
+        beacon = decode_beacon(data)
+        if beacon is None:
+            return None
+        device_id, ip, version = beacon["gwId"], beacon["ip"], beacon.get("version")
+        with self.lock:
+            self.beacons += 1
+            previous = self.devices.get(device_id)
+            self.devices[device_id] = {"ip": ip, "version": version, "product": beacon.get("productKey"),
+                                       "seen": time.time()}
+        if previous and previous["ip"] != ip:
+            log.info("moved from %s to %s", previous["ip"], ip, extra={"device": device_id})
+        if self.registry is not None and self.registry.set_address(device_id, ip, version):
+            self.moved += 1
+        return beacon
+
+    def run(self):
+        self._running = True
+        while self._running:
+            readable, _, _ = select.select(self.sockets, [], [], SELECT_TIMEOUT)
+            for sock in readable:
+                try:
+                    data, source = sock.recvfrom(4096)
+                except OSError:
+                    continue
+                self.handle(data, source)
+
+    def start(self):
+        if self._thread:
+            return
+        if not self.sockets:
+            self.open()
+        self._thread = threading.Thread(target=self.run, name="discovery", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for sock in self.sockets:
+            sock.close()
+        self.sockets = []
+
+    def address(self, device_id):
+        with self.lock:
+            return dict(self.devices.get(device_id) or {})
+
+    def snapshot(self):
+        with self.lock:
+            return {device_id: dict(info) for device_id, info in self.devices.items()}
+
+    def stats(self):
+        return {"beacons": self.beacons, "devices": len(self.devices), "moved": self.moved}
@@ -0,0 +1,346 @@
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.hsv import decode_hsv_hex, encode_hsv_hex_batch
+
+log = logging.getLogger(__name__)
+
+# Frames per second; the same default as the write scheduler's per-device rate limit
+FRAME_RATE = 5
+MAX_EFFECT_WORKERS = 16
+# Seconds a finished effect waits for a slow device before giving up on its last frame
+FINAL_FRAME_TIMEOUT = 5
+
+# Default length of each effect in seconds (the period for breathe and cycle)
+DURATIONS = {"fade": 2, "sunrise": 900, "breathe": 4, "cycle": 30}
+# Lowest value (0-1000) a fade-out or breathe goes down to; 10 is the dimmest the bulbs show
+MIN_VALUE = 10
+
+# Sunrise keyframes (fraction of duration, h, s, v): deep red to a soft yellow, then warm white
+SUNRISE = ((0.0, 0, 1000, 10), (0.4, 10, 1000, 150), (0.75, 30, 800, 550), (1.0, 45, 300, 1000))
+SUNRISE_WHITE = {'21': 'white', '22': 1000, '23': 200}
+
+
+class Effect:
+    """
+    Precomputed light frames played at frame_rate. Each frame is a DPS dict
+    (usually just '24'). start is merged into the first frame sent (power on,
+    colour mode) and end into the last one. A looping effect repeats its
+    frames until stopped.
+    """
+
+    def __init__(self, name, frames, frame_rate=FRAME_RATE, loop=False, start=None, end=None):
+        self.name = name
+        self.frames = frames
+        self.frame_rate = frame_rate
+        self.loop = loop
+        self.start = start or {}
+        self.end = end or {}
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame(self, index):
+        # DPS for frame index, or None once a non-looping effect is over
+        if self.loop:
+            frame = self.frames[index % len(self.frames)]
+        elif index < len(self.frames):
+            frame = self.frames[index]
+            if index == len(self.frames) - 1 and self.end:
+                frame = {**frame, **self.end}
+        else:
+            return None
+        return {**self.start, **frame} if index == 0 else frame
+
+
+def frame_count(duration, frame_rate):
+    return max(1, int(round(float(duration) * frame_rate)))
+
+
+def colour_frames(h, s, v):
+    return [{'24': colour} for colour in encode_hsv_hex_batch(h, s, v)]
+
+
+def current_hsv(status):
+    # The colour the light shows now; white mode counts as unsaturated at its brightness
+    if status.get('21') == 'colour' and status.get('24'):
+        return decode_hsv_hex(status['24'])
+    value = status.get('22', 1000) if status.get('20', True) else MIN_VALUE
+    return (0, 0, value)
+
+
+def fade(start_hsv, end_hsv, duration=DURATIONS["fade"], frame_rate=FRAME_RATE, end=None):
+    """Linear fade between two (h, s, v) colours, taking the short way round the hue circle."""
+    h0, s0, v0 = start_hsv
+    h1, s1, v1 = end_hsv
+    if s0 == 0:
+        h0 = h1  # No hue to start from, so don't sweep through the rainbow
+    elif s1 == 0:
+        h1 = h0
+    dh = (h1 - h0 + 180) % 360 - 180
+    n = frame_count(duration, frame_rate)
+    # The light is already at the start colour, so the first frame is one step in
+    steps = [(i + 1) / n for i in range(n)]
+    return Effect("fade", colour_frames([h0 + dh * t for t in steps], [s0 + (s1 - s0) * t for t in steps],
+                                        [v0 + (v1 - v0) * t for t in steps]),
+                  frame_rate, start={'20': True, '21': 'colour'}, end=end)
+
+
+def sunrise(duration=DURATIONS["sunrise"], frame_rate=FRAME_RATE):
+    """Slow ramp from a dim red glow to full warm white."""
+    n = frame_count(duration, frame_rate)
+    h, s, v = [], [], []
+    for i in range(n):
+        t = i / max(1, n - 1)
+        for (t0, *a), (t1, *b) in zip(SUNRISE, SUNRISE[1:]):
+            if t <= t1:
+                k = (t - t0) / (t1 - t0)
+                h.append(a[0] + (b[0] - a[0]) * k)
+                s.append(a[1] + (b[1] - a[1]) * k)
+                v.append(a[2] + (b[2] - a[2]) * k)
+                break
+    return Effect("sunrise", colour_frames(h, s, v), frame_rate,
+                  start={'20': True, '21': 'colour'}, end=SUNRISE_WHITE)
+
+
+def breathe(hsv, period=DURATIONS["breathe"], frame_rate=FRAME_RATE, low=MIN_VALUE):
+    """Brightness rises and falls smoothly between low and the colour's own value, forever."""
+    h, s, high = hsv
+    high = max(high, low)
+    n = max(2, frame_count(period, frame_rate))
+    v = [high - (high - low) * (1 - math.cos(2 * math.pi * i / n)) / 2 for i in range(n)]
+    return Effect("breathe", colour_frames([h] * n, [s] * n, v), frame_rate, loop=True,
+                  start={'20': True, '21': 'colour'})
+
+
+def cycle(period=DURATIONS["cycle"], frame_rate=FRAME_RATE, saturation=1000, value=1000, hue=0):
+    """Full trip round the hue circle every period seconds, forever."""
+    n = max(2, frame_count(period, frame_rate))
+    return Effect("cycle", colour_frames([hue + 360 * i / n for i in range(n)], [saturation] * n, [value] * n),
+                  frame_rate, loop=True, start={'20': True, '21': 'colour'})
+
+
+def parse_effect(payload, status, frame_rate=FRAME_RATE):
+    """
+    Effect for a pi/<device>/effect payload, built against the light's
+    current status. Payloads are "<name>[:<args>][:<seconds>]":
+
+        fade:<h>,<s>,<v>[:seconds]   fade:off[:seconds]
+        sunrise[:seconds]            breathe[:seconds]   cycle[:seconds]
+
+    Returns None (after printing why) for anything else; "stop" is handled
+    by the caller.
+    """
+    parts = [part.strip() for part in payload.split(":")]
+    name = parts[0].lower()
+    try:
+        if name == "fade" and len(parts) in (2, 3):
+            duration = float(parts[2]) if len(parts) == 3 else DURATIONS["fade"]
+            start = current_hsv(status)
+            if parts[1].lower() == "off":
+                return fade(start, (start[0], start[1], MIN_VALUE), duration, frame_rate, end={'20': False})
+            h, s, v = (float(x) for x in parts[1].split(","))
+            return fade(start, (h % 360, max(0, min(1000, s)), max(0, min(1000, v))), duration, frame_rate)
+
+        if name in ("sunrise", "breathe", "cycle") and len(parts) <= 2:
+            duration = float(parts[1]) if len(parts) == 2 else DURATIONS[name]
+            if name == "sunrise":
+                return sunrise(duration, frame_rate)
+            if name == "breathe":
+                h, s, v = current_hsv(status)
+                return breathe((h, s, max(v, 100)), duration, frame_rate)
+            return cycle(duration, frame_rate)
+    except ValueError:
+        pass
+    log.warning("unknown effect: %s", payload)
+    return None
+
+
+class EffectRun:
+    def __init__(self, label, effects):
+        self.label = label
+        self.effects = effects
+        # Everyone the run started on; effects loses devices as they are stopped
+        self.members = list(effects)
+        self.frame_rate = max(effect.frame_rate for effect in effects.values())
+        self.stop = threading.Event()
+        # Frames dropped while a device was busy; their mode/power changes still have to go out
+        self.carry = {}
+        self.positions = {}
+        self.reason = "done"
+
+    @property
+    def devices(self):
+        return list(self.effects)
+
+
+class EffectEngine:
+    """
+    Plays effects on one or many lights at once.
+
+    Each run has its own timer thread. Frame n is due at start + n / rate,
+    so a late tick doesn't push every later frame back (no drift), and when
+    the timer falls more than a frame behind it jumps to the frame that is
+    due now. Frames are sent on a worker pool; if a device is still busy
+    with its previous frame the new one is dropped rather than queued, so a
+    slow bulb lags by at most one frame instead of building a backlog. The
+    last frame of a finished effect is always delivered.
+
+    send(device, dps) writes one frame and returns False on failure.
+    on_finish(run) is called when a run ends, with run.reason "done" or "stopped".
+    """
+
+    def __init__(self, send, max_workers=MAX_EFFECT_WORKERS, on_finish=None):
+        self.send = send
+        self.on_finish = on_finish
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="effects")
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.runs = {}
+        self.in_flight = set()
+        self.started = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_skipped = 0
+        self.failed = 0
+        self.max_lateness = 0.0
+
+    def start(self, label, effects):
+        """Play {device: Effect}; devices already running an effect stop it first."""
+        if not effects:
+            return None
+        run = EffectRun(label, dict(effects))
+        self.stop(run.devices)
+        with self.lock:
+            for device in run.devices:
+                self.runs[device] = run
+            self.started += 1
+        threading.Thread(target=self._play, args=(run,), name=f"effect-{label}", daemon=True).start()
+        return run
+
+    def stop(self, devices):
+        """Stop whatever is playing on devices; returns the devices that were running one."""
+        stopped = []
+        with self.lock:
+            for device in devices:
+                run = self.runs.pop(device, None)
+                if run is None:
+                    continue
+                stopped.append(device)
+                run.effects.pop(device, None)
+                run.carry.pop(device, None)
+                if not run.effects:
+                    run.reason = "stopped"
+                    run.stop.set()
+        return stopped
+
+    def running(self, device):
+        with self.lock:
+            run = self.runs.get(device)
+            return run.effects[device].name if run else None
+
+    def _play(self, run):
+        interval = 1.0 / run.frame_rate
+        started = time.monotonic()
+        index = 0
+        while not run.stop.is_set():
+            due = started + index * interval
+            wait = due - time.monotonic()
+            if wait > 0:
+                if run.stop.wait(wait):
+                    break
+            else:
+                lateness = -wait
+                self.max_lateness = max(self.max_lateness, lateness)
+                if lateness >= interval:
+                    # The timer fell behind; skip straight to the frame that is due now
+                    skip = int(lateness / interval)
+                    self.frames_skipped += skip
+                    index += skip
+
+            with self.lock:
+                effects = list(run.effects.items())
+            for device, effect in effects:
+                # A finished effect holds its last frame, which is sent once even if skipped to
+                position = index if effect.loop else min(index, len(effect) - 1)
+                if run.positions.get(device) != position:
+                    run.positions[device] = position
+                    self._dispatch(run, device, effect.frame(position))
+            if all(not effect.loop and index >= len(effect) - 1 for _, effect in effects):
+                break
+            index += 1
+
+        if run.reason == "done":
+            self._finish(run)
+        with self.lock:
+            for device in run.members:
+                if self.runs.get(device) is run:
+                    del self.runs[device]
+        if self.on_finish:
+            try:
+                self.on_finish(run)
+            except Exception as error:
+                log.error("effect %s: finish callback failed: %s", run.label, error)
+
+    def _dispatch(self, run, device, frame):
+        with self.lock:
+            if run.stop.is_set() or device not in run.effects:
+                return
+            if device in self.in_flight:
+                run.carry[device] = {**run.carry.get(device, {}), **frame}
+                self.frames_dropped += 1
+                return
+            dps = {**run.carry.pop(device, {}), **frame}
+            self.in_flight.add(device)
+        self.executor.submit(self._send, device, dps)
+
+    def _send(self, device, dps):
+        try:
+            if self.send(device, dps) is False:
+                self.failed += 1
+            else:
+                self.frames_sent += 1
+        except Exception as error:
+            self.failed += 1
+            log.warning("effect frame failed: %s", error, extra={"device": device})
+        finally:
+            with self.lock:
+                self.in_flight.discard(device)
+                self.idle.notify_all()
+
+    def _finish(self, run):
+        # Deliver the last frame to devices that dropped it for being busy
+        deadline = time.monotonic() + FINAL_FRAME_TIMEOUT
+        with self.lock:
+            pending = [device for device in run.devices if device in run.carry]
+        for device in pending:
+            with self.lock:
+                if not self.idle.wait_for(lambda: device not in self.in_flight,
+                                          max(0.0, deadline - time.monotonic())):
+                    continue
+                dps = run.carry.pop(device, None)
+                if not dps or device not in run.effects:
+                    continue
+                self.in_flight.add(device)
+            self._send(device, dps)
+
+    def stats(self):
+        with self.lock:
+            running = len(self.runs)
+        return {
+            "started": self.started,
+            "running": running,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "frames_skipped": self.frames_skipped,
+            "failed": self.failed,
+            "max_lateness_ms": round(self.max_lateness * 1000, 1),
+        }
+
+    def shutdown(self):
+        with self.lock:
+            devices = list(self.runs)
+        self.stop(devices)
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,191 @@
+import time
+
+try:
+    import numpy as np
+except ImportError:  # Pure-Python integration below is used instead
+    np = None
+
+HOUR = 3600
+# Intervals between samples longer than this are treated as missing data, not integrated
+MAX_GAP = 300
+
+# Tariff windows as (start_hour, end_hour) in local time; hours outside every window
+# fall under DEFAULT_TARIFF
+TARIFFS = {"peak": ((7, 10), (17, 20))}
+DEFAULT_TARIFF = "offpeak"
+
+
+def tariff_for_hour(hour, tariffs=None, default=DEFAULT_TARIFF):
+    for name, windows in (TARIFFS if tariffs is None else tariffs).items():
+        for start, end in windows:
+            if start <= hour < end:
+                return name
+    return default
+
+
+def _hour_shift(ts):
+    # Offset of local hour boundaries from multiples of 3600 (non-zero for e.g. UTC+5:30)
+    return time.localtime(ts).tm_gmtoff % HOUR
+
+
+def _hourly_numpy(ts, watts, max_gap, shift):
+    ts = np.asarray(ts, dtype=float)
+    watts = np.asarray(watts, dtype=float)
+    if ts.size < 2:
+        return [], []
+    if np.any(ts[1:] < ts[:-1]):
+        order = np.argsort(ts, kind="stable")
+        ts, watts = ts[order], watts[order]
+
+    # Trapezoid per interval between neighbouring samples, zero across gaps;
+    # duplicate timestamps give empty intervals, which don't cover an hour either
+    dt = np.diff(ts)
+    ok = (dt > 0) & (dt <= max_gap)
+    energy = (watts[:-1] + watts[1:]) * dt * ok / (2 * HOUR)
+
+    # Hour boundaries are few, so locate them with a binary search instead of
+    # bucketing every sample. Interval i belongs to the hour ts[i] falls in.
+    start = np.floor((ts[0] + shift) / HOUR) * HOUR - shift
+    edges = start + HOUR * np.arange(1, int((ts[-1] - start) // HOUR) + 1)
+    first = np.searchsorted(ts[:-1], np.concatenate(([start], edges)), side="left")
+
+    # Intervals that straddle a boundary are split at it (max_gap <= HOUR, so a
+    # valid interval straddles at most one)
+    tail = np.zeros(first.size)
+    if edges.size:
+        index = first[1:] - 1
+        t0, t1 = ts[index], ts[index + 1]
+        split = ok[index] & (t0 < edges)
+        w0, w1 = watts[index], watts[index + 1]
+        w_edge = w0 + (w1 - w0) * (edges - t0) / np.where(split, t1 - t0, 1.0)
+        head = (w0 + w_edge) * (edges - t0) / (2 * HOUR)
+        energy[index[split]] = head[split]
+        tail[1:][split] = ((w_edge + w1) * (t1 - edges) / (2 * HOUR))[split]
+    else:
+        split = np.zeros(0, dtype=bool)
+
+    # Sum each hour's intervals; the padding keeps every index in range, and
+    # reduceat returns a stray element for empty hours, so mask those
+    counts = np.diff(np.append(first, ts.size - 1))
+    sums = np.add.reduceat(np.append(energy, 0.0), first) * (counts > 0) + tail
+    covered = np.add.reduceat(np.append(ok, False).astype(np.int64), first) * (counts > 0)
+    covered[1:] += split
+    hours = np.nonzero(covered)[0]
+    return (start + hours * HOUR).tolist(), sums[hours].tolist()
+
+
+def _hourly_python(ts, watts, max_gap, shift):
+    samples = sorted(zip(ts, watts), key=lambda sample: sample[0])
+    if len(samples) < 2:
+        return [], []
+
+    sums = {}
+    for (t0, w0), (t1, w1) in zip(samples, samples[1:]):
+        if t1 - t0 > max_gap or t1 == t0:
+            continue
+        hour0 = (t0 + shift) // HOUR * HOUR - shift
+        edge = hour0 + HOUR
+        if t1 <= edge:
+            sums[hour0] = sums.get(hour0, 0.0) + (w0 + w1) * (t1 - t0) / (2 * HOUR)
+        else:
+            w_edge = w0 + (w1 - w0) * (edge - t0) / (t1 - t0)
+            sums[hour0] = sums.get(hour0, 0.0) + (w0 + w_edge) * (edge - t0) / (2 * HOUR)
+            sums[edge] = sums.get(edge, 0.0) + (w_edge + w1) * (t1 - edge) / (2 * HOUR)
+
+    hours = sorted(sums)
+    return [float(hour) for hour in hours], [sums[hour] for hour in hours]
+
+
+def energy_by_hour(ts, watts, max_gap=MAX_GAP):
+    """
+    Integrate power samples (epoch seconds, watts) into Wh per local clock
+    hour, as (hour_starts, wh) lists covering only hours with data. Samples
+    may be irregular and unsorted; each pair of neighbouring samples is
+    integrated with the trapezoid rule, and pairs further apart than max_gap
+    count as missing data.
+    """
+    if len(ts) == 0:
+        return [], []
+    max_gap = min(max_gap, HOUR)
+    if np is not None:
+        ts = np.asarray(ts, dtype=float)
+        return _hourly_numpy(ts, watts, max_gap, _hour_shift(float(ts.min())))
+    return _hourly_python(ts, watts, max_gap, _hour_shift(float(min(ts))))
+
+
+def integrate(ts, watts, max_gap=MAX_GAP):
+    """Total Wh for a series of power samples."""
+    return sum(energy_by_hour(ts, watts, max_gap)[1])
+
+
+def energy_by_period(ts, watts, tariffs=None, max_gap=MAX_GAP):
+    """Wh per local day and tariff window, as {("YYYY-MM-DD", tariff): wh}."""
+    totals = {}
+    for hour, wh in zip(*energy_by_hour(ts, watts, max_gap)):
+        local = time.localtime(hour)
+        key = (time.strftime("%Y-%m-%d", local), tariff_for_hour(local.tm_hour, tariffs))
+        totals[key] = totals.get(key, 0.0) + wh
+    return totals
+
+
+class EnergyMeter:
+    """
+    Running energy total for one plug, fed one power sample at a time from
+    the poll loop. today() resets at local midnight; by_tariff() breaks
+    today down by tariff window.
+    """
+
+    def __init__(self, max_gap=MAX_GAP, tariffs=None):
+        self.max_gap = max_gap
+        self.tariffs = tariffs
+        self.last = None
+        self.day = None
+        self.today_wh = {}
+        self.total_wh = 0.0
+
+    def add(self, ts, watts):
+        if self.last is not None and ts > self.last[0]:
+            periods = energy_by_period([self.last[0], ts], [self.last[1], watts], self.tariffs, self.max_gap)
+            for (day, tariff), wh in sorted(periods.items()):
+                self._credit(day, tariff, wh)
+        if self.last is None or ts >= self.last[0]:
+            self.last = (ts, watts)
+        self._roll(ts)
+
+    def seed(self, ts, watts):
+        # Start today's total from recorded history (e.g. after a restart)
+        today = time.strftime("%Y-%m-%d", time.localtime())
+        for (day, tariff), wh in energy_by_period(ts, watts, self.tariffs, self.max_gap).items():
+            if day == today:
+                self._credit(day, tariff, wh)
+        if len(ts):
+            latest = max(range(len(ts)), key=lambda index: ts[index])
+            self.last = (ts[latest], watts[latest])
+
+    def seed_from(self, history, device):
+        # Raw power samples since local midnight from a TimeSeriesStore
+        midnight = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+        samples = history.query("power", midnight, devices=[device], resolution="raw").get(device)
+        if samples:
+            self.seed([row[0] for row in samples], [row[1] for row in samples])
+
+    def _credit(self, day, tariff, wh):
+        self.total_wh += wh
+        if self.day is None or day > self.day:
+            self.day = day
+            self.today_wh = {}
+        if day == self.day:
+            self.today_wh[tariff] = self.today_wh.get(tariff, 0.0) + wh
+
+    def _roll(self, ts):
+        day = time.strftime("%Y-%m-%d", time.localtime(ts))
+        if self.day is None or day > self.day:
+            self.day = day
+            self.today_wh = {}
+
+    def today(self):
+        """kWh since local midnight."""
+        return sum(self.today_wh.values()) / 1000
+
+    def by_tariff(self):
+        return {tariff: wh / 1000 for tariff, wh in self.today_wh.items()}
@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+GROUPS_FILE = "groups.json"
+MAX_GROUP_WORKERS = 32
+# Seconds a member waits for the rest of its wave before giving up on the send
+BARRIER_TIMEOUT = 5
+
+
+def load_groups(path=GROUPS_FILE):
+    """
+    Group definitions as {"living_room": ["light1", "light2", ...], ...}.
+    Members are device topic ids or names. A missing file means no groups.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        groups = json.load(f)
+    return {name: list(members) for name, members in groups.items()}
+
+
+def resolve_members(groups, devices):
+    # Map every group member to a known device key, dropping unknown ones
+    by_name = {device.name: key for key, device in devices.items()}
+    resolved = {}
+    for name, members in groups.items():
+        keys = []
+        for member in members:
+            key = member if member in devices else by_name.get(member)
+            if key is None:
+                log.warning("group %s: unknown member %s", name, member)
+            elif key not in keys:
+                keys.append(key)
+        resolved[name] = keys
+    return resolved
+
+
+class GroupDispatcher:
+    """
+    Sends one command to every member of a group at the same moment.
+
+    prepare(member) works out what to send (it may read state and is run for
+    all members first): {} when the member is already in the requested state,
+    None when the command does not apply to it (brightness for a plug in a
+    mixed group). send(member, values) then runs on one thread per
+    member, released together by a barrier so the devices change within a
+    tight window. run() returns a report with per-member latency and errors.
+
+    Runs are serialised: two groups' waves sharing the pool could otherwise
+    fill it with waiters from different barriers, none of which can trip.
+    """
+
+    def __init__(self, max_workers=MAX_GROUP_WORKERS, barrier_timeout=BARRIER_TIMEOUT):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="groups")
+        self.max_workers = max_workers
+        self.barrier_timeout = barrier_timeout
+        self.lock = threading.Lock()
+        self.dispatched = 0
+        self.failed = 0
+
+    def _prepare(self, members, prepare):
+        futures = {member: self.executor.submit(prepare, member) for member in members}
+        values, errors = {}, {}
+        for member, future in futures.items():
+            try:
+                values[member] = future.result()
+            except Exception as error:
+                errors[member] = str(error)
+        return values, errors
+
+    def _send(self, barrier, send, member, values):
+        try:
+            barrier.wait(self.barrier_timeout)
+        except threading.BrokenBarrierError:
+            # Never sent: the rest of the wave didn't arrive in time
+            return None, None, False, "barrier broken"
+        start = time.monotonic()
+        try:
+            ok = send(member, values) is not False
+            error = None if ok else "write failed"
+        except Exception as exc:
+            ok, error = False, str(exc)
+        return start, time.monotonic(), ok, error
+
+    def run(self, name, members, prepare, send):
+        with self.lock:
+            return self._run(name, members, prepare, send)
+
+    def _run(self, name, members, prepare, send):
+        started = time.monotonic()
+        values, errors = self._prepare(members, prepare)
+        targets = [member for member in members if values.get(member)]
+
+        results = {}
+        for member, error in errors.items():
+            results[member] = {"ok": False, "latency_ms": None, "error": error}
+        not_applicable = []
+        for member in members:
+            if member in errors or member in targets:
+                continue
+            if values.get(member) is None:
+                # Nothing was written, so neither a success nor a device failure
+                not_applicable.append(member)
+                results[member] = {"ok": False, "latency_ms": None, "not_applicable": True}
+            else:
+                # Already in the requested state
+                results[member] = {"ok": True, "latency_ms": 0.0, "skipped": True}
+
+        # More members than threads would deadlock on the barrier, so release
+        # in waves of at most max_workers
+        finished = []
+        sent = 0
+        for index in range(0, len(targets), self.max_workers):
+            wave = targets[index:index + self.max_workers]
+            barrier = threading.Barrier(len(wave))
+            futures = {member: self.executor.submit(self._send, barrier, send, member, values[member])
+                       for member in wave}
+            for member, future in futures.items():
+                start, end, ok, error = future.result()
+                if start is None:
+                    results[member] = {"ok": False, "latency_ms": None, "error": error}
+                    continue
+                sent += 1
+                finished.append(end)
+                results[member] = {"ok": ok, "latency_ms": round((end - start) * 1000, 1)}
+                if error:
+                    results[member]["error"] = error
+
+        failures = [member for member, result in results.items()
+                    if not result["ok"] and member not in not_applicable]
+        self.dispatched += 1
+        self.failed += len(failures)
+        return {
+            "group": name,
+            "members": results,
+            "sent": sent,
+            "failed": failures,
+            "not_applicable": not_applicable,
+            "spread_ms": round((max(finished) - min(finished)) * 1000, 1) if finished else 0.0,
+            "total_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+
+    def stats(self):
+        return {"dispatched": self.dispatched, "member_failures": self.failed}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,16 +1,29 @@
 import colorsys
-from typing import Tuple
+from functools import lru_cache
+from typing import List, Sequence, Tuple
 
+try:
+    import numpy as np
+except ImportError:  # The batch functions fall back to the single-value ones
+    np = None
+
+# Distinct colours remembered by the single-value decoders
+COLOR_CACHE_SIZE = 1024
+
+INVALID_HSV = (0, 1000, 1000)
+
+
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
 def decode_hsv_hex(hex_str: str) -> Tuple[int, int, int]:
     if not hex_str or len(hex_str) != 12:
-        return (0, 1000, 1000)
+        return INVALID_HSV
     try:
         h = int(hex_str[0:4], 16)
         s = int(hex_str[4:8], 16)
         v = int(hex_str[8:12], 16)
         return (h, s, v)
     except ValueError:
-        return (0, 1000, 1000)
+        return INVALID_HSV
 
 def encode_hsv_hex(h: int, s: int, v: int) -> str:
     h = int(h) % 360
@@ -18,6 +31,7 @@ def encode_hsv_hex(h: int, s: int, v: int) -> str:
     v = max(0, min(1000, int(v)))
     return f"{h:04x}{s:04x}{v:04x}"
 
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
 def hsv_to_rgb_hex(hex_str: str) -> str:
     try:
         if not hex_str or len(hex_str) != 12:
@@ -27,3 +41,108 @@ def hsv_to_rgb_hex(hex_str: str) -> str:
         return f"#{int(r*255):02x}{int(g*255):02x}{int(b*255):02x}"
     except Exception:
         return "#ffffff"
+
+
+# -----------------------------------------------------------------------------
+# Batch API: whole lists of colours at once (group fades, effects, telemetry
+# for many bulbs). Results match the single-value functions element for element.
+# -----------------------------------------------------------------------------
+
+if np is not None:
+    _HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+    _HEX_VALUES = np.full(256, 255, dtype=np.uint8)
+    for _value, _char in enumerate(b"0123456789abcdef"):
+        _HEX_VALUES[_char] = _value
+        _HEX_VALUES[bytes([_char]).upper()[0]] = _value
+    _NIBBLES = np.array([4096, 256, 16, 1], dtype=np.int64)
+
+
+def _hex_strings(digits, width):
+    # (n, width) nibble array -> list of lowercase hex strings
+    chars = _HEX_DIGITS[digits].view(f"S{width}").ravel()
+    return chars.astype(str).tolist()
+
+
+def _nibbles(values, count):
+    shifts = np.arange(4 * (count - 1), -1, -4)
+    return (values[:, None] >> shifts) & 0xF
+
+
+def _decode_arrays(hex_strs):
+    # -> (h, s, v) int64 arrays, or None if the input can't be handled as ASCII
+    clean = [item if isinstance(item, str) and len(item) == 12 else "" for item in hex_strs]
+    try:
+        raw = np.array(clean, dtype="S12")
+    except UnicodeEncodeError:
+        return None
+    digits = _HEX_VALUES[raw.view(np.uint8).reshape(len(clean), 12)]
+    invalid = (digits == 255).any(axis=1)
+    values = digits.reshape(-1, 3, 4).astype(np.int64) @ _NIBBLES
+    values[invalid] = INVALID_HSV
+    return values[:, 0], values[:, 1], values[:, 2]
+
+
+def _rgb_arrays(h, s, v):
+    # colorsys.hsv_to_rgb on arrays, scaled and truncated like hsv_to_rgb_hex
+    h = np.asarray(h, dtype=float) / 360.0
+    s = np.asarray(s, dtype=float) / 1000.0
+    v = np.asarray(v, dtype=float) / 1000.0
+    i = (h * 6.0).astype(np.int64)
+    f = h * 6.0 - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i %= 6
+    r = np.choose(i, [v, q, p, p, t, v])
+    g = np.choose(i, [t, v, v, q, p, p])
+    b = np.choose(i, [p, p, t, v, v, q])
+    grey = s == 0.0
+    r, g, b = (np.where(grey, v, channel) for channel in (r, g, b))
+    return tuple((channel * 255).astype(np.int64) for channel in (r, g, b))
+
+
+def decode_hsv_hex_batch(hex_strs: Sequence[str]) -> List[Tuple[int, int, int]]:
+    """Decode many Tuya HHHHSSSSVVVV strings to (h, s, v) tuples."""
+    if np is not None and len(hex_strs):
+        arrays = _decode_arrays(hex_strs)
+        if arrays is not None:
+            return list(zip(*(array.tolist() for array in arrays)))
+    return [decode_hsv_hex.__wrapped__(item) for item in hex_strs]
+
+
+def encode_hsv_hex_batch(h: Sequence[int], s: Sequence[int], v: Sequence[int]) -> List[str]:
+    """Encode parallel sequences of hue (0-360), saturation and value (0-1000)."""
+    if np is not None and len(h):
+        h = np.asarray(h, dtype=float).astype(np.int64) % 360
+        s = np.clip(np.asarray(s, dtype=float).astype(np.int64), 0, 1000)
+        v = np.clip(np.asarray(v, dtype=float).astype(np.int64), 0, 1000)
+        digits = np.concatenate([_nibbles(h, 4), _nibbles(s, 4), _nibbles(v, 4)], axis=1)
+        return _hex_strings(digits.astype(np.uint8), 12)
+    return [encode_hsv_hex(*hsv) for hsv in zip(h, s, v)]
+
+
+def hsv_to_rgb_batch(h: Sequence[int], s: Sequence[int], v: Sequence[int]) -> List[Tuple[int, int, int]]:
+    """Tuya-range HSV to 0-255 (r, g, b) tuples."""
+    if np is not None and len(h):
+        return list(zip(*(channel.tolist() for channel in _rgb_arrays(h, s, v))))
+    result = []
+    for hue, sat, val in zip(h, s, v):
+        r, g, b = colorsys.hsv_to_rgb(hue/360.0, sat/1000.0, val/1000.0)
+        result.append((int(r*255), int(g*255), int(b*255)))
+    return result
+
+
+def hsv_hex_to_rgb_hex_batch(hex_strs: Sequence[str]) -> List[str]:
+    """hsv_to_rgb_hex for many Tuya colour strings ("#ffffff" for invalid ones)."""
+    if np is not None and len(hex_strs):
+        arrays = _decode_arrays(hex_strs)
+        if arrays is not None:
+            channels = np.stack(_rgb_arrays(*arrays), axis=1)
+            if channels.min() >= 0 and channels.max() <= 255:
+                digits = np.stack([channels >> 4, channels & 0xF], axis=2).reshape(-1, 6)
+                colours = ["#" + colour for colour in _hex_strings(digits.astype(np.uint8), 6)]
+                for index, item in enumerate(hex_strs):
+                    if not isinstance(item, str) or len(item) != 12:
+                        colours[index] = "#ffffff"
+                return colours
+    return [hsv_to_rgb_hex.__wrapped__(item) for item in hex_strs]
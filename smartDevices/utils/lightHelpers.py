@@ -1,57 +1,107 @@
+import logging
 from utils.hsv import decode_hsv_hex, encode_hsv_hex, hsv_to_rgb_hex
 from utils.converters import brightness_percent_to_tuya, tuya_to_brightness_percent
 
+log = logging.getLogger(__name__)
+
+
+def target_values(status, power=None, mode=None, brightness=None, temperature=None, hsv=None):
+    """
+    DPS values for a target light state, resolved against the current status.
+    Only the parts of the target that are given are included; power may also
+    be "toggle". brightness is a percentage, temperature and hsv use Tuya ranges.
+    """
+    values = {}
+
+    if power == "toggle":
+        values['20'] = not status.get('20', False)
+    elif power is not None:
+        values['20'] = bool(power)
+
+    if hsv is not None:
+        h, s, v = hsv
+        h = int(float(h)) % 360
+        s = max(0, min(1000, int(float(s))))
+        v = max(0, min(1000, int(float(v))))
+        if brightness is not None:
+            v = brightness_percent_to_tuya(max(0, min(100, int(float(brightness)))))
+        values['21'] = 'colour'
+        values['24'] = encode_hsv_hex(h, s, v)
+
+    elif temperature is not None:
+        values['21'] = 'white'
+        values['23'] = max(0, min(1000, int(float(temperature))))
+        if brightness is not None:
+            values['22'] = brightness_percent_to_tuya(max(0, min(100, int(float(brightness)))))
+        elif status.get('21', 'white') == 'white':
+            values['22'] = max(100, status.get('22', 500))
+        else:
+            _, _, v = decode_hsv_hex(status.get('24', '000003e803e8'))
+            values['22'] = max(100, v)
+
+    elif brightness is not None:
+        percent = max(0, min(100, int(float(brightness))))
+        if (mode or status.get('21', 'white')) == 'colour':
+            h, s, _ = decode_hsv_hex(status.get('24', '000003e803e8'))
+            values['21'] = 'colour'
+            values['24'] = encode_hsv_hex(h, s, brightness_percent_to_tuya(percent))
+        else:
+            values['22'] = brightness_percent_to_tuya(percent)
+
+    if mode is not None and '21' not in values:
+        values['21'] = mode
+
+    return values
+
+
+def state_diff(status, values):
+    return {dp: value for dp, value in values.items() if status.get(dp) != value}
+
+
+def apply_state(smart_light, get_status, **target):
+    """
+    Move the light to a target state in a single set_multiple_values frame,
+    sending only the DPS that differ from the current status. get_status may
+    be None to skip the read and send every targeted DPS. Returns what was sent.
+    """
+    status = get_status() if get_status else {}
+    diff = state_diff(status, target_values(status, **target))
+    if diff and smart_light:
+        smart_light.set_multiple_values(diff)
+    return diff
+
 
 def turn_on(smart_light):
     if smart_light:
-        smart_light.set_value('20', True)
+        apply_state(smart_light, None, power=True)
         print("Light ON")
 
 
 def turn_off(smart_light):
     if smart_light:
-        smart_light.set_value('20', False)
+        apply_state(smart_light, None, power=False)
         print("Light OFF")
 
 
 def toggle(smart_light, get_status):
     if smart_light:
-        status = get_status()
-        is_on = status.get("20", False)
-        smart_light.set_value('20', not is_on)
-        print(f"Light toggled ({'ON' if not is_on else 'OFF'})")
+        diff = apply_state(smart_light, get_status, power="toggle")
+        print(f"Light toggled ({'ON' if diff.get('20') else 'OFF'})")
 
 
 def set_brightness(smart_light, get_status, brightness):
     try:
-        percent = max(0, min(100, int(float(brightness))))
-        status = get_status()
-        mode = status.get('21', 'white')
-        
-        if mode == 'colour':
-            current_color = status.get('24', '000003e803e8')
-            h, s, _ = decode_hsv_hex(current_color)
-            v = brightness_percent_to_tuya(percent)
-            new_hex = encode_hsv_hex(h, s, v)
-            
-            smart_light.set_multiple_values({'21': 'colour', '24': new_hex})
-            print(f"Brightness: {percent}% (colour mode)")
-        else:
-            tuya_val = brightness_percent_to_tuya(percent)
-            smart_light.set_value('22', tuya_val)
-            print(f"Brightness: {percent}% (white mode)")
+        diff = apply_state(smart_light, get_status, brightness=brightness)
+        mode = "colour" if '24' in diff else "white"
+        print(f"Brightness: {max(0, min(100, int(float(brightness))))}% ({mode} mode)")
     except Exception as e:
         print(f"Error setting brightness: {e}")
 
 
 def set_color(smart_light, h, s, v):
     try:
-        h = int(float(h)) % 360
-        s = max(0, min(1000, int(float(s))))
-        v = max(0, min(1000, int(float(v))))
-        
-        hex_str = encode_hsv_hex(h, s, v)
-        smart_light.set_multiple_values({'21': 'colour', '24': hex_str})
+        diff = apply_state(smart_light, None, hsv=(h, s, v))
+        h, s, v = decode_hsv_hex(diff['24'])
         print(f"Color: H={h}, S={s}, V={v}")
     except Exception as e:
         print(f"Error setting color: {e}")
@@ -59,22 +109,74 @@ def set_color(smart_light, h, s, v):
 
 def set_temperature(smart_light, get_status, temp):
     try:
-        temp_val = max(0, min(1000, int(float(temp))))
         status = get_status()
-        mode = status.get('21', 'white')
+        values = target_values(status, temperature=temp)
+        diff = state_diff(status, values)
+        if diff:
+            smart_light.set_multiple_values(diff)
+        print(f"Temperature: {values['23']} (brightness: {values['22']})")
+    except Exception as e:
+        print(f"Error setting temperature: {e}")
 
-        if mode == 'white':
-            brightness = status.get('22', 500)
-        else:
-            current_color = status.get('24', '000003e803e8')
-            _, _, brightness = decode_hsv_hex(current_color)
 
-        brightness = max(100, brightness)
+def read_telemetry(dps):
+    state = "ON" if dps.get("20", False) else "OFF"
+    mode = dps.get("21", "unknown")
 
-        smart_light.set_value('21', 'white')
-        smart_light.set_value('23', temp_val)
-        smart_light.set_value('22', brightness)
-        
-        print(f"Temperature: {temp_val} (brightness: {brightness})")
-    except Exception as e:
-        print(f"Error setting temperature: {e}")
\ No newline at end of file
+    if mode == 'colour':
+        raw_color = dps.get("24", "000003e803e8")
+        _, _, v = decode_hsv_hex(raw_color)
+        brightness = tuya_to_brightness_percent(v)
+    else:
+        brightness = tuya_to_brightness_percent(dps.get("22", 10))
+
+    color_temp = dps.get("23", 0)
+    color_hex = hsv_to_rgb_hex(dps.get("24", ""))
+
+    return {
+        "state": state,
+        "mode": mode,
+        "brightness": brightness,
+        "color_temp": color_temp,
+        "color": color_hex,
+    }
+
+
+def format_telemetry(fields):
+    return {key: str(value) for key, value in fields.items()}
+
+
+def command_values(get_status, payload):
+    """
+    DPS values a dashboard command asks for, without writing them (None if
+    invalid). on/off/color are always sent in full; commands that depend on
+    the current state only return the DPS that actually change.
+    """
+    cmd_lower = payload.lower()
+    val = None
+    if ":" in payload:
+        cmd_lower, val = payload.split(":", 1)
+        cmd_lower = cmd_lower.lower().strip()
+        val = val.strip()
+
+    try:
+        if cmd_lower in ("on", "off") and val is None:
+            return target_values({}, power=cmd_lower == "on")
+        if cmd_lower == "color" and val is not None:
+            return target_values({}, hsv=val.split(","))
+
+        if cmd_lower == "toggle" and val is None:
+            target = {"power": "toggle"}
+        elif cmd_lower == "brightness" and val is not None:
+            target = {"brightness": val}
+        elif cmd_lower == "temperature" and val is not None:
+            target = {"temperature": val}
+        else:
+            log.warning("unknown command: %s", payload)
+            return None
+
+        status = get_status()
+        return state_diff(status, target_values(status, **target))
+    except ValueError:
+        log.warning("invalid value in command: %s", payload)
+        return None
@@ -0,0 +1,120 @@
+import logging
+import select
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 9
+FALLBACK_POLL_INTERVAL = 30
+SELECT_TIMEOUT = 1
+
+
+class PushListener:
+    """
+    Waits on the pooled device sockets for the DPS frames devices push on
+    their own (physical switch, Tuya app, our own writes) and reports them
+    as they arrive. A device that has not pushed anything for
+    FALLBACK_POLL_INTERVAL seconds gets a full status() read instead.
+    """
+
+    def __init__(self, pool, on_update, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 fallback_poll_interval=FALLBACK_POLL_INTERVAL):
+        self.pool = pool
+        self.on_update = on_update
+        self.heartbeat_interval = heartbeat_interval
+        self.fallback_poll_interval = fallback_poll_interval
+        self.dps = {}
+        self.last_push = {}
+        self.last_poll = {}
+        self.last_heartbeat = {}
+        self.pushes = 0
+        self.polls = 0
+        self._running = False
+        self._thread = None
+
+    def add(self, key):
+        self.dps.setdefault(key, {})
+        self.last_push.setdefault(key, 0.0)
+        self.last_poll.setdefault(key, 0.0)
+        self.last_heartbeat.setdefault(key, 0.0)
+
+    def remove(self, key):
+        for table in (self.dps, self.last_push, self.last_poll, self.last_heartbeat):
+            table.pop(key, None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="push-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def run(self):
+        self._running = True
+        while self._running:
+            sockets = {}
+            for key in list(self.dps):
+                conn = self.pool.connections.get(key)
+                if conn is not None and conn.device.socket is not None:
+                    sockets[conn.device.socket] = key
+
+            if sockets:
+                readable, _, _ = select.select(list(sockets), [], [], SELECT_TIMEOUT)
+            else:
+                readable = []
+                time.sleep(SELECT_TIMEOUT)
+
+            for sock in readable:
+                self._receive(sockets[sock])
+
+            now = time.monotonic()
+            for key in list(self.dps):
+                try:
+                    self._maintain(key, now)
+                except KeyError:
+                    pass  # Removed from the pool while we were looking at it
+                except Exception as error:
+                    # One unreachable device must not end the loop for all the others
+                    log.warning("fallback poll failed: %s", error, extra={"device": key})
+
+    def _receive(self, key):
+        try:
+            data = self.pool.receive(key)
+        except Exception as error:
+            log.warning("push receive failed: %s", error, extra={"device": key})
+            return
+        if isinstance(data, dict) and data.get("dps"):
+            self.last_push[key] = time.monotonic()
+            self.pushes += 1
+            self._update(key, data["dps"])
+
+    def _maintain(self, key, now):
+        if self.pool.probe_due(key):
+            # Offline device whose breaker allows another try
+            self.last_heartbeat[key] = now
+            self.pool.probe(key)
+            return
+
+        quiet_since = max(self.last_push[key], self.last_poll[key])
+        if now - quiet_since >= self.fallback_poll_interval:
+            # No pushes for a while (or no socket at all): fall back to a slow poll,
+            # which also reopens the socket once the pool's breaker allows it
+            self.last_poll[key] = now
+            self.last_heartbeat[key] = now
+            self.polls += 1
+            data = self.pool.call(key, "status")
+            if isinstance(data, dict) and "dps" in data:
+                self._update(key, data["dps"])
+        elif now - self.last_heartbeat[key] >= self.heartbeat_interval:
+            # Devices drop sockets that stay silent; the heartbeat reply is read by run()
+            self.last_heartbeat[key] = now
+            if self.pool.connection(key).connected:
+                self.pool.call(key, "heartbeat", nowait=True)
+
+    def _update(self, key, changed):
+        state = self.dps.get(key)
+        if state is None:
+            return
+        state.update(changed)
+        self.on_update(key, dict(state))
@@ -0,0 +1,226 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_LEVEL = "INFO"
+# Records waiting for the writer thread; past this they are dropped and counted, never waited on
+LOG_QUEUE_SIZE = 10000
+# Identical warnings/errors (same logger, device and message) are written once per window
+DEDUP_WINDOW = 60
+DEDUP_LEVEL = logging.WARNING
+# --log-file rotates at this size, so an SD card sees bounded writes
+LOG_FILE_BYTES = 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+# Attributes every LogRecord has; anything else on a record came in through extra={...}
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def _level(level):
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f"unknown log level {level!r}")
+    return value
+
+
+def extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, device, msg, then any extra fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in extra_fields(record).items():
+            entry.setdefault(key, value)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, separators=(",", ":"), default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Readable lines for a terminal: time, level, device and message."""
+
+    def format(self, record):
+        line = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname:<7} "
+        device = getattr(record, "device", None)
+        if device is not None:
+            line += f"{device}: "
+        line += record.getMessage()
+        repeated = getattr(record, "repeated", 0)
+        if repeated:
+            line += f" (repeated {repeated} more times)"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class DeviceLevelFilter(logging.Filter):
+    """Per-device levels: a record's device (from extra={"device": key}) picks its threshold."""
+
+    def __init__(self, level=LOG_LEVEL, levels=None):
+        super().__init__()
+        self.level = _level(level)
+        self.levels = {key: _level(value) for key, value in (levels or {}).items()}
+
+    def lowest(self):
+        return min([self.level, *self.levels.values()])
+
+    def filter(self, record):
+        return record.levelno >= self.levels.get(getattr(record, "device", None), self.level)
+
+
+class DedupFilter(logging.Filter):
+    """
+    Writes the first of a run of identical records and drops the rest for
+    window seconds; the next one through carries repeated=<dropped count>.
+    An offline device then logs its read error once a minute, not every poll.
+    """
+
+    def __init__(self, window=DEDUP_WINDOW, level=DEDUP_LEVEL):
+        super().__init__()
+        self.window = window
+        self.level = level
+        self.seen = {}
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level or self.window <= 0:
+            return True
+        key = (record.name, record.levelno, getattr(record, "device", None), record.getMessage())
+        now = record.created
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                self.suppressed += 1
+                return False
+            if entry is not None and entry[1]:
+                record.repeated = entry[1]
+            self.seen[key] = [now, 0]
+            if len(self.seen) > 1000:
+                # Forget keys whose window has passed so the table stays small
+                self.seen = {k: v for k, v in self.seen.items() if now - v[0] < self.window}
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller: a full queue drops the record and counts it."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render message and traceback now; args may change or not pickle by the time they are written
+        message = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(vars(record))
+        record.msg, record.args, record.exc_info, record.exc_text = message, None, None, exc_text
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class Logs:
+    """
+    Logging for the long-running loops. Callers only filter the record and
+    put it on a bounded queue; the listener thread formats and writes it
+    (stderr and/or a rotating file), so a slow SD card or journald pipe
+    never holds up a poll or an MQTT callback.
+    """
+
+    def __init__(self, level=LOG_LEVEL, fmt="auto", file=None, device_levels=None, stream=None,
+                 dedup_window=DEDUP_WINDOW, queue_size=LOG_QUEUE_SIZE):
+        stream = stream if stream is not None else sys.stderr
+        if fmt == "auto":
+            fmt = "text" if getattr(stream, "isatty", lambda: False)() else "json"
+        formatter = TextFormatter() if fmt == "text" else JsonFormatter()
+
+        handlers = [logging.StreamHandler(stream)]
+        if file:
+            handlers.append(RotatingFileHandler(file, maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_BACKUPS))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        self.levels = DeviceLevelFilter(level, device_levels)
+        self.dedup = DedupFilter(dedup_window)
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.handler.addFilter(self.levels)
+        self.handler.addFilter(self.dedup)
+        self.listener = QueueListener(self.handler.queue, *handlers)
+        self.root = logging.getLogger()
+        self.previous_level = self.root.level
+        self.started = False
+
+    def start(self):
+        self.listener.start()
+        self.previous_level = self.root.level
+        self.root.addHandler(self.handler)
+        self.root.setLevel(self.levels.lowest())
+        self.started = True
+        atexit.register(self.stop)
+        return self
+
+    def set_device_level(self, device, level):
+        # level None goes back to the default level
+        if level is None:
+            self.levels.levels.pop(device, None)
+        else:
+            self.levels.levels[device] = _level(level)
+        self.root.setLevel(self.levels.lowest())
+
+    def stop(self):
+        # Writes out whatever is still queued
+        if not self.started:
+            return
+        self.started = False
+        self.root.removeHandler(self.handler)
+        self.root.setLevel(self.previous_level)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+    def stats(self):
+        return {
+            "queued": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "suppressed": self.dedup.suppressed,
+        }
+
+
+def parse_levels(values):
+    """["light1=DEBUG", "plug1=ERROR,plug2=ERROR"] -> {"light1": "DEBUG", ...}"""
+    levels = {}
+    for value in values or []:
+        for part in value.split(","):
+            key, sep, level = part.partition("=")
+            if not sep or not key.strip():
+                raise ValueError(f"expected <device>=<level>, got {part!r}")
+            levels[key.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level=LOG_LEVEL, fmt="auto", file=None, device_levels=None, **options):
+    """Start queue-backed logging on the root logger; stops (and flushes) itself at exit."""
+    return Logs(level, fmt, file, device_levels, **options).start()
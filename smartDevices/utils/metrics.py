@@ -0,0 +1,249 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+NAMESPACE = "pi_iot"
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+METRICS_TOPIC = "pi/_metrics"
+PUBLISH_INTERVAL = 15
+
+# Seconds; Tuya LAN calls sit around 20-200 ms, a timeout is several seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count", "lock")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        # One count per bucket plus +Inf, kept per bucket and summed up when read
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative(self):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        running, buckets = 0, []
+        for bound, bucket in zip(self.bounds + (float("inf"),), counts):
+            running += bucket
+            buckets.append((bound, running))
+        return buckets, total, count
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket the quantile falls in
+        buckets, _, count = self.cumulative()
+        if not count:
+            return None
+        target = fraction * count
+        for bound, running in buckets:
+            if running >= target:
+                return bound if bound != float("inf") else self.bounds[-1]
+        return self.bounds[-1]
+
+
+class Family:
+    """One metric name; its children are per label-value tuple, created on first use."""
+
+    def __init__(self, kind, name, help, labelnames, factory):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.factory())
+        return child
+
+    def remove(self, *values):
+        with self.lock:
+            self.children.pop(values, None)
+
+
+class Metrics:
+    """
+    Counters, latency histograms and gauges for the hot paths, cheap enough
+    to leave on: recording is a dict lookup, a bisect and a lock held for
+    three additions. Gauges are read from their owner only when scraped.
+
+    render() is the Prometheus text format served by serve() on localhost;
+    snapshot() is the JSON that publish_every() sends to pi/_metrics.
+    """
+
+    def __init__(self, namespace=NAMESPACE):
+        self.namespace = namespace
+        self.families = {}
+        self.gauges = {}
+        self.started = time.time()
+        self._server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _name(self, name):
+        return f"{self.namespace}_{name}" if self.namespace else name
+
+    def counter(self, name, help, labelnames=()):
+        return self._family("counter", name, help, labelnames, Counter)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._family("histogram", name, help, labelnames, lambda: Histogram(buckets))
+
+    def _family(self, kind, name, help, labelnames, factory):
+        name = self._name(name)
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = Family(kind, name, help, labelnames, factory)
+        return family
+
+    def gauge(self, name, help, read, labelnames=()):
+        """read() returns a number, or {label values tuple: number} when there are labelnames."""
+        self.gauges[self._name(name)] = (help, tuple(labelnames), read)
+
+    # -- output --
+
+    def _gauge_values(self, labelnames, read):
+        try:
+            values = read()
+        except Exception as error:
+            log.error("gauge failed: %s", error)
+            return {}
+        return values if labelnames else {(): values}
+
+    def render(self):
+        lines = []
+        for name, family in list(self.families.items()):
+            lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            for values, child in list(family.children.items()):
+                if family.kind == "counter":
+                    lines.append(f"{name}{_labels(family.labelnames, values)} {_number(child.value)}")
+                    continue
+                buckets, total, count = child.cumulative()
+                for bound, running in buckets:
+                    le = f'le="{_number(bound)}"'
+                    lines.append(f"{name}_bucket{_labels(family.labelnames, values, le)} {running}")
+                lines.append(f"{name}_sum{_labels(family.labelnames, values)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(family.labelnames, values)} {count}")
+        for name, (help, labelnames, read) in list(self.gauges.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for values, value in self._gauge_values(labelnames, read).items():
+                lines.append(f"{name}{_labels(labelnames, values)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Compact JSON-able view: counters, gauges and count/avg/p50/p95/p99 (ms) per histogram."""
+        result = {"uptime_s": round(time.time() - self.started, 1)}
+
+        def key(name, labelnames, values):
+            return name[len(self.namespace) + 1:] + _labels(labelnames, values) if self.namespace else name
+
+        for name, family in list(self.families.items()):
+            for values, child in list(family.children.items()):
+                if family.kind == "counter":
+                    result[key(name, family.labelnames, values)] = child.value
+                elif child.count:
+                    result[key(name, family.labelnames, values)] = {
+                        "count": child.count, "avg_ms": round(child.sum / child.count * 1000, 2),
+                        **{f"p{int(q * 100)}_ms": round(child.quantile(q) * 1000, 2) for q in (0.5, 0.95, 0.99)},
+                    }
+        for name, (_, labelnames, read) in list(self.gauges.items()):
+            for values, value in self._gauge_values(labelnames, read).items():
+                result[key(name, labelnames, values)] = value
+        return result
+
+    def serve(self, port=METRICS_PORT, host=METRICS_HOST):
+        """Serve render() at http://host:port/metrics on a daemon thread; returns the bound port."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self._server.server_address[1]
+
+    def publish_every(self, client, topic=METRICS_TOPIC, interval=PUBLISH_INTERVAL):
+        """Publish snapshot() to an MQTT topic every interval seconds (not retained)."""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    client.publish(topic, json.dumps(self.snapshot(), separators=(",", ":")))
+                except Exception as error:
+                    log.warning("publish failed: %s", error)
+
+        thread = threading.Thread(target=run, name="metrics-publish", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -1,3 +1,8 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+
 def watts(raw_power):
     return raw_power / 10.0
 
@@ -28,3 +33,38 @@ def toggle(smart_plug, get_status):
         is_on = status.get("1", False)
         smart_plug.set_status(not is_on)
         print(f"Plug toggled ({'ON' if not is_on else 'OFF'})")
+
+
+def read_telemetry(dps):
+    return {
+        "state": "ON" if dps.get("1", False) else "OFF",
+        "power": watts(dps.get("19", 0)),
+        "voltage": volts(dps.get("20", 0)),
+        "current": amps(dps.get("18", 0)),
+    }
+
+
+def format_telemetry(fields):
+    payloads = {
+        "state": fields["state"],
+        "power": f"{fields['power']:.2f}",
+        "voltage": f"{fields['voltage']:.1f}",
+        "current": f"{fields['current']:.3f}",
+    }
+    if "energy_today" in fields:
+        payloads["energy_today"] = f"{fields['energy_today']:.3f}"
+    return payloads
+
+
+def command_values(get_status, payload):
+    cmd_lower = payload.lower()
+
+    if cmd_lower == "on":
+        return {'1': True}
+    if cmd_lower == "off":
+        return {'1': False}
+    if cmd_lower == "toggle":
+        return {'1': not get_status().get("1", False)}
+
+    log.warning("unknown command: %s", payload)
+    return None
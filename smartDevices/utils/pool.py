@@ -0,0 +1,278 @@
+import logging
+import select
+import threading
+import time
+import tinytuya
+from utils.breaker import CircuitBreaker, CLOSED, OPEN, FAILURE_THRESHOLD
+
+log = logging.getLogger(__name__)
+
+# Every Tuya device listens for LAN connections on this TCP port
+TUYA_PORT = 6668
+SOCKET_TIMEOUT = 3
+KEEPALIVE_AFTER = 8
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+
+# tinytuya methods that talk to the device; everything else is passed straight through
+NETWORK_METHODS = {
+    "status", "heartbeat", "receive", "send", "updatedps", "detect_available_dps",
+    "set_value", "set_multiple_values", "set_status", "turn_on", "turn_off",
+    "set_mode", "set_colour", "set_hsv", "set_white", "set_brightness",
+    "set_brightness_percentage", "set_colourtemp", "set_colourtemp_percentage", "set_scene",
+}
+
+
+class LatencyCounter:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class PooledConnection:
+    def __init__(self, device, breaker):
+        self.device = device
+        self.breaker = breaker
+        self.lock = threading.RLock()
+        self.last_used = 0.0
+        self.reconnects = 0
+        # cold = call had to open the socket (and negotiate the 3.4 session key)
+        self.cold = LatencyCounter()
+        self.warm = LatencyCounter()
+
+    @property
+    def connected(self):
+        return self.device.socket is not None
+
+    @property
+    def failures(self):
+        return self.breaker.failures
+
+
+class PooledDevice:
+    """Stands in for a tinytuya device; every method call goes through the pool."""
+
+    def __init__(self, pool, key):
+        self._pool = pool
+        self._key = key
+
+    def __getattr__(self, name):
+        attr = getattr(self._pool.connection(self._key).device, name)
+        if name not in NETWORK_METHODS:
+            return attr
+
+        def call(*args, **kwargs):
+            return self._pool.call(self._key, name, *args, **kwargs)
+        return call
+
+
+def create_device(info, kind, persistent=True, socket_timeout=SOCKET_TIMEOUT):
+    # "port" is only ever set for simulated devices; real ones all listen on 6668
+    port = int(info.get("port", TUYA_PORT))
+    if kind == "light":
+        device = tinytuya.BulbDevice(info["id"], info["ip"], info["key"], port=port)
+    else:
+        device = tinytuya.OutletDevice(info["id"], info["ip"], info["key"], port=port)
+    device.set_version(float(info.get("version", 3.4)))
+    device.set_socketTimeout(socket_timeout)
+    device.set_socketPersistent(persistent)
+    return device
+
+
+def is_error(result):
+    return isinstance(result, dict) and "Error" in result
+
+
+class DevicePool:
+    def __init__(self, socket_timeout=SOCKET_TIMEOUT, keepalive_after=KEEPALIVE_AFTER,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, failure_threshold=FAILURE_THRESHOLD,
+                 metrics=None):
+        self.socket_timeout = socket_timeout
+        self.keepalive_after = keepalive_after
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        # on_availability(key, available) is called when a device's breaker opens or closes
+        self.on_availability = None
+        self.connections = {}
+        self._keepalive_thread = None
+        # utils.metrics.Metrics to record per-device call latency and errors in, or None
+        self.metrics = metrics
+        if metrics is not None:
+            self.call_seconds = metrics.histogram("tuya_call_seconds", "Time for a device call to return",
+                                                  ("device", "method"))
+            self.call_errors = metrics.counter("tuya_call_errors_total", "Device calls that failed or timed out",
+                                               ("device", "method"))
+            metrics.gauge("device_up", "1 while the device's circuit breaker is closed",
+                          lambda: {(key,): int(conn.breaker.state == CLOSED)
+                                   for key, conn in list(self.connections.items())}, ("device",))
+
+    def open(self, key, kind, info):
+        return self.add(key, create_device(info, kind, socket_timeout=self.socket_timeout))
+
+    def add(self, key, device):
+        device.set_socketPersistent(True)
+        # The pool owns reconnect backoff; don't let tinytuya sleep and retry inside a call
+        device.set_socketRetryLimit(1)
+        breaker = CircuitBreaker(self.failure_threshold, self.backoff_base, self.backoff_max,
+                                 on_change=lambda state: self._breaker_changed(key, state))
+        self.connections[key] = PooledConnection(device, breaker)
+        return PooledDevice(self, key)
+
+    def get(self, key):
+        return PooledDevice(self, key)
+
+    def remove(self, key):
+        # Close and forget one device; the others' connections are untouched
+        conn = self.connections.pop(key, None)
+        if conn is not None:
+            with conn.lock:
+                conn.device.close()
+
+    def connection(self, key):
+        return self.connections[key]
+
+    def available(self, key):
+        return self.connections[key].breaker.available
+
+    def probe_due(self, key):
+        return self.connections[key].breaker.probe_due()
+
+    def probe(self, key):
+        # Cheapest round-trip that proves the device is back: a heartbeat
+        return not is_error(self.call(key, "heartbeat", nowait=False))
+
+    def _breaker_changed(self, key, state):
+        if state in (OPEN, CLOSED) and self.on_availability:
+            try:
+                self.on_availability(key, state == CLOSED)
+            except Exception as error:
+                log.error("availability callback failed: %s", error, extra={"device": key})
+
+    def call(self, key, method, *args, **kwargs):
+        conn = self.connections[key]
+        with conn.lock:
+            if not conn.breaker.allow():
+                # Breaker is open: the device is known to be down, don't touch the network
+                return tinytuya.error_json(tinytuya.ERR_OFFLINE)
+
+            was_connected = conn.connected
+            start = time.perf_counter()
+            try:
+                result = getattr(conn.device, method)(*args, **kwargs)
+            except Exception:
+                self._failed(conn)
+                self._record(key, method, time.perf_counter() - start, failed=True)
+                raise
+            elapsed = time.perf_counter() - start
+
+            if is_error(result):
+                self._failed(conn)
+                self._record(key, method, elapsed, failed=True)
+                return result
+
+            if conn.failures:
+                conn.reconnects += 1
+            conn.breaker.success()
+            conn.last_used = time.monotonic()
+            if not kwargs.get("nowait"):
+                (conn.warm if was_connected else conn.cold).add(elapsed)
+                self._record(key, method, elapsed)
+            return result
+
+    def _record(self, key, method, elapsed, failed=False):
+        if self.metrics is None:
+            return
+        self.call_seconds.labels(key, method).observe(elapsed)
+        if failed:
+            self.call_errors.labels(key, method).inc()
+
+    def receive(self, key):
+        # Read one frame the device pushed on its own; not counted as a request
+        conn = self.connections[key]
+        with conn.lock:
+            if not conn.connected:
+                return None
+            # Another caller may have drained the socket while we waited for the lock
+            readable, _, _ = select.select([conn.device.socket], [], [], 0)
+            if not readable:
+                return None
+            try:
+                result = conn.device.receive()
+            except Exception:
+                self._failed(conn)
+                raise
+            if is_error(result):
+                self._failed(conn)
+            return result
+
+    def _failed(self, conn):
+        conn.device.close()
+        conn.breaker.failure()
+
+    def keepalive(self):
+        # Heartbeat sockets that have sat idle long enough for the device to drop them,
+        # and probe offline devices whose breaker is ready to try again
+        now = time.monotonic()
+        for key, conn in list(self.connections.items()):
+            if conn.breaker.probe_due():
+                self.probe(key)
+            elif conn.connected and now - conn.last_used >= self.keepalive_after:
+                self.call(key, "heartbeat", nowait=False)
+
+    def start_keepalive(self, interval=None):
+        if self._keepalive_thread:
+            return
+        interval = interval or self.keepalive_after / 2
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.keepalive()
+                except Exception as error:
+                    log.error("keepalive failed: %s", error)
+
+        self._keepalive_thread = threading.Thread(target=run, name="pool-keepalive", daemon=True)
+        self._keepalive_thread.start()
+
+    def close(self):
+        for conn in self.connections.values():
+            with conn.lock:
+                conn.device.close()
+
+    def stats(self):
+        result = {}
+        for key, conn in self.connections.items():
+            saved = conn.warm.count * max(0.0, conn.cold.average - conn.warm.average)
+            result[key] = {
+                "connected": conn.connected,
+                "cold_calls": conn.cold.count,
+                "cold_avg_ms": round(conn.cold.average * 1000, 1),
+                "warm_calls": conn.warm.count,
+                "warm_avg_ms": round(conn.warm.average * 1000, 1),
+                "failures": conn.failures,
+                "breaker": conn.breaker.state,
+                "rejected": conn.breaker.rejected,
+                "reconnects": conn.reconnects,
+                "handshake_saved_s": round(saved, 3),
+            }
+        return result
+
+    def summary(self):
+        lines = []
+        for key, s in self.stats().items():
+            lines.append(
+                f"{key}: {s['warm_calls']} warm @ {s['warm_avg_ms']}ms, "
+                f"{s['cold_calls']} cold @ {s['cold_avg_ms']}ms, "
+                f"saved {s['handshake_saved_s']}s of handshakes"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,77 @@
+import json
+import time
+
+POWER_DEADBAND = 1.0
+
+
+class TelemetryPublisher:
+    """
+    Publishes a device's telemetry fields only when their decoded value
+    differs from what was last published. Messages are retained so a newly
+    connected dashboard gets the current state from the broker straight away.
+
+    deadbands maps a numeric field to the smallest change worth publishing,
+    measured against the last *published* value so slow drift still shows up.
+
+    With json_state on, every change also publishes one combined
+    <prefix>/state/json payload so a consumer gets the whole device in a
+    single frame; field_topics can switch the per-field topics off.
+    """
+
+    def __init__(self, client, retain=True, deadbands=None, field_topics=True, json_state=True, metrics=None):
+        self.client = client
+        self.retain = retain
+        self.deadbands = deadbands or {}
+        self.field_topics = field_topics
+        self.json_state = json_state
+        self.last = {}
+        self.published = 0
+        self.suppressed = 0
+        self.metrics = metrics
+        if metrics is not None:
+            self.publish_seconds = metrics.histogram("publish_seconds", "Time to publish one device's telemetry",
+                                                     ("device",))
+            self.messages = metrics.counter("mqtt_published_total", "Telemetry messages published", ("device",))
+
+    def changed(self, field, old, new):
+        deadband = self.deadbands.get(field)
+        if deadband and isinstance(old, (int, float)) and isinstance(new, (int, float)):
+            return abs(new - old) >= deadband
+        return old != new
+
+    def publish(self, prefix, fields, payloads, force=False):
+        if self.metrics is None:
+            return self._publish(prefix, fields, payloads, force)
+        started, published = time.perf_counter(), self.published
+        sent = self._publish(prefix, fields, payloads, force)
+        device = prefix.rsplit("/", 1)[-1]
+        self.publish_seconds.labels(device).observe(time.perf_counter() - started)
+        if self.published != published:
+            self.messages.labels(device).inc(self.published - published)
+        return sent
+
+    def _publish(self, prefix, fields, payloads, force):
+        last = self.last.setdefault(prefix, {})
+        sent = []
+        for field, value in fields.items():
+            if not force and field in last and not self.changed(field, last[field], value):
+                self.suppressed += 1
+                continue
+            if self.field_topics:
+                self.client.publish(f"{prefix}/{field}", payloads[field], retain=self.retain)
+                self.published += 1
+            last[field] = value
+            sent.append(field)
+
+        if sent and self.json_state:
+            state = {**fields, "ts": round(time.time(), 3)}
+            self.client.publish(f"{prefix}/state/json", json.dumps(state, separators=(",", ":")), retain=self.retain)
+            self.published += 1
+        return sent
+
+    def forget(self, prefix=None):
+        # Next publish sends every field again (e.g. after the broker restarted)
+        if prefix is None:
+            self.last.clear()
+        else:
+            self.last.pop(prefix, None)
@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import threading
+
+log = logging.getLogger(__name__)
+
+DEVICES_FILE = "devices.json"
+WATCH_INTERVAL = 2
+TOPIC_ROOT = "pi"
+
+KINDS = ("light", "plug")
+# Tuya product categories that are bulbs; everything else is treated as a plug
+LIGHT_CATEGORIES = ("dj", "dd", "fwd", "xdd", "dc")
+REQUIRED_FIELDS = ("id", "ip", "key")
+# A change to any of these needs a new device connection; anything else is applied in place
+CONNECTION_FIELDS = ("id", "ip", "key", "version", "port")
+
+
+def device_kind(info):
+    kind = info.get("type")
+    if kind in KINDS:
+        return kind
+    return "light" if info.get("category") in LIGHT_CATEGORIES else "plug"
+
+
+class DeviceEntry:
+    def __init__(self, key, kind, info):
+        self.key = key
+        self.kind = kind
+        self.info = info
+        self.name = info.get("name", key)
+        self.prefix = f"{TOPIC_ROOT}/{key}"
+
+    def connection(self):
+        return (self.kind,) + tuple(str(self.info.get(field, "")) for field in CONNECTION_FIELDS)
+
+
+def parse_devices(entries):
+    """
+    Validate devices.json contents into DeviceEntry objects in file order.
+    Topics default to light1, light2, plug1, ... by kind. Raises ValueError
+    listing every problem found.
+    """
+    if not isinstance(entries, list):
+        raise ValueError("devices.json must be a list of devices")
+
+    devices, problems = [], []
+    counts = dict.fromkeys(KINDS, 0)
+    seen = {"id": {}, "topic": {}, "name": {}, "ip": {}}
+    for index, info in enumerate(entries):
+        if not isinstance(info, dict):
+            problems.append(f"entry {index}: not an object")
+            continue
+        missing = [field for field in REQUIRED_FIELDS if not info.get(field)]
+        if missing:
+            problems.append(f"entry {index} ({info.get('name', '?')}): missing {', '.join(missing)}")
+            continue
+        kind = device_kind(info)
+        counts[kind] += 1
+        entry = DeviceEntry(str(info.get("topic", f"{kind}{counts[kind]}")), kind, info)
+        if "/" in entry.key or "+" in entry.key or "#" in entry.key:
+            problems.append(f"entry {index}: topic {entry.key!r} can't contain / + #")
+            continue
+        for field, value in (("id", info["id"]), ("topic", entry.key), ("name", entry.name), ("ip", info["ip"])):
+            if value in seen[field]:
+                problems.append(f"entry {index}: {field} {value!r} already used by entry {seen[field][value]}")
+            seen[field][value] = index
+        devices.append(entry)
+
+    if problems:
+        raise ValueError("; ".join(problems))
+    return devices
+
+
+class DeviceRegistry:
+    """
+    devices.json, validated and indexed by topic key, device id, name and IP.
+
+    route() maps an incoming MQTT topic to its device with one split and
+    one dict lookup. watch() polls the file's mtime; on a change the new
+    file is validated and swapped in whole (an invalid file is reported and
+    ignored), and listeners get the difference:
+
+        on_change(added, removed, reconnect, updated)
+
+    reconnect holds devices whose address, key or protocol changed;
+    updated holds ones where only metadata (name, priority, ...) did, which
+    can be applied without touching the open connection.
+
+    set_address() lays addresses found by discovery over the file's, so a
+    device that DHCP moved is reconnected at its new IP without anyone
+    editing devices.json.
+    """
+
+    def __init__(self, path=DEVICES_FILE, watch_interval=WATCH_INTERVAL):
+        self.path = path
+        self.watch_interval = watch_interval
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.reloads = 0
+        self.rejected = 0
+        # {device id: {"ip": ..., "version": ...}} from discovery, applied over the file
+        self.overrides = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.raw = self._read()
+        self._index(parse_devices(self.raw))
+        self.mtime = self._mtime()
+
+    def _read(self):
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def _mtime(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _index(self, entries):
+        by_key = {entry.key: entry for entry in entries}
+        by_id = {str(entry.info["id"]): entry for entry in entries}
+        by_name = {entry.name: entry for entry in entries}
+        by_ip = {entry.info["ip"]: entry for entry in entries}
+        # Readers never take the lock; they see either the old indexes or the new ones
+        self.entries, self.by_id, self.by_name, self.by_ip = by_key, by_id, by_name, by_ip
+
+    def __iter__(self):
+        return iter(list(self.entries.values()))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def find(self, ref):
+        """A device by topic key, id, name or IP address."""
+        ref = str(ref)
+        return self.entries.get(ref) or self.by_id.get(ref) or self.by_name.get(ref) or self.by_ip.get(ref)
+
+    def first(self, kind):
+        return next((entry for entry in self.entries.values() if entry.kind == kind), None)
+
+    def route(self, topic):
+        """(device, rest) for "pi/<device>/<rest>", or (None, None) if it isn't one of ours."""
+        parts = topic.split("/", 2)
+        if len(parts) != 3 or parts[0] != TOPIC_ROOT:
+            return None, None
+        entry = self.entries.get(parts[1])
+        return (entry, parts[2]) if entry else (None, None)
+
+    # -- hot reload --
+
+    def _overlay(self, raw):
+        if not self.overrides or not isinstance(raw, list):
+            return raw
+        return [{**info, **self.overrides.get(str(info.get("id")), {})} if isinstance(info, dict) else info
+                for info in raw]
+
+    def reload(self):
+        """Re-read the file and apply it; returns (added, removed, reconnect, updated) or None if rejected."""
+        with self.lock:
+            self.mtime = self._mtime()
+            try:
+                raw = self._read()
+            except (OSError, ValueError) as error:
+                self.rejected += 1
+                log.error("%s: not reloaded: %s", self.path, error)
+                return None
+            self.raw = raw
+        return self._apply()
+
+    def set_address(self, device_id, ip, version=None):
+        """Where discovery last saw a device; returns the changes, or None if nothing changed."""
+        device_id = str(device_id)
+        with self.lock:
+            override = {"ip": ip}
+            if version:
+                override["version"] = str(version)
+            if self.overrides.get(device_id) == override:
+                return None
+            self.overrides[device_id] = override
+            entry = self.by_id.get(device_id)
+            if entry is None or all(str(entry.info.get(field)) == value for field, value in override.items()):
+                return None
+        return self._apply()
+
+    def _apply(self):
+        with self.lock:
+            try:
+                entries = parse_devices(self._overlay(self.raw))
+            except ValueError as error:
+                self.rejected += 1
+                log.error("%s: not reloaded: %s", self.path, error)
+                return None
+
+            old = self.entries
+            new = {entry.key: entry for entry in entries}
+            added = [entry for key, entry in new.items() if key not in old]
+            removed = [entry for key, entry in old.items() if key not in new]
+            reconnect, updated = [], []
+            for key, entry in new.items():
+                if key in old and old[key].info != entry.info:
+                    (reconnect if old[key].connection() != entry.connection() else updated).append(entry)
+            self._index(entries)
+            self.reloads += 1
+
+        changes = (added, removed, reconnect, updated)
+        if any(changes):
+            log.info("%s: %d added, %d removed, %d reconnecting, %d updated",
+                     self.path, len(added), len(removed), len(reconnect), len(updated))
+            for listener in list(self.listeners):
+                try:
+                    listener(*changes)
+                except Exception as error:
+                    log.error("%s: change listener failed: %s", self.path, error)
+        return changes
+
+    def check(self):
+        # Reload if the file changed since it was last read
+        mtime = self._mtime()
+        if mtime is not None and mtime != self.mtime:
+            return self.reload()
+        return None
+
+    def watch(self, on_change):
+        self.listeners.append(on_change)
+        if self._thread:
+            return
+
+        def run():
+            while not self._stop.wait(self.watch_interval):
+                self.check()
+
+        self._thread = threading.Thread(target=run, name="registry-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        kinds = {kind: sum(entry.kind == kind for entry in self.entries.values()) for kind in KINDS}
+        return {"devices": len(self.entries), **kinds, "reloads": self.reloads, "rejected": self.rejected}
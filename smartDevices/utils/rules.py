@@ -0,0 +1,293 @@
+import datetime
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+RULES_FILE = "rules.json"
+# Longest the clock thread sleeps between checks of time-based rules
+CLOCK_INTERVAL = 60
+# Trigger-to-action latencies kept for the percentiles in stats()
+LATENCY_SAMPLES = 1000
+
+OPERATORS = {
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+}
+CONDITION = re.compile(r"^\s*(\S+)\s*(>=|<=|==|!=|>|<)\s*(.+?)\s*$")
+AT = re.compile(r"^\s*(?:(\d{1,2}):(\d{2})|(sunrise|sunset)\s*(?:([+-])\s*(\d+))?)\s*$", re.IGNORECASE)
+
+
+def load_rules(path=RULES_FILE):
+    """
+    Rules file contents as {"location": {...}, "rules": [...]}. A missing
+    file means no rules; a bare list is taken as the rules on their own.
+    """
+    if not os.path.exists(path):
+        return {"rules": []}
+    with open(path, "r") as f:
+        config = json.load(f)
+    return {"rules": config} if isinstance(config, list) else config
+
+
+def sun_time(day, lat, lon, rising):
+    """
+    Epoch seconds of sunrise or sunset on a date at a location (sunrise
+    equation, good to a minute or two), or None if the sun doesn't rise or
+    set that day.
+    """
+    n = day.toordinal() - datetime.date(2000, 1, 1).toordinal()
+    mean = n - lon / 360
+    anomaly = math.radians((357.5291 + 0.98560028 * mean) % 360)
+    centre = 1.9148 * math.sin(anomaly) + 0.02 * math.sin(2 * anomaly) + 0.0003 * math.sin(3 * anomaly)
+    ecliptic = math.radians((math.degrees(anomaly) + centre + 180 + 102.9372) % 360)
+    transit = 2451545.0 + mean + 0.0053 * math.sin(anomaly) - 0.0069 * math.sin(2 * ecliptic)
+    declination = math.asin(math.sin(ecliptic) * math.sin(math.radians(23.44)))
+    latitude = math.radians(lat)
+    cos_hour = ((math.sin(math.radians(-0.833)) - math.sin(latitude) * math.sin(declination))
+                / (math.cos(latitude) * math.cos(declination)))
+    if not -1 <= cos_hour <= 1:
+        return None
+    hour_angle = math.degrees(math.acos(cos_hour)) / 360
+    julian = transit - hour_angle if rising else transit + hour_angle
+    return (julian - 2440587.5) * 86400
+
+
+class Condition:
+    def __init__(self, text):
+        match = CONDITION.match(text)
+        if not match:
+            raise ValueError(f"bad condition: {text}")
+        self.topic, op, value = match.groups()
+        self.op = OPERATORS[op]
+        try:
+            self.value = float(value)
+        except ValueError:
+            self.value = value.strip("\"'")
+        self.numeric = isinstance(self.value, float)
+        self.true = False
+
+    def test(self, payload, number):
+        if self.numeric:
+            return number is not None and self.op(number, self.value)
+        return self.op(payload, self.value)
+
+
+class Rule:
+    """
+    Fires its actions when all of its conditions become true together (an
+    edge, not a level: it fires again only after a condition has gone false
+    and back), or at a time of day. cooldown is the least number of seconds
+    between two firings.
+    """
+
+    def __init__(self, spec):
+        self.name = spec.get("name", "rule")
+        when = spec.get("when", [])
+        self.conditions = [Condition(text) for text in ([when] if isinstance(when, str) else when)]
+        self.at = None
+        if "at" in spec:
+            match = AT.match(str(spec["at"]))
+            if not match:
+                raise ValueError(f"{self.name}: bad time {spec['at']}")
+            hour, minute, sun, sign, offset = match.groups()
+            self.at = (int(hour), int(minute)) if hour else (sun.lower(), int(offset or 0) * (-1 if sign == "-" else 1))
+        if not self.conditions and self.at is None:
+            raise ValueError(f"{self.name}: needs a 'when' or an 'at'")
+        # {topic: payload}, e.g. {"pi/plug1/set": "off", "pi/light1/effect": "sunrise:600"}
+        self.actions = list(spec.get("then", {}).items())
+        self.cooldown = float(spec.get("cooldown", 0))
+        self.true_count = 0
+        self.last_fired = None
+        self.fired = 0
+
+    def time_on(self, day, location):
+        # Epoch seconds this rule is due on a local date, or None
+        if isinstance(self.at[0], int):
+            return time.mktime((day.year, day.month, day.day, self.at[0], self.at[1], 0, 0, 0, -1))
+        if location is None:
+            return None
+        at = sun_time(day, location["lat"], location["lon"], self.at[0] == "sunrise")
+        return None if at is None else at + self.at[1] * 60
+
+
+class LatencyStats:
+    def __init__(self, size=LATENCY_SAMPLES):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"count": 0}
+
+        def ms(fraction):
+            return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+        return {"count": self.count, "p50_ms": ms(0.5), "p95_ms": ms(0.95), "p99_ms": ms(0.99),
+                "max_ms": round(self.max * 1000, 3)}
+
+
+class RuleEngine:
+    """
+    Runs automations against telemetry as it arrives.
+
+    Rules are compiled once into an index of topic -> conditions, so a
+    message only looks at the conditions that read its topic and each rule
+    keeps a count of its true conditions instead of re-checking the others.
+    act(topic, payload) carries out one action; the gateway and the
+    standalone automations script pass in their own command handling, which
+    goes through lightHelpers/plugHelpers like any dashboard command.
+
+    Latency is measured from a message arriving to its actions returning
+    from act().
+    """
+
+    def __init__(self, config, act, clock_interval=CLOCK_INTERVAL):
+        self.act = act
+        self.location = config.get("location")
+        self.clock_interval = clock_interval
+        self.rules = [Rule(spec) for spec in config.get("rules", [])]
+        self.index = {}
+        for rule in self.rules:
+            for condition in rule.conditions:
+                self.index.setdefault(condition.topic, []).append((condition, rule))
+        self.timed = [rule for rule in self.rules if rule.at is not None]
+        self.lock = threading.Lock()
+        self.latency = LatencyStats()
+        self.messages = 0
+        self.matched = 0
+        self.evaluated = 0
+        self.fired = 0
+        self.failed = 0
+        self.last_tick = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def topics(self):
+        return list(self.index)
+
+    def on_message(self, topic, payload, received=None):
+        """Feed one telemetry message; returns the rules it fired."""
+        received = time.perf_counter() if received is None else received
+        self.messages += 1
+        entries = self.index.get(topic)
+        if not entries:
+            return []
+        self.matched += 1
+        try:
+            number = float(payload)
+        except ValueError:
+            number = None
+
+        firing = []
+        with self.lock:
+            for condition, rule in entries:
+                self.evaluated += 1
+                true = condition.test(payload, number)
+                if true == condition.true:
+                    continue
+                condition.true = true
+                rule.true_count += 1 if true else -1
+                if true and rule.true_count == len(rule.conditions) and self._ready(rule, time.time()):
+                    firing.append(rule)
+        for rule in firing:
+            self._fire(rule)
+        if firing:
+            self.latency.add(time.perf_counter() - received)
+        return firing
+
+    def _ready(self, rule, now):
+        if rule.last_fired is not None and now - rule.last_fired < rule.cooldown:
+            return False
+        rule.last_fired = now
+        return True
+
+    def _fire(self, rule):
+        rule.fired += 1
+        self.fired += 1
+        for topic, payload in rule.actions:
+            try:
+                self.act(topic, str(payload))
+            except Exception as error:
+                self.failed += 1
+                log.error("rule %s: %s %s failed: %s", rule.name, topic, payload, error)
+
+    # -- time-based rules --
+
+    def _times(self, rule, now):
+        today = datetime.date.fromtimestamp(now)
+        for day in (today - datetime.timedelta(days=1), today, today + datetime.timedelta(days=1)):
+            at = rule.time_on(day, self.location)
+            if at is not None:
+                yield at
+
+    def tick(self, now=None):
+        """Fire time-based rules that came due since the last tick; returns them."""
+        now = time.time() if now is None else now
+        due = []
+        with self.lock:
+            for rule in self.timed:
+                if any(self.last_tick < at <= now for at in self._times(rule, now)) and self._ready(rule, now):
+                    due.append(rule)
+            self.last_tick = now
+        for rule in due:
+            log.info("rule %s: %s", rule.name, rule.at)
+            self._fire(rule)
+        return due
+
+    def next_due(self, now=None):
+        now = time.time() if now is None else now
+        upcoming = [at for rule in self.timed for at in self._times(rule, now) if at > now]
+        return min(upcoming, default=None)
+
+    def start(self):
+        if self._thread or not self.timed:
+            return
+
+        def run():
+            while True:
+                upcoming = self.next_due()
+                wait = self.clock_interval if upcoming is None else min(self.clock_interval, upcoming - time.time())
+                if self._stop.wait(max(0.0, wait)):
+                    return
+                try:
+                    self.tick()
+                except Exception as error:
+                    log.error("rule clock failed: %s", error)
+
+        self._thread = threading.Thread(target=run, name="rules-clock", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            "rules": len(self.rules),
+            "topics": len(self.index),
+            "messages": self.messages,
+            "matched": self.matched,
+            "conditions_checked": self.evaluated,
+            "fired": self.fired,
+            "failed": self.failed,
+            "trigger_to_action": self.latency.summary(),
+        }
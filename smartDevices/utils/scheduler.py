@@ -0,0 +1,148 @@
+import threading
+import time
+
+POLL_INTERVAL = 2
+MIN_INTERVAL = 1
+MAX_INTERVAL = 30
+GROWTH = 1.5
+FAILURE_MAX_INTERVAL = 120
+
+
+class PollState:
+    def __init__(self, interval, priority, due):
+        self.interval = interval
+        self.priority = priority
+        self.due = due
+        self.polls = 0
+        self.changes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+
+
+class PollScheduler:
+    """
+    Works out each device's next poll on its own. A device that just changed
+    or was just commanded is polled every min_interval; while its values stay
+    the same the interval grows by `growth` up to max_interval. Unreachable
+    devices back off exponentially up to failure_max_interval instead of
+    costing a full socket timeout every cycle.
+
+    priority divides a device's intervals, so priority 2 polls twice as often.
+    """
+
+    def __init__(self, base_interval=POLL_INTERVAL, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 growth=GROWTH, failure_max_interval=FAILURE_MAX_INTERVAL):
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.growth = growth
+        self.failure_max_interval = failure_max_interval
+        self.condition = threading.Condition()
+        self.devices = {}
+        self.started = time.monotonic()
+
+    def add(self, device, priority=1.0, offset=0.0):
+        with self.condition:
+            self.devices[device] = PollState(self.base_interval, max(priority, 0.01), time.monotonic() + offset)
+
+    def remove(self, device):
+        with self.condition:
+            self.devices.pop(device, None)
+
+    def set_priority(self, device, priority):
+        with self.condition:
+            state = self.devices.get(device)
+            if state is not None:
+                state.priority = max(priority, 0.01)
+
+    def delay(self, device):
+        # Seconds until the device is due (0 when it is due now)
+        with self.condition:
+            state = self.devices.get(device)
+            if state is None:
+                return self.base_interval
+            return max(0.0, state.due - time.monotonic())
+
+    def wait(self, device, timeout=None):
+        # Block until the device is due or poked; False if timeout ran out first
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while True:
+                state = self.devices.get(device)
+                now = time.monotonic()
+                if state is not None and state.due <= now:
+                    return True
+                remaining = [state.due - now if state else self.base_interval]
+                if deadline is not None:
+                    if deadline <= now:
+                        return False
+                    remaining.append(deadline - now)
+                self.condition.wait(min(remaining))
+
+    def record(self, device, changed=False, failed=False):
+        """Account for a finished poll and schedule the next one."""
+        with self.condition:
+            state = self.devices.get(device)
+            if state is None:
+                return None
+            state.polls += 1
+            if failed:
+                state.failures += 1
+                state.consecutive_failures += 1
+                state.interval = min(self.base_interval * 2 ** state.consecutive_failures,
+                                     self.failure_max_interval)
+                # Unreachable devices are not sped up by priority
+                interval = state.interval
+            else:
+                recovered = state.consecutive_failures > 0
+                state.consecutive_failures = 0
+                if changed:
+                    state.changes += 1
+                    state.interval = self.min_interval
+                elif recovered:
+                    state.interval = self.base_interval
+                else:
+                    state.interval = min(max(state.interval, self.min_interval) * self.growth, self.max_interval)
+                interval = state.interval / state.priority
+
+            state.due = time.monotonic() + interval
+            return interval
+
+    def poke(self, device, delay=None):
+        # Something just happened (a command): poll soon and at the fast rate
+        with self.condition:
+            state = self.devices.get(device)
+            if state is None:
+                return
+            state.interval = self.min_interval
+            state.consecutive_failures = 0
+            due = time.monotonic() + (self.min_interval / state.priority if delay is None else delay)
+            state.due = min(state.due, due)
+            self.condition.notify_all()
+
+    def poll_rate(self):
+        # Polls per second since start, against what a fixed base_interval would have done
+        with self.condition:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            polls = sum(state.polls for state in self.devices.values())
+            fixed = len(self.devices) / self.base_interval
+        return polls / elapsed, fixed
+
+    def stats(self):
+        rate, fixed = self.poll_rate()
+        with self.condition:
+            devices = {
+                device: {
+                    "interval": round(state.interval / (1 if state.consecutive_failures else state.priority), 2),
+                    "polls": state.polls,
+                    "changes": state.changes,
+                    "failures": state.failures,
+                }
+                for device, state in self.devices.items()
+            }
+        return {
+            "poll_rate": round(rate, 3),
+            "fixed_rate": round(fixed, 3),
+            "saved": round(1 - rate / fixed, 3) if fixed else 0.0,
+            "devices": devices,
+        }
@@ -0,0 +1,65 @@
+import threading
+import time
+
+SHADOW_MAX_AGE = 10
+
+
+class ShadowState:
+    """
+    Last known DPS per device, fed by polls, pushed updates and write
+    acknowledgements. Write paths read it instead of doing a status()
+    round-trip; a real read only happens once the shadow is older than
+    max_age seconds.
+    """
+
+    def __init__(self, max_age=SHADOW_MAX_AGE):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.dps = {}
+        self.updated = {}
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, device, dps):
+        if not dps:
+            return
+        with self.lock:
+            self.dps.setdefault(device, {}).update(dps)
+            self.updated[device] = time.monotonic()
+
+    def get(self, device):
+        with self.lock:
+            updated = self.updated.get(device)
+            if updated is None or time.monotonic() - updated > self.max_age:
+                return None
+            return dict(self.dps[device])
+
+    def invalidate(self, device):
+        with self.lock:
+            self.updated.pop(device, None)
+
+    def read(self, device, get_status):
+        dps = self.get(device)
+        with self.lock:
+            if dps is not None:
+                self.hits += 1
+                return dps
+            self.misses += 1
+
+        dps = get_status()
+        self.update(device, dps)
+        return dps
+
+    def reader(self, device, get_status):
+        # Drop-in replacement for the get_status callables the helpers take
+        return lambda: self.read(device, get_status)
+
+    def stats(self):
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+        }
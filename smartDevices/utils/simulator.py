@@ -0,0 +1,395 @@
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import random
+import socket
+import struct
+import threading
+import time
+import tinytuya
+from tinytuya.core import command_types as CT
+from tinytuya.core import header as H
+from utils.pool import TUYA_PORT
+
+# Loopback addresses the virtual devices listen on, one per device (all of 127/8 is local on Linux)
+NETWORK = "127.1.0.0/16"
+VERSIONS = ("3.3", "3.4")
+PUSH_INTERVAL = 5
+START_TIMEOUT = 10
+
+# Mains and load ranges the virtual plugs meter; each plug gets a fixed load from its id
+VOLTAGE = 230.0
+VOLTAGE_DRIFT = 2.0
+LOAD_RANGE = (5.0, 2000.0)
+LOAD_DRIFT = 0.05
+
+LIGHT_DEFAULTS = {"20": True, "21": "white", "22": 1000, "23": 500, "24": "000003e803e8"}
+QUERY_COMMANDS = (CT.DP_QUERY, CT.DP_QUERY_NEW)
+CONTROL_COMMANDS = (CT.CONTROL, CT.CONTROL_NEW)
+
+
+def device_id(index):
+    # 20 characters like a real Tuya id; 22-character ids make tinytuya guess "device22"
+    return f"bfsim{index:015x}"
+
+
+def device_key(device_id):
+    # Stable per id, so a devices.json written once keeps working across runs
+    return hashlib.md5(device_id.encode()).hexdigest()[:16]
+
+
+def addresses(network=NETWORK, count=1):
+    hosts = ipaddress.ip_network(network).hosts()
+    found = []
+    for host in hosts:
+        if len(found) == count:
+            break
+        found.append(str(host))
+    if len(found) < count:
+        raise ValueError(f"{network} has room for {len(found)} devices, not {count}")
+    return found
+
+
+class VirtualDevice:
+    """
+    One simulated bulb or metering plug: its DPS, its listening address and
+    how badly it behaves. latency (+ up to jitter) is added before every
+    reply, loss is the chance an incoming frame is dropped unanswered, and
+    push_interval makes a plug push fresh metering every so many seconds.
+    """
+
+    def __init__(self, index, kind, ip, port=TUYA_PORT, version="3.3", latency=0.0, jitter=0.0,
+                 loss=0.0, push_interval=None, push_changes=True):
+        self.index = index
+        self.kind = kind
+        self.id = device_id(index)
+        self.key = device_key(self.id)
+        self.ip = ip
+        self.port = port
+        self.version = str(version)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.push_interval = push_interval
+        self.push_changes = push_changes
+        self.random = random.Random(self.id)
+        self.load = self.random.uniform(*LOAD_RANGE)
+        self.voltage = VOLTAGE
+        if kind == "light":
+            self.dps = dict(LIGHT_DEFAULTS)
+        else:
+            self.dps = {"1": True}
+            self.meter()
+        self.sessions = set()
+        self.server = None
+        self.connections = 0
+        self.frames = 0
+        self.replies = 0
+        self.queries = 0
+        self.controls = 0
+        self.dropped = 0
+        self.pushes = 0
+
+    @property
+    def name(self):
+        return f"Sim {self.kind} {self.index}"
+
+    def meter(self):
+        # Refresh DPS 18-20 from the plug's load; returns the ones that changed
+        self.voltage = VOLTAGE + self.random.uniform(-VOLTAGE_DRIFT, VOLTAGE_DRIFT)
+        watts = self.load * (1 + self.random.uniform(-LOAD_DRIFT, LOAD_DRIFT)) if self.dps["1"] else 0.0
+        reading = {"18": int(watts / self.voltage * 1000), "19": int(watts * 10), "20": int(self.voltage * 10)}
+        changed = {dp: value for dp, value in reading.items() if self.dps.get(dp) != value}
+        self.dps.update(reading)
+        return changed
+
+    def apply(self, dps):
+        """Apply a CONTROL's DPS; returns everything that changed, metering included."""
+        changed = {dp: value for dp, value in dps.items() if self.dps.get(dp) != value}
+        self.dps.update(changed)
+        if self.kind == "plug" and "1" in changed:
+            changed.update(self.meter())
+        return changed
+
+    def entry(self):
+        info = {"name": self.name, "id": self.id, "ip": self.ip, "key": self.key,
+                "type": self.kind, "version": self.version}
+        if self.port != TUYA_PORT:
+            info["port"] = self.port
+        return info
+
+    def beacon(self):
+        # The encrypted broadcast a real device sends on 6667 every few seconds
+        payload = json.dumps({"ip": self.ip, "gwId": self.id, "active": 2, "ability": 0, "mode": 0,
+                              "encrypt": True, "productKey": "simulator", "version": self.version}).encode()
+        payload = tinytuya.AESCipher(tinytuya.udpkey).encrypt(payload, False)
+        message = tinytuya.TuyaMessage(0, CT.UDP_NEW, 0, struct.pack(">I", 0) + payload, 0, True,
+                                       H.PREFIX_55AA_VALUE)
+        return tinytuya.pack_message(message)
+
+    def stats(self):
+        return {"clients": len(self.sessions), "connections": self.connections, "frames": self.frames,
+                "replies": self.replies, "queries": self.queries, "controls": self.controls,
+                "dropped": self.dropped, "pushes": self.pushes}
+
+
+class Session:
+    """One client connection to a VirtualDevice, speaking 3.3 or 3.4 framing."""
+
+    def __init__(self, device, reader, writer):
+        self.device = device
+        self.reader = reader
+        self.writer = writer
+        self.real_key = device.key.encode()
+        # 3.4 swaps this for the negotiated session key
+        self.key = self.real_key
+        self.local_nonce = None
+        self.remote_nonce = None
+        self.seqno = 0
+        self.write_lock = asyncio.Lock()
+
+    @property
+    def v34(self):
+        return self.device.version == "3.4"
+
+    async def read_frame(self):
+        data = await self.reader.readexactly(16)
+        header = tinytuya.parse_header(data)
+        data += await self.reader.readexactly(header.total_length - len(data))
+        message = tinytuya.unpack_message(data, hmac_key=self.key if self.v34 else None, header=header,
+                                          no_retcode=True)
+        if not message.crc_good:
+            # Wrong key (or a corrupt stream): a real device just hangs up
+            raise ValueError("bad checksum")
+        return message
+
+    def decrypt(self, message):
+        payload = message.payload
+        if not payload:
+            return b""
+        cipher = tinytuya.AESCipher(self.key)
+        if self.v34:
+            payload = cipher.decrypt(payload, False, decode_text=False)
+            if payload.startswith(self.device.version.encode()):
+                payload = payload[15:]
+            return payload
+        if payload.startswith(self.device.version.encode()):
+            payload = payload[15:]
+        return cipher.decrypt(payload, False, decode_text=False)
+
+    async def send(self, cmd, body=None, raw=None, seqno=None):
+        payload = raw if raw is not None else b""
+        if body is not None:
+            payload = json.dumps(body, separators=(",", ":")).encode()
+        header = self.device.version.encode() + H.PROTOCOL_3x_HEADER
+        if raw is None and payload:
+            cipher = tinytuya.AESCipher(self.key)
+            if self.v34:
+                if cmd not in H.NO_PROTOCOL_HEADER_CMDS:
+                    payload = header + payload
+                payload = cipher.encrypt(payload, False)
+            else:
+                payload = cipher.encrypt(payload, False)
+                if cmd == CT.STATUS:
+                    payload = header + payload
+        if seqno is None:
+            self.seqno += 1
+            seqno = self.seqno
+        # Device -> client frames carry a return code ahead of the payload
+        message = tinytuya.TuyaMessage(seqno, cmd, 0, struct.pack(">I", 0) + payload, 0, True,
+                                       H.PREFIX_55AA_VALUE)
+        frame = tinytuya.pack_message(message, hmac_key=self.key if self.v34 else None)
+        async with self.write_lock:
+            self.writer.write(frame)
+            await self.writer.drain()
+
+    def status_body(self, dps):
+        if self.v34:
+            return {"protocol": 4, "t": int(time.time()), "data": {"dps": dps}}
+        return {"devId": self.device.id, "dps": dps, "t": int(time.time())}
+
+    async def push(self, dps):
+        self.device.pushes += 1
+        await self.send(CT.STATUS, self.status_body(dps))
+
+    async def negotiate(self, message):
+        if message.cmd == CT.SESS_KEY_NEG_START:
+            self.local_nonce = self.decrypt(message)[:16]
+            self.remote_nonce = os.urandom(16)
+            proof = hmac.new(self.real_key, self.local_nonce, hashlib.sha256).digest()
+            payload = tinytuya.AESCipher(self.real_key).encrypt(self.remote_nonce + proof, False)
+            await self.send(CT.SESS_KEY_NEG_RESP, raw=payload, seqno=message.seqno)
+        elif message.cmd == CT.SESS_KEY_NEG_FINISH and self.local_nonce:
+            expected = hmac.new(self.real_key, self.remote_nonce, hashlib.sha256).digest()
+            if not hmac.compare_digest(self.decrypt(message)[:32], expected):
+                raise ValueError("session key negotiation failed")
+            mixed = bytes(a ^ b for a, b in zip(self.local_nonce, self.remote_nonce))
+            self.key = tinytuya.AESCipher(self.real_key).encrypt(mixed, False, pad=False)
+
+    async def handle(self, message):
+        device = self.device
+        if message.cmd in (CT.SESS_KEY_NEG_START, CT.SESS_KEY_NEG_FINISH):
+            await self.negotiate(message)
+            return
+        try:
+            request = json.loads(self.decrypt(message) or b"{}")
+        except ValueError:
+            request = {}
+        device.replies += 1
+        if message.cmd in QUERY_COMMANDS:
+            device.queries += 1
+            await self.send(message.cmd, self.status_body(dict(device.dps)), seqno=message.seqno)
+        elif message.cmd in CONTROL_COMMANDS:
+            device.controls += 1
+            dps = request.get("dps") or (request.get("data") or {}).get("dps") or {}
+            changed = device.apply({str(dp): value for dp, value in dps.items()})
+            # A real device acks, then pushes the result to every connected client
+            await self.send(message.cmd, seqno=message.seqno)
+            await self.push(dict(dps, **changed))
+            if device.push_changes and changed:
+                for session in list(device.sessions - {self}):
+                    await session.push(changed)
+        elif message.cmd == CT.UPDATEDPS:
+            await self.send(message.cmd, seqno=message.seqno)
+            if device.kind == "plug":
+                device.meter()
+            wanted = [str(dp) for dp in request.get("dpId", [])]
+            await self.push({dp: device.dps[dp] for dp in wanted if dp in device.dps})
+        else:
+            # HEART_BEAT and anything we don't model get an empty ack
+            await self.send(message.cmd, seqno=message.seqno)
+
+
+class Simulator:
+    """
+    Hundreds of VirtualDevices served from one asyncio loop on a daemon
+    thread. Each device listens on its own loopback address (port 6668 by
+    default), so tinytuya, the pool, the CLIs and the gateway connect to it
+    exactly as they would to hardware; entries() is the devices.json that
+    points them there.
+    """
+
+    def __init__(self, devices, beacon_port=None, beacon_interval=PUSH_INTERVAL):
+        self.devices = list(devices)
+        self.beacon_port = beacon_port
+        self.beacon_interval = beacon_interval
+        self.loop = None
+        self._thread = None
+        self._tasks = []
+
+    @classmethod
+    def create(cls, lights=0, plugs=0, network=NETWORK, port=TUYA_PORT, version="3.3",
+               beacon_port=None, beacon_interval=PUSH_INTERVAL, **options):
+        """lights + plugs devices on consecutive addresses of `network`; version may be "mixed"."""
+        ips = addresses(network, lights + plugs)
+        devices = []
+        for index, ip in enumerate(ips):
+            device_version = VERSIONS[index % len(VERSIONS)] if version == "mixed" else version
+            kind = "light" if index < lights else "plug"
+            devices.append(VirtualDevice(index, kind, ip, port, device_version, **options))
+        return cls(devices, beacon_port, beacon_interval)
+
+    async def _serve(self, device, reader, writer):
+        session = Session(device, reader, writer)
+        device.sessions.add(session)
+        device.connections += 1
+        try:
+            while True:
+                message = await session.read_frame()
+                device.frames += 1
+                if device.loss and device.random.random() < device.loss:
+                    device.dropped += 1
+                    continue
+                delay = device.latency + (device.random.uniform(0, device.jitter) if device.jitter else 0)
+                if delay:
+                    await asyncio.sleep(delay)
+                await session.handle(message)
+        except (asyncio.IncompleteReadError, ConnectionError, tinytuya.DecodeError, ValueError):
+            pass
+        finally:
+            device.sessions.discard(session)
+            writer.close()
+
+    async def _push_metering(self, device):
+        while True:
+            await asyncio.sleep(device.push_interval)
+            changed = device.meter()
+            if changed:
+                for session in list(device.sessions):
+                    try:
+                        await session.push(changed)
+                    except ConnectionError:
+                        pass
+
+    async def _beacons(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            while True:
+                for device in self.devices:
+                    sock.sendto(device.beacon(), ("127.255.255.255", self.beacon_port))
+                await asyncio.sleep(self.beacon_interval)
+
+    async def _start(self):
+        for device in self.devices:
+            device.server = await asyncio.start_server(
+                lambda reader, writer, device=device: self._serve(device, reader, writer),
+                device.ip, device.port, reuse_address=True)
+            # Port 0 picks a free port; remember which so entries() points at it
+            device.port = device.server.sockets[0].getsockname()[1]
+            if device.kind == "plug" and device.push_interval:
+                self._tasks.append(asyncio.ensure_future(self._push_metering(device)))
+        if self.beacon_port:
+            self._tasks.append(asyncio.ensure_future(self._beacons()))
+
+    async def _stop(self):
+        for device in self.devices:
+            if device.server:
+                device.server.close()
+        # Connection handlers, metering pushes and beacons: let them all unwind before the loop stops
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    def start(self):
+        if self._thread:
+            return
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="simulator", daemon=True)
+        self._thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(START_TIMEOUT)
+        except Exception:
+            self.stop()
+            raise
+
+    def stop(self):
+        if not self._thread:
+            return
+        asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result(START_TIMEOUT)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self._thread = None
+        self.loop.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def entries(self):
+        return [device.entry() for device in self.devices]
+
+    def stats(self):
+        totals = {"devices": len(self.devices)}
+        for device in self.devices:
+            for name, value in device.stats().items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
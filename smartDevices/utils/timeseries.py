@@ -0,0 +1,268 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+DB_FILE = "telemetry.db"
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 5
+MAX_BUFFER = 20000
+ROLLUP_INTERVAL = 60
+
+DAY = 86400
+# Seconds each resolution is kept for
+RETENTION = {"raw": 2 * DAY, "minute": 35 * DAY, "hour": 730 * DAY}
+# Widest query span each resolution is used for when none is asked for
+AUTO_RESOLUTION = (("raw", 6 * 3600), ("minute", 7 * DAY), ("hour", None))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    field TEXT NOT NULL,
+    UNIQUE (device, field)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    series INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (series, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS minute (
+    series INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    low REAL NOT NULL,
+    high REAL NOT NULL,
+    PRIMARY KEY (series, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS hour (
+    series INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    low REAL NOT NULL,
+    high REAL NOT NULL,
+    PRIMARY KEY (series, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class TimeSeriesStore:
+    """
+    Append-only telemetry history in SQLite.
+
+    add() only appends to a bounded in-memory buffer (the oldest samples are
+    dropped if the writer falls behind), so it is safe on the publish path.
+    A writer thread inserts the buffer in batches, rolls raw samples up into
+    per-minute and per-hour count/sum/min/max rows, and deletes each
+    resolution once it is older than its retention. Samples flushed after
+    their minute was rolled up mark it dirty, and the next rollup
+    aggregates that minute and hour again.
+
+    Raw timestamps are stored as integer milliseconds, buckets as epoch seconds.
+    """
+
+    def __init__(self, path=DB_FILE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_buffer=MAX_BUFFER, retention=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention = {**RETENTION, **(retention or {})}
+        self.buffer = deque(maxlen=max_buffer)
+        self.buffer_lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.series = {}
+        self.added = 0
+        self.written = 0
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        for series_id, device, field in self.db.execute("SELECT id, device, field FROM series"):
+            self.series[(device, field)] = series_id
+
+    # -- ingestion --
+
+    def add(self, device, fields, ts=None):
+        # Numeric fields only; strings like state/name are not history
+        ts = time.time() if ts is None else ts
+        with self.buffer_lock:
+            for field, value in fields.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    if len(self.buffer) == self.buffer.maxlen:
+                        self.dropped += 1
+                    self.buffer.append((device, field, int(ts * 1000), float(value)))
+                    self.added += 1
+
+    def _series_id(self, device, field):
+        series_id = self.series.get((device, field))
+        if series_id is None:
+            self.db.execute("INSERT OR IGNORE INTO series (device, field) VALUES (?, ?)", (device, field))
+            series_id = self.db.execute("SELECT id FROM series WHERE device = ? AND field = ?",
+                                        (device, field)).fetchone()[0]
+            self.series[(device, field)] = series_id
+        return series_id
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of samples written."""
+        with self.buffer_lock:
+            pending = list(self.buffer)
+            self.buffer.clear()
+        if not pending:
+            return 0
+
+        with self.db_lock, self.db:
+            for start in range(0, len(pending), self.batch_size):
+                rows = [(self._series_id(device, field), ts, value)
+                        for device, field, ts, value in pending[start:start + self.batch_size]]
+                self.db.executemany("INSERT OR REPLACE INTO samples (series, ts, value) VALUES (?, ?, ?)", rows)
+            # Late samples (a backed-up buffer, a clock step) land in minutes already rolled up
+            earliest = min(ts for _, _, ts, _ in pending) // 60000 * 60
+            if earliest < self._watermark("minute"):
+                dirty = self._watermark("dirty") or earliest
+                self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dirty', ?)",
+                                (min(dirty, earliest),))
+        self.written += len(pending)
+        return len(pending)
+
+    # -- rollups and retention --
+
+    def _watermark(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def rollup(self, now=None):
+        """Aggregate every minute and hour that has finished since the last rollup."""
+        now = time.time() if now is None else now
+        # Leave the current minute (and one more for samples still buffered) open
+        minute_end = int(now // 60) * 60 - 60
+        hour_end = int(now // 3600) * 3600
+
+        with self.db_lock, self.db:
+            start = self._watermark("minute")
+            dirty = self._watermark("dirty")
+            if dirty:
+                # Redo the minutes late samples went into, as far back as raw samples are still kept
+                start = min(start, max(dirty, int(now - self.retention["raw"]) // 60 * 60))
+            if minute_end > start:
+                self.db.execute("""
+                    INSERT OR REPLACE INTO minute (series, bucket, count, total, low, high)
+                    SELECT series, (ts / 60000) * 60, COUNT(*), SUM(value), MIN(value), MAX(value)
+                    FROM samples WHERE ts >= ? AND ts < ?
+                    GROUP BY series, ts / 60000
+                """, (start * 1000, minute_end * 1000))
+                self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('minute', ?)", (minute_end,))
+
+            start = self._watermark("hour")
+            if dirty:
+                start = min(start, dirty - dirty % 3600)
+            hour_end = min(hour_end, minute_end - minute_end % 3600)
+            if hour_end > start:
+                self.db.execute("""
+                    INSERT OR REPLACE INTO hour (series, bucket, count, total, low, high)
+                    SELECT series, (bucket / 3600) * 3600, SUM(count), SUM(total), MIN(low), MAX(high)
+                    FROM minute WHERE bucket >= ? AND bucket < ?
+                    GROUP BY series, bucket / 3600
+                """, (start, hour_end))
+                self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('hour', ?)", (hour_end,))
+            self.db.execute("DELETE FROM meta WHERE key = 'dirty'")
+
+    def prune(self, now=None):
+        now = time.time() if now is None else now
+        with self.db_lock, self.db:
+            # Never delete raw samples that have not been rolled up yet
+            raw_cutoff = min(now - self.retention["raw"], self._watermark("minute"))
+            self.db.execute("DELETE FROM samples WHERE ts < ?", (int(raw_cutoff * 1000),))
+            minute_cutoff = min(now - self.retention["minute"], self._watermark("hour"))
+            self.db.execute("DELETE FROM minute WHERE bucket < ?", (int(minute_cutoff),))
+            self.db.execute("DELETE FROM hour WHERE bucket < ?", (int(now - self.retention["hour"]),))
+
+    # -- queries --
+
+    def query(self, field, start, end=None, devices=None, resolution=None):
+        """
+        History of one field between two epoch times, as
+        {device: [(ts, avg, min, max), ...]} in time order. Raw samples have
+        avg == min == max. resolution is "raw", "minute" or "hour"; by default
+        the finest one that keeps a chart of the span small is used.
+        """
+        end = time.time() if end is None else end
+        if resolution is None:
+            resolution = next(name for name, span in AUTO_RESOLUTION if span is None or end - start <= span)
+
+        with self.db_lock:
+            # The writer thread adds series while flushing
+            wanted = {key: series_id for key, series_id in self.series.items()
+                      if key[1] == field and (devices is None or key[0] in devices)}
+        result = {device: [] for device, _ in wanted}
+        if not wanted:
+            return result
+        names = {series_id: device for (device, _), series_id in wanted.items()}
+        marks = ",".join("?" * len(names))
+
+        if resolution == "raw":
+            sql = (f"SELECT series, ts / 1000.0, value, value, value FROM samples "
+                   f"WHERE series IN ({marks}) AND ts >= ? AND ts < ? ORDER BY series, ts")
+            params = (*names, int(start * 1000), int(end * 1000))
+        else:
+            sql = (f"SELECT series, bucket, total / count, low, high FROM {resolution} "
+                   f"WHERE series IN ({marks}) AND bucket >= ? AND bucket < ? ORDER BY series, bucket")
+            params = (*names, int(start), int(end))
+
+        with self.db_lock:
+            for series_id, ts, avg, low, high in self.db.execute(sql, params):
+                result[names[series_id]].append((ts, avg, low, high))
+        return result
+
+    # -- background writer --
+
+    def start(self):
+        if self._thread:
+            return
+
+        def run():
+            last_rollup = 0.0
+            while not self._stop.wait(self.flush_interval):
+                try:
+                    self.flush()
+                    if time.monotonic() - last_rollup >= ROLLUP_INTERVAL:
+                        last_rollup = time.monotonic()
+                        self.rollup()
+                        self.prune()
+                except sqlite3.Error as error:
+                    log.error("history write failed: %s", error)
+
+        self._thread = threading.Thread(target=run, name="timeseries", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self.rollup()
+        with self.db_lock:
+            self.db.close()
+
+    def stats(self):
+        return {
+            "added": self.added,
+            "written": self.written,
+            "dropped": self.dropped,
+            "buffered": len(self.buffer),
+            "series": len(self.series),
+        }